@@ -10,8 +10,71 @@ class ReportAgedPartnerBalance(models.AbstractModel):
     _name = 'report.accounting_pdf_reports.report_agedpartnerbalance'
     _description = 'Aged Partner Balance Report'
 
+    def _get_aged_lines_query(self, periods, params):
+        """
+        Build the query computing, for each open move line, its residual amount at date_from
+        converted in the currency of the user and the period it falls in.
+        The residual is the balance of the line plus the partial reconciliations made up to
+        date_from, both converted at the rate of the report date. The period is 6 for the
+        amounts not due yet and i + 1 for the period i.
+        :param periods: the periods computed by _get_partner_move_lines
+        :param params: dictionary of the query parameters, completed with the period bounds
+        :return: the query, returning the columns id, partner_id, period and amount
+        """
+        period_cases = []
+        for i in range(5)[::-1]:
+            if periods[str(i)]['start']:
+                params['period_start_%s' % i] = periods[str(i)]['start']
+                period_cases.append(
+                    'WHEN COALESCE(l.date_maturity, l.date) >= %%(period_start_%s)s THEN %s' % (i, i + 1))
+        return '''
+            WITH currency_rate AS (
+                -- factor converting an amount of each currency in the currency of the user
+                SELECT c.id AS currency_id, user_rate.rate / COALESCE((
+                    SELECT r.rate FROM res_currency_rate r
+                    WHERE r.currency_id = c.id AND r.name <= %(date)s
+                        AND (r.company_id IS NULL OR r.company_id = %(company_id)s)
+                    ORDER BY r.company_id, r.name DESC LIMIT 1), 1.0) AS factor
+                FROM res_currency c, (
+                    SELECT COALESCE((
+                        SELECT r.rate FROM res_currency_rate r
+                        WHERE r.currency_id = %(user_currency_id)s AND r.name <= %(date)s
+                            AND (r.company_id IS NULL OR r.company_id = %(company_id)s)
+                        ORDER BY r.company_id, r.name DESC LIMIT 1), 1.0) AS rate
+                ) user_rate
+            ),
+            aged_lines AS (
+                SELECT l.id, l.partner_id,
+                    CASE WHEN COALESCE(l.date_maturity, l.date) >= %(date_from)s THEN 6
+                        ''' + ' '.join(period_cases) + '''
+                        ELSE 1 END AS period,
+                    l.balance * line_rate.factor + COALESCE(partial.amount, 0) AS amount
+                FROM account_move_line AS l
+                JOIN account_move am ON am.id = l.move_id
+                JOIN account_account ON account_account.id = l.account_id
+                JOIN res_company line_company ON line_company.id = l.company_id
+                JOIN currency_rate line_rate ON line_rate.currency_id = line_company.currency_id
+                LEFT JOIN LATERAL (
+                    SELECT SUM(CASE WHEN p.credit_move_id = l.id THEN p.amount ELSE -p.amount END
+                               * partial_rate.factor) AS amount
+                    FROM account_partial_reconcile p
+                    JOIN res_company partial_company ON partial_company.id = p.company_id
+                    JOIN currency_rate partial_rate ON partial_rate.currency_id = partial_company.currency_id
+                    WHERE (p.credit_move_id = l.id OR p.debit_move_id = l.id)
+                        AND p.max_date <= %(date_from)s
+                ) partial ON TRUE
+                WHERE am.state = ANY(%(move_state)s)
+                    AND account_account.account_type = ANY(%(account_type)s)
+                    AND (l.partner_id = ANY(%(partner_ids)s) OR l.partner_id IS NULL)
+                    AND l.date <= %(date_from)s
+                    AND l.company_id = ANY(%(company_ids)s)
+            )
+            SELECT id, partner_id, period, amount
+            FROM aged_lines
+            WHERE ROUND(amount / %(rounding)s) != 0'''
+
     def _get_partner_move_lines(self, account_type, partner_ids,
-                                date_from, target_move, period_length):
+                                date_from, target_move, period_length, detail=False):
         # This method can receive the context key 'include_nullified_amount' {Boolean}
         # Do an invoice and a payment and unreconcile. The amount will be nullified
         # By default, the partner wouldn't appear in this report.
@@ -23,6 +86,8 @@ class ReportAgedPartnerBalance(models.AbstractModel):
         # 61 - 90  : 2018-12-09 - 2018-11-10
         # 91 - 120 : 2018-11-09 - 2018-10-11
         # +120     : 2018-10-10
+        # The residual amounts and the periods are computed by the database, only the totals
+        # per partner and period are fetched, along with the move lines when detail is set.
         periods = {}
         start = datetime.strptime(str(date_from), "%Y-%m-%d")
         date_from = datetime.strptime(str(date_from), "%Y-%m-%d").date()
@@ -51,17 +116,7 @@ class ReportAgedPartnerBalance(models.AbstractModel):
 
         if target_move == 'posted':
             move_state = ['posted']
-        arg_list = (tuple(move_state), tuple(account_type))
 
-        reconciliation_clause = '(l.reconciled IS FALSE)'
-        cr.execute('SELECT debit_move_id, credit_move_id FROM account_partial_reconcile where max_date > %s', (date_from,))
-        reconciled_after_date = []
-        for row in cr.fetchall():
-            reconciled_after_date += [row[0], row[1]]
-        if reconciled_after_date:
-            reconciliation_clause = '(l.reconciled IS FALSE OR l.id IN %s)'
-            arg_list += (tuple(reconciled_after_date),)
-        arg_list += (date_from, tuple(company_ids))
         query = '''
             SELECT DISTINCT l.partner_id, UPPER(res_partner.name)
             FROM account_move_line AS l left join res_partner on l.partner_id = res_partner.id, account_account, account_move am
@@ -69,11 +124,13 @@ class ReportAgedPartnerBalance(models.AbstractModel):
                 AND (l.move_id = am.id)
                 AND (am.state IN %s)
                 AND (account_account.account_type IN %s)
-                AND ''' + reconciliation_clause + '''
+                AND (l.reconciled IS FALSE OR EXISTS (
+                    SELECT 1 FROM account_partial_reconcile p
+                    WHERE (p.debit_move_id = l.id OR p.credit_move_id = l.id) AND p.max_date > %s))
                 AND (l.date <= %s)
                 AND l.company_id IN %s
             ORDER BY UPPER(res_partner.name)'''
-        cr.execute(query, arg_list)
+        cr.execute(query, (tuple(move_state), tuple(account_type), date_from, date_from, tuple(company_ids)))
         partners = cr.dictfetchall()
         # put a total of 0
         for i in range(7):
@@ -86,108 +143,48 @@ class ReportAgedPartnerBalance(models.AbstractModel):
         if not partner_ids:
             return [], [], {}
 
-        # This dictionary will store the not due amount of all partners
+        params = {
+            'date': date,
+            'date_from': date_from,
+            'company_id': company.root_id.id,
+            'user_currency_id': user_currency.id,
+            'rounding': user_currency.rounding,
+            'move_state': list(move_state),
+            'account_type': list(account_type),
+            'partner_ids': list(partner_ids),
+            'company_ids': list(company_ids),
+        }
+        query = self._get_aged_lines_query(periods, params)
+        if detail:
+            cr.execute(query, params)
+            rows = cr.dictfetchall()
+            move_lines = self.env['account.move.line'].browse([row['id'] for row in rows])
+            for row, line in zip(rows, move_lines):
+                row['line'] = line
+        else:
+            cr.execute('''
+                SELECT partner_id, period, SUM(amount) AS amount
+                FROM (''' + query + ''') aged
+                GROUP BY partner_id, period''', params)
+            rows = cr.dictfetchall()
+
+        # undue_amounts stores the not due amount of all partners and history[i] the amount
+        # of the period i: history[1] = {'<partner_id>': <partner_debit-credit>}
         undue_amounts = {}
-        query = '''SELECT l.id
-                FROM account_move_line AS l, account_account, account_move am
-                WHERE (l.account_id = account_account.id) AND (l.move_id = am.id)
-                    AND (am.state IN %s)
-                    AND (account_account.account_type IN %s)
-                    AND (COALESCE(l.date_maturity,l.date) >= %s)\
-                    AND ((l.partner_id IN %s) OR (l.partner_id IS NULL))
-                AND (l.date <= %s)
-                AND l.company_id IN %s'''
-        cr.execute(query, (tuple(move_state), tuple(account_type), date_from,
-                           tuple(partner_ids), date_from, tuple(company_ids)))
-        aml_ids = cr.fetchall()
-        aml_ids = aml_ids and [x[0] for x in aml_ids] or []
-        for line in self.env['account.move.line'].browse(aml_ids):
-            partner_id = line.partner_id.id or False
-            if partner_id not in undue_amounts:
-                undue_amounts[partner_id] = 0.0
-            line_amount = line.company_id.currency_id._convert(line.balance,
-                                                               user_currency,
-                                                               company, date)
-            if user_currency.is_zero(line_amount):
-                continue
-            for partial_line in line.matched_debit_ids:
-                if partial_line.max_date <= date_from:
-                    line_currency = partial_line.company_id.currency_id
-                    line_amount += line_currency._convert(partial_line.amount,
-                                                          user_currency,
-                                                          company, date)
-            for partial_line in line.matched_credit_ids:
-                if partial_line.max_date <= date_from:
-                    line_currency = partial_line.company_id.currency_id
-                    line_amount -= line_currency._convert(partial_line.amount,
-                                                          user_currency,
-                                                          company, date)
-            if not self.env.user.company_id.currency_id.is_zero(line_amount):
-                undue_amounts[partner_id] += line_amount
+        history = [{} for i in range(5)]
+        partners_with_lines = set()
+        for row in rows:
+            partner_id = row['partner_id'] or False
+            amounts = undue_amounts if row['period'] == 6 else history[row['period'] - 1]
+            amounts[partner_id] = amounts.get(partner_id, 0.0) + float(row['amount'])
+            partners_with_lines.add(partner_id)
+            if detail and partner_id in lines:
                 lines[partner_id].append({
-                    'line': line,
-                    'amount': line_amount,
-                    'period': 6,
+                    'line': row['line'],
+                    'amount': float(row['amount']),
+                    'period': row['period'],
                 })
 
-        # Use one query per period and store results in history (a list variable)
-        # Each history will contain: history[1] = {'<partner_id>': <partner_debit-credit>}
-        history = []
-        for i in range(5):
-            args_list = (tuple(move_state), tuple(account_type), tuple(partner_ids),)
-            dates_query = '(COALESCE(l.date_maturity,l.date)'
-
-            if periods[str(i)]['start'] and periods[str(i)]['stop']:
-                dates_query += ' BETWEEN %s AND %s)'
-                args_list += (periods[str(i)]['start'], periods[str(i)]['stop'])
-            elif periods[str(i)]['start']:
-                dates_query += ' >= %s)'
-                args_list += (periods[str(i)]['start'],)
-            else:
-                dates_query += ' <= %s)'
-                args_list += (periods[str(i)]['stop'],)
-            args_list += (date_from, tuple(company_ids))
-
-            query = '''SELECT l.id
-                    FROM account_move_line AS l, account_account, account_move am
-                    WHERE (l.account_id = account_account.id) AND (l.move_id = am.id)
-                        AND (am.state IN %s)
-                        AND (account_account.account_type IN %s)
-                        AND ((l.partner_id IN %s) OR (l.partner_id IS NULL))
-                        AND ''' + dates_query + '''
-                    AND (l.date <= %s)
-                    AND l.company_id IN %s'''
-            cr.execute(query, args_list)
-            partners_amount = {}
-            aml_ids = cr.fetchall()
-            aml_ids = aml_ids and [x[0] for x in aml_ids] or []
-            for line in self.env['account.move.line'].browse(aml_ids):
-                partner_id = line.partner_id.id or False
-                if partner_id not in partners_amount:
-                    partners_amount[partner_id] = 0.0
-                line_currency_id = line.company_id.currency_id
-                line_amount = line_currency_id._convert(line.balance, user_currency, company, date)
-                if user_currency.is_zero(line_amount):
-                    continue
-                for partial_line in line.matched_debit_ids:
-                    if partial_line.max_date <= date_from:
-                        line_currency_id = partial_line.company_id.currency_id
-                        line_amount += line_currency_id._convert(
-                            partial_line.amount, user_currency, company, date)
-                for partial_line in line.matched_credit_ids:
-                    if partial_line.max_date <= date_from:
-                        line_currency_id = partial_line.company_id.currency_id
-                        line_amount -= line_currency_id._convert(
-                            partial_line.amount, user_currency, company, date)
-                if not self.env.user.company_id.currency_id.is_zero(line_amount):
-                    partners_amount[partner_id] += line_amount
-                    lines[partner_id].append({
-                        'line': line,
-                        'amount': line_amount,
-                        'period': i + 1,
-                        })
-            history.append(partners_amount)
-
         for partner in partners:
             if partner['partner_id'] is None:
                 partner['partner_id'] = False
@@ -226,7 +223,7 @@ class ReportAgedPartnerBalance(models.AbstractModel):
                 values['name'] = _('Unknown Partner')
                 values['trust'] = False
 
-            if at_least_one_amount or (self._context.get('include_nullified_amount') and lines[partner['partner_id']]):
+            if at_least_one_amount or (self._context.get('include_nullified_amount') and partner['partner_id'] in partners_with_lines):
                 res.append(values)
 
         return res, total, lines
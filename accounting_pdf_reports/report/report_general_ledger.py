@@ -2,11 +2,34 @@ import time
 from odoo import api, models, _
 from odoo.exceptions import UserError
 
+GL_ACCOUNT_CHUNK_SIZE = 100
+
 
 class ReportGeneralLedger(models.AbstractModel):
     _name = 'report.accounting_pdf_reports.report_general_ledger'
     _description = 'General Ledger Report'
 
+    def _get_move_line_filters(self, analytic_account_ids, partner_ids, initial_bal=False):
+        """
+        Returns the WHERE filters of the move lines selected in the wizard and their
+        params, with the tables aliased l for the move lines and m for the moves
+        """
+        context = dict(self.env.context)
+        if initial_bal:
+            context['date_to'] = False
+            context['initial_bal'] = True
+        if analytic_account_ids:
+            context['analytic_account_ids'] = analytic_account_ids
+        if partner_ids:
+            context['partner_ids'] = partner_ids
+        tables, where_clause, where_params = self.env['account.move.line'].with_context(context)._query_get()
+        wheres = [""]
+        if where_clause.strip():
+            wheres.append(where_clause.strip())
+        filters = " AND ".join(wheres)
+        filters = filters.replace('account_move_line__move_id', 'm').replace('account_move_line', 'l')
+        return filters, tuple(where_params)
+
     def _get_account_move_entry(self, accounts, analytic_account_ids,
                                 partner_ids, init_balance,
                                 sortby, display_account):
@@ -18,7 +41,7 @@ class ReportGeneralLedger(models.AbstractModel):
                 sortby: sorting by date or partner and journal
                 display_account: type of account(receivable, payable and both)
 
-        Returns a dictionary of accounts with following key and value {
+        Returns a list of dictionaries of accounts with following key and value {
                 'code': account code,
                 'name': account name,
                 'debit': sum of total debit amount,
@@ -28,26 +51,25 @@ class ReportGeneralLedger(models.AbstractModel):
                 'move_lines': list of move line
         }
         """
+        return list(self._iter_account_move_entry(
+            accounts, analytic_account_ids, partner_ids, init_balance, sortby, display_account))
+
+    def _iter_account_move_entry(self, accounts, analytic_account_ids,
+                                 partner_ids, init_balance,
+                                 sortby, display_account):
+        """
+        Generator version of _get_account_move_entry. The totals of every account are
+        computed first by grouped queries, then the move lines are fetched and yielded
+        GL_ACCOUNT_CHUNK_SIZE accounts at a time, so only the lines of one chunk are
+        held in memory while the report is rendered. The running balance of each line
+        is computed by PostgreSQL with a window function.
+        """
         cr = self.env.cr
-        MoveLine = self.env['account.move.line']
-        move_lines = {x: [] for x in accounts.ids}
+        init_lines = {}
 
         # Prepare initial sql query and Get the initial move lines
         if init_balance:
-            context = dict(self.env.context)
-            context['date_from'] = self.env.context.get('date_from')
-            context['date_to'] = False
-            context['initial_bal'] = True
-            if analytic_account_ids:
-                context['analytic_account_ids'] = analytic_account_ids
-            if partner_ids:
-                context['partner_ids'] = partner_ids
-            init_tables, init_where_clause, init_where_params = MoveLine.with_context(context)._query_get()
-            init_wheres = [""]
-            if init_where_clause.strip():
-                init_wheres.append(init_where_clause.strip())
-            init_filters = " AND ".join(init_wheres)
-            filters = init_filters.replace('account_move_line__move_id', 'm').replace('account_move_line', 'l')
+            filters, where_params = self._get_move_line_filters(analytic_account_ids, partner_ids, initial_bal=True)
             sql = ("""SELECT 0 AS lid, l.account_id AS account_id, '' AS ldate,
                 '' AS lcode, 0.0 AS amount_currency, 
                 '' AS analytic_account_id, '' AS lref, 
@@ -65,75 +87,82 @@ class ReportGeneralLedger(models.AbstractModel):
                 LEFT JOIN res_partner p ON (l.partner_id=p.id)\
                 JOIN account_journal j ON (l.journal_id=j.id)\
                 WHERE l.account_id IN %s""" + filters + ' GROUP BY l.account_id')
-            params = (tuple(accounts.ids),) + tuple(init_where_params)
+            params = (tuple(accounts.ids),) + where_params
             cr.execute(sql, params)
             for row in cr.dictfetchall():
-                move_lines[row.pop('account_id')].append(row)
+                init_lines[row.pop('account_id')] = row
 
         sql_sort = 'l.date, l.move_id'
         if sortby == 'sort_journal_partner':
             sql_sort = 'j.code, p.name, l.move_id'
 
         # Prepare sql query base on selected parameters from wizard
-        context = dict(self.env.context)
-        if analytic_account_ids:
-            context['analytic_account_ids'] = analytic_account_ids
-        if partner_ids:
-            context['partner_ids'] = partner_ids
-        tables, where_clause, where_params = MoveLine.with_context(context)._query_get()
-        wheres = [""]
-        if where_clause.strip():
-            wheres.append(where_clause.strip())
-        filters = " AND ".join(wheres)
-        filters = filters.replace('account_move_line__move_id', 'm').replace('account_move_line', 'l')
-
-        # Get move lines base on sql query and Calculate the total balance of move lines
-        sql = ('''SELECT l.id AS lid, l.account_id AS account_id, 
-            l.date AS ldate, j.code AS lcode, l.currency_id, 
-            l.amount_currency, '' AS analytic_account_id,
-            l.ref AS lref, l.name AS lname, COALESCE(l.debit,0) AS debit, 
-            COALESCE(l.credit,0) AS credit, 
-            COALESCE(SUM(l.debit),0) - COALESCE(SUM(l.credit), 0) AS balance,\
-            m.name AS move_name, c.symbol AS currency_code, 
-            p.name AS partner_name\
-            FROM account_move_line l\
+        filters, where_params = self._get_move_line_filters(analytic_account_ids, partner_ids)
+        sql_from = '''FROM account_move_line l\
             JOIN account_move m ON (l.move_id=m.id)\
             LEFT JOIN res_currency c ON (l.currency_id=c.id)\
             LEFT JOIN res_partner p ON (l.partner_id=p.id)\
             JOIN account_journal j ON (l.journal_id=j.id)\
             JOIN account_account acc ON (l.account_id = acc.id) \
-            WHERE l.account_id IN %s ''' + filters + ''' GROUP BY l.id, 
-            l.account_id, l.date, j.code, l.currency_id, l.amount_currency, 
-            l.ref, l.name, m.name, c.symbol, p.name ORDER BY ''' + sql_sort)
-        params = (tuple(accounts.ids),) + tuple(where_params)
-        cr.execute(sql, params)
+            WHERE l.account_id IN %s ''' + filters
 
-        for row in cr.dictfetchall():
-            balance = 0
-            for line in move_lines.get(row['account_id']):
-                balance += line['debit'] - line['credit']
-            row['balance'] += balance
-            move_lines[row.pop('account_id')].append(row)
+        # Calculate the debit, credit and balance of the move lines of each account
+        sql = ('''SELECT l.account_id AS account_id, COUNT(*) AS count,
+            COALESCE(SUM(l.debit),0) AS debit, COALESCE(SUM(l.credit),0) AS credit ''' +
+               sql_from + ' GROUP BY l.account_id')
+        cr.execute(sql, (tuple(accounts.ids),) + where_params)
+        period_totals = {row.pop('account_id'): row for row in cr.dictfetchall()}
 
         # Calculate the debit, credit and balance for Accounts
         account_res = []
         for account in accounts:
             currency = account.currency_id and account.currency_id or account.company_id.currency_id
+            init_line = init_lines.get(account.id)
+            period = period_totals.get(account.id)
             res = dict((fn, 0.0) for fn in ['credit', 'debit', 'balance'])
+            res['id'] = account.id
             res['code'] = account.code
             res['name'] = account.name
-            res['move_lines'] = move_lines[account.id]
-            for line in res.get('move_lines'):
-                res['debit'] += line['debit']
-                res['credit'] += line['credit']
-                res['balance'] = line['balance']
+            for line in (init_line, period):
+                if line:
+                    res['debit'] += line['debit']
+                    res['credit'] += line['credit']
+                    res['balance'] += line['debit'] - line['credit']
             if display_account == 'all':
                 account_res.append(res)
-            if display_account == 'movement' and res.get('move_lines'):
+            if display_account == 'movement' and (init_line or period):
                 account_res.append(res)
             if display_account == 'not_zero' and not currency.is_zero(res['balance']):
                 account_res.append(res)
-        return account_res
+
+        # Get move lines base on sql query, the balance is the running balance of the account
+        sql = ('''SELECT l.id AS lid, l.account_id AS account_id, 
+            l.date AS ldate, j.code AS lcode, l.currency_id, 
+            l.amount_currency, '' AS analytic_account_id,
+            l.ref AS lref, l.name AS lname, COALESCE(l.debit,0) AS debit, 
+            COALESCE(l.credit,0) AS credit, 
+            SUM(COALESCE(l.debit,0) - COALESCE(l.credit,0)) OVER (
+                PARTITION BY l.account_id ORDER BY ''' + sql_sort + ''', l.id
+                ROWS UNBOUNDED PRECEDING) AS balance,\
+            m.name AS move_name, c.symbol AS currency_code, 
+            p.name AS partner_name ''' + sql_from + '''
+            ORDER BY l.account_id, ''' + sql_sort + ', l.id')
+        for index in range(0, len(account_res), GL_ACCOUNT_CHUNK_SIZE):
+            chunk = account_res[index:index + GL_ACCOUNT_CHUNK_SIZE]
+            move_lines = {}
+            for res in chunk:
+                move_lines[res['id']] = [init_lines[res['id']]] if res['id'] in init_lines else []
+            account_ids = tuple(res['id'] for res in chunk if period_totals.get(res['id']))
+            if account_ids:
+                cr.execute(sql, (account_ids,) + where_params)
+                for row in cr.dictfetchall():
+                    init_line = init_lines.get(row['account_id'])
+                    if init_line:
+                        row['balance'] += init_line['balance']
+                    move_lines[row.pop('account_id')].append(row)
+            for res in chunk:
+                res['move_lines'] = move_lines.pop(res['id'])
+                yield res
 
     @api.model
     def _get_report_values(self, docids, data=None):
@@ -165,7 +194,7 @@ class ReportGeneralLedger(models.AbstractModel):
                 domain.append(('id', 'in', data['form']['account_ids']))
             accounts = self.env['account.account'].search(domain)
         accounts_res = self.with_context(
-            data['form'].get('used_context', {}))._get_account_move_entry(
+            data['form'].get('used_context', {}))._iter_account_move_entry(
             accounts,
             analytic_account_ids,
             partner_ids,
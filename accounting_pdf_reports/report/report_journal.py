@@ -90,6 +90,106 @@ class ReportJournal(models.AbstractModel):
                 res[tax]['tax_amount'] = res[tax]['tax_amount'] * -1
         return res
 
+    def _get_journal_audit_data(self, data, journal_ids):
+        """
+        Fetch everything printed by the journal audit as plain values: one ordered query
+        per journal for the move lines and a single grouped query for the totals and the
+        taxes of all the journals.
+        Returns a dictionary {journal_id: {
+                'lines': list of dict with the id and the displayed columns of the move lines,
+                'debit': sum of debit,
+                'credit': sum of credit,
+                'taxes': list of dict {'name', 'base_amount', 'tax_amount'},
+        }}
+        """
+        move_state = ['draft', 'posted']
+        if data['form'].get('target_move', 'all') == 'posted':
+            move_state = ['posted']
+        sort_selection = data['form'].get('sort_selection', 'date')
+        currency = self.env['res.currency']
+        query_get_clause = self._get_query_get_clause(data)
+
+        res = {}
+        for journal_id in journal_ids:
+            res[journal_id] = {'lines': [], 'debit': 0.0, 'credit': 0.0, 'taxes': []}
+            params = [tuple(move_state), journal_id] + query_get_clause[2]
+            query = """
+                SELECT "account_move_line".id, CASE WHEN am.name != '/' THEN am.name ELSE '*' || am.id END AS move_name,
+                    "account_move_line".date, acc.code AS account_code, p.name AS partner_name,
+                    "account_move_line".name, "account_move_line".debit, "account_move_line".credit,
+                    "account_move_line".amount_currency, "account_move_line".currency_id
+                FROM """ + query_get_clause[0] + """
+                JOIN account_move am ON "account_move_line".move_id = am.id
+                JOIN account_account acc ON "account_move_line".account_id = acc.id
+                LEFT JOIN res_partner p ON "account_move_line".partner_id = p.id
+                WHERE am.state IN %s
+                    AND "account_move_line".journal_id = %s
+                    AND """ + query_get_clause[1] + """
+                ORDER BY """
+            if sort_selection == 'date':
+                query += '"account_move_line".date'
+            else:
+                query += 'am.name'
+            query += ', "account_move_line".move_id, acc.code'
+            self.env.cr.execute(query, tuple(params))
+            for row in self.env.cr.dictfetchall():
+                row['currency_id'] = currency.browse(row['currency_id'])
+                res[journal_id]['lines'].append(row)
+
+        if not journal_ids:
+            return res
+        params = [tuple(move_state), tuple(journal_ids)] + query_get_clause[2]
+        self.env.cr.execute("""
+            WITH audit_lines AS (
+                SELECT "account_move_line".id, "account_move_line".journal_id,
+                    "account_move_line".debit, "account_move_line".credit,
+                    "account_move_line".balance, "account_move_line".tax_line_id
+                FROM """ + query_get_clause[0] + """
+                JOIN account_move am ON "account_move_line".move_id = am.id
+                WHERE am.state IN %s
+                    AND "account_move_line".journal_id IN %s
+                    AND """ + query_get_clause[1] + """
+            )
+            SELECT journal_id, NULL AS tax_id, SUM(debit) AS debit, SUM(credit) AS credit,
+                NULL AS base_amount, NULL AS tax_amount
+            FROM audit_lines
+            GROUP BY journal_id
+            UNION ALL
+            SELECT l.journal_id, rel.account_tax_id, NULL, NULL, SUM(l.balance), NULL
+            FROM audit_lines l
+            JOIN account_move_line_account_tax_rel rel ON rel.account_move_line_id = l.id
+            GROUP BY l.journal_id, rel.account_tax_id
+            UNION ALL
+            SELECT journal_id, tax_line_id, NULL, NULL, NULL, SUM(debit - credit)
+            FROM audit_lines
+            WHERE tax_line_id IS NOT NULL
+            GROUP BY journal_id, tax_line_id""", tuple(params))
+        base_amounts = {}
+        tax_amounts = {}
+        for row in self.env.cr.dictfetchall():
+            if row['tax_id'] is None:
+                res[row['journal_id']]['debit'] = row['debit'] or 0.0
+                res[row['journal_id']]['credit'] = row['credit'] or 0.0
+            elif row['base_amount'] is not None:
+                base_amounts[(row['journal_id'], row['tax_id'])] = row['base_amount']
+            else:
+                tax_amounts[(row['journal_id'], row['tax_id'])] = row['tax_amount'] or 0.0
+
+        taxes = self.env['account.tax'].browse(sorted({tax_id for dummy, tax_id in base_amounts}))
+        journals = self.env['account.journal'].browse(journal_ids)
+        for journal in journals:
+            # sales operation are credits
+            sign = -1 if journal.type == 'sale' else 1
+            for tax in taxes:
+                if (journal.id, tax.id) not in base_amounts:
+                    continue
+                res[journal.id]['taxes'].append({
+                    'name': tax.name,
+                    'base_amount': base_amounts[(journal.id, tax.id)] * sign,
+                    'tax_amount': tax_amounts.get((journal.id, tax.id), 0.0) * sign,
+                })
+        return res
+
     def _get_query_get_clause(self, data):
         return self.env['account.move.line'].with_context(data['form'].get('used_context', {}))._query_get()
 
@@ -98,19 +198,21 @@ class ReportJournal(models.AbstractModel):
         if not data.get('form'):
             raise UserError(_("Form content is missing, this report cannot be printed."))
 
-        target_move = data['form'].get('target_move', 'all')
-        sort_selection = data['form'].get('sort_selection', 'date')
-
+        journal_data = self._get_journal_audit_data(data, data['form']['journal_ids'])
+        # move lines per journal, kept for the templates inheriting the former layout,
+        # browsed from the ids already fetched for the audit
         res = {}
-        for journal in data['form']['journal_ids']:
-            res[journal] = self.with_context(data['form'].get('used_context', {})).lines(target_move, journal, sort_selection, data)
+        for journal_id, values in journal_data.items():
+            res[journal_id] = self.env['account.move.line'].browse([line['id'] for line in values['lines']])
         return {
             'doc_ids': data['form']['journal_ids'],
             'doc_model': self.env['account.journal'],
             'data': data,
             'docs': self.env['account.journal'].browse(data['form']['journal_ids']),
             'time': time,
+            'journal_data': journal_data,
             'lines': res,
+            'get_lines': self.lines,
             'sum_credit': self._sum_credit,
             'sum_debit': self._sum_debit,
             'get_taxes': self._get_taxes,
@@ -65,6 +65,53 @@ class ReportPartnerLedger(models.AbstractModel):
             result = contemp[0] or 0.0
         return result
 
+    def _get_partner_data(self, data, partner_ids):
+        """
+        Fetch the move lines of all the partners in one ordered query and group them
+        by partner, so the template does not query the database for each partner.
+        Returns a dictionary {partner_id: {
+                'lines': list of move lines, as returned by _lines,
+                'debit': sum of debit,
+                'credit': sum of credit,
+                'debit - credit': balance,
+        }}
+        """
+        partner_data = {
+            partner_id: {'lines': [], 'debit': 0.0, 'credit': 0.0, 'debit - credit': 0.0}
+            for partner_id in partner_ids
+        }
+        if not partner_ids:
+            return partner_data
+        currency = self.env['res.currency']
+        query_get_data = self.env['account.move.line'].with_context(data['form'].get('used_context', {}))._query_get()
+        reconcile_clause = "" if data['form']['reconciled'] else ' AND "account_move_line".full_reconcile_id IS NULL '
+        params = [tuple(partner_ids), tuple(data['computed']['move_state']), tuple(data['computed']['account_ids'])] + query_get_data[2]
+        query = """
+            SELECT "account_move_line".id, "account_move_line".partner_id, "account_move_line".date, j.code, acc.code as a_code, acc.name as a_name, "account_move_line".ref, m.name as move_name, "account_move_line".name, "account_move_line".debit, "account_move_line".credit, "account_move_line".amount_currency,"account_move_line".currency_id, c.symbol AS currency_code
+            FROM """ + query_get_data[0] + """
+            LEFT JOIN account_journal j ON ("account_move_line".journal_id = j.id)
+            LEFT JOIN account_account acc ON ("account_move_line".account_id = acc.id)
+            LEFT JOIN res_currency c ON ("account_move_line".currency_id=c.id)
+            LEFT JOIN account_move m ON (m.id="account_move_line".move_id)
+            WHERE "account_move_line".partner_id IN %s
+                AND m.state IN %s
+                AND "account_move_line".account_id IN %s AND """ + query_get_data[1] + reconcile_clause + """
+                ORDER BY "account_move_line".partner_id, "account_move_line".date, "account_move_line".id"""
+        self.env.cr.execute(query, tuple(params))
+        for r in self.env.cr.dictfetchall():
+            partner = partner_data[r.pop('partner_id')]
+            r['displayed_name'] = '-'.join(
+                r[field_name] for field_name in ('move_name', 'ref', 'name')
+                if r[field_name] not in (None, '', '/')
+            )
+            partner['debit'] += r['debit']
+            partner['credit'] += r['credit']
+            partner['debit - credit'] += r['debit'] - r['credit']
+            r['progress'] = partner['debit - credit']
+            r['currency_id'] = currency.browse(r.get('currency_id'))
+            partner['lines'].append(r)
+        return partner_data
+
     @api.model
     def _get_report_values(self, docids, data=None):
         if not data.get('form'):
@@ -109,7 +156,7 @@ class ReportPartnerLedger(models.AbstractModel):
             partner_ids = [res['partner_id'] for res in
                            self.env.cr.dictfetchall()]
         partners = obj_partner.browse(partner_ids)
-        partners = sorted(partners, key=lambda x: (x.ref or '', x.name or ''))
+        partners = partners.sorted(key=lambda x: (x.ref or '', x.name or ''))
 
         return {
             'doc_ids': partner_ids,
@@ -119,4 +166,5 @@ class ReportPartnerLedger(models.AbstractModel):
             'time': time,
             'lines': self._lines,
             'sum_partner': self._sum_partner,
+            'partner_data': self._get_partner_data(data, partners.ids),
         }
@@ -54,7 +54,7 @@
     'auto_install': True,
 
     'data': ['security/ir.model.access.csv', 'data/ks_dfr_account_data.xml', 'data/ks_dynamic_financial_report.xml',
-             'security/ks_access_file.xml',
+             'security/ks_access_file.xml', 'security/ks_dfr_export_security.xml', 'data/ks_dfr_export_cron.xml',
              'views/ks_mail_template.xml', 'views/ks_searchtemplate.xml', 'views/ks_base_template.xml',
              'views/ks_dfr_account_type.xml',
              'views/ks_res_config_settings.xml'],
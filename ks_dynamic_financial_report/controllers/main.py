@@ -2,11 +2,14 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
 from odoo import http
-from odoo.http import content_disposition, request
+from odoo.http import content_disposition, request, Response
 from odoo.http import serialize_exception as _serialize_exception
 from odoo.tools import html_escape
 
 import json
+import os
+
+from werkzeug.wsgi import wrap_file
 
 
 class ksDynamicFinancialReportController(http.Controller):
@@ -25,31 +28,21 @@ class ksDynamicFinancialReportController(http.Controller):
         ks_dynamic_report_name = ks_dynamic_report_instance.report_name if ks_dynamic_report_instance.report_name else ks_dynamic_report_instance.display_name
         try:
             if output_format == 'xlsx':
-                # self.ks_df_report_account_report_ids = self
-                # if self.id == self.env.ref('ks_dynamic_financial_reports.ks_df_tb0').id:
-                response = request.make_response(
-                    None,
+                # the workbook is sent in chunks from its file instead of being loaded in memory,
+                # the ledgers being built in a temporary file
+                ks_file = ks_dynamic_report_instance.ks_get_xlsx_file(ks_df_informations)
+                ks_file.seek(0, os.SEEK_END)
+                ks_file_size = ks_file.tell()
+                ks_file.seek(0)
+                response = Response(
+                    wrap_file(request.httprequest.environ, ks_file),
                     headers=[
                         ('Content-Type', ks_dynamic_report_model.ks_get_export_plotting_type('xlsx')),
-                        ('Content-Disposition', content_disposition(ks_dynamic_report_name + '.xlsx'))
-                    ]
+                        ('Content-Disposition', content_disposition(ks_dynamic_report_name + '.xlsx')),
+                        ('Content-Length', ks_file_size),
+                    ],
+                    direct_passthrough=True,
                 )
-                if ks_dynamic_report_name == 'Trial Balance':
-                    response.stream.write(ks_dynamic_report_instance.ks_get_xlsx_trial_balance(ks_df_informations))
-                elif ks_dynamic_report_name == 'General Ledger':
-                    response.stream.write(ks_dynamic_report_instance.ks_get_xlsx_general_ledger(ks_df_informations))
-                elif ks_dynamic_report_name == 'Partner Ledger':
-                    response.stream.write(ks_dynamic_report_instance.ks_get_xlsx_partner_ledger(ks_df_informations))
-                elif ks_dynamic_report_name == 'Age Receivable':
-                    response.stream.write(ks_dynamic_report_instance.ks_get_xlsx_Aging(ks_df_informations))
-                elif ks_dynamic_report_name == 'Age Payable':
-                    response.stream.write(ks_dynamic_report_instance.ks_get_xlsx_Aging(ks_df_informations))
-                elif ks_dynamic_report_name == 'Tax Report':
-                    response.stream.write(ks_dynamic_report_instance.ks_dynamic_tax_xlsx(ks_df_informations))
-                elif ks_dynamic_report_name == 'Consolidate Journal':
-                    response.stream.write(ks_dynamic_report_instance.ks_dynamic_consolidate_xlsx(ks_df_informations))
-                else:
-                    response.stream.write(ks_dynamic_report_instance.get_xlsx(ks_df_informations))
             return response
         except Exception as e:
             se = _serialize_exception(e)
@@ -6,4 +6,7 @@ from . import ir_action
 from . import ks_dynamic_financial_reports
 from . import ks_res_config_settings
 from . import ks_account_move_line
-from . import ks_dfr_account_type
\ No newline at end of file
+from . import ks_dfr_account_type
+from . import ks_dfr_balance_snapshot
+from . import ks_dfr_export
+from . import ks_dfr_report_cache
@@ -1,8 +1,83 @@
+from collections import defaultdict
+from contextlib import contextmanager
+
 from odoo import api, fields, models
 import ast
 
+KS_SNAPSHOT_FIELDS = ('debit', 'credit', 'balance', 'account_id', 'journal_id', 'partner_id', 'date', 'company_id')
+# partner fields shown or filtered on by the reports
+KS_PARTNER_REPORT_FIELDS = ('name', 'ref', 'category_id', 'parent_id')
+
+
+class KsAccountMove(models.Model):
+    _inherit = "account.move"
+
+    @contextmanager
+    def _ks_track_balance_snapshot(self):
+        ''' Apply to ks.dynamic.financial.balance the difference between the posted lines of the moves
+        before and after the block. Lines created, changed or removed by the nested calls are covered
+        by the moves, so these calls run with ks_balance_snapshot_tracked and skip their own tracking '''
+        if self.env.context.get('ks_balance_snapshot_tracked'):
+            yield
+            return
+        ks_deltas_before = self.line_ids._ks_balance_snapshot_deltas(-1)
+        yield
+        ks_deltas_after = self.exists().line_ids._ks_balance_snapshot_deltas()
+        self.env['ks.dynamic.financial.balance'].sudo().ks_apply_balance_deltas(
+            ks_deltas_before, ks_deltas_after)
+
+    def write(self, vals):
+        # any change of a move may change a report (dates of draft moves, references...),
+        # the version is bumped once per transaction anyway
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
+        # keep ks.dynamic.financial.balance in line with the posted entries
+        if 'state' not in vals:
+            return super().write(vals)
+        with self._ks_track_balance_snapshot():
+            return super(KsAccountMove, self.with_context(ks_balance_snapshot_tracked=True)).write(vals)
+
+
 class KsAccountMoveLine(models.Model):
     _inherit = "account.move.line"
+
+    def _ks_balance_snapshot_deltas(self, ks_sign=1):
+        ''' Signed debit, credit and balance of the posted lines per snapshot row
+        :return: dict {(company_id, account_id, journal_id, partner_id, month): [debit, credit, balance]}
+        '''
+        ks_deltas = defaultdict(lambda: [0.0, 0.0, 0.0])
+        for line in self:
+            if line.parent_state != 'posted' or not line.account_id or not line.date:
+                continue
+            ks_delta = ks_deltas[(line.company_id.id, line.account_id.id, line.journal_id.id or None,
+                                  line.partner_id.id or None, line.date.replace(day=1))]
+            ks_delta[0] += ks_sign * line.debit
+            ks_delta[1] += ks_sign * line.credit
+            ks_delta[2] += ks_sign * line.balance
+        return ks_deltas
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        # move_id is required, it is also set on the lines created through their move
+        ks_moves = self.env['account.move'].browse({vals['move_id'] for vals in vals_list if vals.get('move_id')})
+        with ks_moves._ks_track_balance_snapshot():
+            lines = super(KsAccountMoveLine, self.with_context(ks_balance_snapshot_tracked=True)).create(vals_list)
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
+        return lines.with_env(self.env)
+
+    def write(self, vals):
+        # labels and analytic distributions change the reports too, not only the amounts
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
+        if not any(ks_field in vals for ks_field in KS_SNAPSHOT_FIELDS):
+            return super().write(vals)
+        with self.move_id._ks_track_balance_snapshot():
+            return super(KsAccountMoveLine, self.with_context(ks_balance_snapshot_tracked=True)).write(vals)
+
+    def unlink(self):
+        with self.move_id._ks_track_balance_snapshot():
+            res = super(KsAccountMoveLine, self.with_context(ks_balance_snapshot_tracked=True)).unlink()
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
+        return res
+
     @api.model
     def _query_get(self, domain=None):
             self.check_access_rights('read')
@@ -77,7 +152,45 @@ class KsAccountMoveLine(models.Model):
             return tables, where_clause, where_clause_params
 
 
+class KsAccountPartialReconcile(models.Model):
+    _inherit = "account.partial.reconcile"
+
+    # reconciliations change the residual amounts shown by the aged and partner reports
+    @api.model_create_multi
+    def create(self, vals_list):
+        partials = super().create(vals_list)
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
+        return partials
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
+        return res
+
+
 class KsAccountAccount(models.Model):
     _inherit = "account.account"
 
-    account_type = fields.Selection(selection_add=[('liquidity', 'Liquidity')], ondelete={'liquidity': 'set asset_receivable'})
\ No newline at end of file
+    account_type = fields.Selection(selection_add=[('liquidity', 'Liquidity')], ondelete={'liquidity': 'set asset_receivable'})
+
+    # codes, names and types of the accounts are part of the computed reports
+    def write(self, vals):
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
+        return super().write(vals)
+
+
+class KsAccountJournal(models.Model):
+    _inherit = "account.journal"
+
+    def write(self, vals):
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
+        return super().write(vals)
+
+
+class KsResPartner(models.Model):
+    _inherit = "res.partner"
+
+    def write(self, vals):
+        if any(ks_field in vals for ks_field in KS_PARTNER_REPORT_FIELDS):
+            self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
+        return super().write(vals)
\ No newline at end of file
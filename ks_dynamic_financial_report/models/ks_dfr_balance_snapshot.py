@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import datetime
+from collections import defaultdict
+from dateutil.relativedelta import relativedelta
+from odoo import models, fields, api, tools
+
+# unique key of the snapshot rows, journal and partner may be empty
+KS_SNAPSHOT_KEY = 'company_id, account_id, COALESCE(journal_id, 0), COALESCE(partner_id, 0), date'
+
+
+class KsDynamicFinancialBalance(models.Model):
+    """ Monthly balances of the posted journal items, maintained incrementally.
+
+    One row holds the debit, credit and balance of the posted lines of a
+    (company, account, journal, partner, month). The financial reports read the
+    complete months from this table and only hit account_move_line for the partial
+    months at the edges of the requested period and for draft entries.
+    """
+    _name = 'ks.dynamic.financial.balance'
+    _description = 'Dynamic Financial Report Balance Snapshot'
+    _log_access = False
+
+    company_id = fields.Many2one('res.company', required=True, index=True, readonly=True)
+    account_id = fields.Many2one('account.account', required=True, index=True, readonly=True, ondelete='cascade')
+    journal_id = fields.Many2one('account.journal', readonly=True, ondelete='cascade')
+    partner_id = fields.Many2one('res.partner', readonly=True, ondelete='cascade')
+    date = fields.Date('Month', required=True, index=True, readonly=True)
+    debit = fields.Float(readonly=True)
+    credit = fields.Float(readonly=True)
+    balance = fields.Float(readonly=True)
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ks_dynamic_financial_balance_account_date_idx
+            ON ks_dynamic_financial_balance (account_id, date)
+        """)
+        if not tools.index_exists(self.env.cr, 'ks_dynamic_financial_balance_key_uniq'):
+            # the rebuild also merges the rows duplicated before the key existed
+            self.ks_rebuild_balance_snapshot()
+            self.env.cr.execute("""
+                CREATE UNIQUE INDEX ks_dynamic_financial_balance_key_uniq
+                ON ks_dynamic_financial_balance ({key})
+            """.format(key=KS_SNAPSHOT_KEY))
+            return
+        self.env.cr.execute("SELECT 1 FROM ks_dynamic_financial_balance LIMIT 1")
+        if not self.env.cr.fetchone():
+            self.ks_rebuild_balance_snapshot()
+
+    @api.model
+    def ks_rebuild_balance_snapshot(self):
+        """ Recompute the whole snapshot from the posted journal items """
+        self.env.flush_all()
+        self.env.cr.execute("DELETE FROM ks_dynamic_financial_balance")
+        self.env.cr.execute("""
+            INSERT INTO ks_dynamic_financial_balance
+                (company_id, account_id, journal_id, partner_id, date, debit, credit, balance)
+            SELECT
+                l.company_id, l.account_id, l.journal_id, l.partner_id,
+                date_trunc('month', l.date)::date,
+                COALESCE(SUM(l.debit), 0), COALESCE(SUM(l.credit), 0), COALESCE(SUM(l.balance), 0)
+            FROM account_move_line l
+            WHERE l.parent_state = 'posted' AND l.account_id IS NOT NULL
+            GROUP BY l.company_id, l.account_id, l.journal_id, l.partner_id, date_trunc('month', l.date)
+        """)
+        self.invalidate_model()
+        return True
+
+    @api.model
+    def ks_apply_balance_deltas(self, *ks_deltas_list):
+        """ Add signed amounts to the snapshot rows, creating the missing ones. The rows are updated in
+        place under their unique key, so concurrent transactions touching the same month add up instead
+        of overwriting each other.
+        :param ks_deltas_list: dicts {(company_id, account_id, journal_id, partner_id, month):
+                               [debit, credit, balance]}
+        """
+        ks_totals = defaultdict(lambda: [0.0, 0.0, 0.0])
+        for ks_deltas in ks_deltas_list:
+            for ks_key, ks_amounts in ks_deltas.items():
+                ks_total = ks_totals[ks_key]
+                for i, ks_amount in enumerate(ks_amounts):
+                    ks_total[i] += ks_amount
+        ks_rows = [ks_key + tuple(ks_amounts) for ks_key, ks_amounts in ks_totals.items() if any(ks_amounts)]
+        if not ks_rows:
+            return
+        # sorted so concurrent transactions lock the rows in the same order
+        ks_columns = list(zip(*sorted(ks_rows, key=lambda ks_row: tuple(ks_value or 0 for ks_value in ks_row[:5]))))
+        self.env.cr.execute("""
+            INSERT INTO ks_dynamic_financial_balance
+                (company_id, account_id, journal_id, partner_id, date, debit, credit, balance)
+            SELECT * FROM unnest(%s::int[], %s::int[], %s::int[], %s::int[], %s::date[],
+                                 %s::float8[], %s::float8[], %s::float8[])
+            ON CONFLICT ({key}) DO UPDATE SET
+                debit = ks_dynamic_financial_balance.debit + EXCLUDED.debit,
+                credit = ks_dynamic_financial_balance.credit + EXCLUDED.credit,
+                balance = ks_dynamic_financial_balance.balance + EXCLUDED.balance
+        """.format(key=KS_SNAPSHOT_KEY), [list(ks_column) for ks_column in ks_columns])
+        self.invalidate_model()
+
+    @api.model
+    def ks_get_snapshot_period(self, ks_date_from, ks_date_to):
+        """ Split a period in the complete months served by the snapshot
+        :return: (first month included, first month excluded) or (False, False)
+        """
+        ks_date_to = fields.Date.to_date(ks_date_to)
+        ks_date_from = fields.Date.to_date(ks_date_from)
+        ks_full_to = (ks_date_to + relativedelta(days=1)).replace(day=1)
+        if not ks_date_from:
+            ks_full_from = datetime.date.min
+        elif ks_date_from.day == 1:
+            ks_full_from = ks_date_from
+        else:
+            ks_full_from = ks_date_from.replace(day=1) + relativedelta(months=1)
+        if ks_full_from >= ks_full_to:
+            return False, False
+        return ks_full_from, ks_full_to
+
+    @api.model
+    def ks_fetch_account_balances(self, ks_account_ids, ks_date_from, ks_date_to, ks_company_ids,
+                                  ks_journal_ids=None, ks_states=('posted', 'draft')):
+        """ Debit, credit and balance per account, the complete months being read from the snapshot
+        and only the partial months and the draft items from the journal items.
+        :return: list of dict {'id', 'debit', 'credit', 'balance'}
+        """
+        return self.ks_fetch_period_account_balances(
+            ks_account_ids, [(ks_date_from, ks_date_to)], ks_company_ids,
+            ks_journal_ids=ks_journal_ids, ks_states=ks_states)[0]
+
+    @api.model
+    def ks_fetch_period_account_balances(self, ks_account_ids, ks_periods, ks_company_ids,
+                                         ks_journal_ids=None, ks_states=('posted', 'draft')):
+        """ Balances per account of several periods at once. Each period is a conditional sum over
+        the same rows, so comparing twelve months costs a single query.
+        :param ks_periods: list of (date_from, date_to), date_from may be False
+        :return: one list of dict {'id', 'debit', 'credit', 'balance'} per period
+        """
+        ks_params = {
+            'ks_account_ids': tuple(ks_account_ids),
+            'ks_company_ids': tuple(ks_company_ids),
+            'ks_journal_ids': tuple(ks_journal_ids or []),
+            'ks_states': tuple(ks_states),
+        }
+        ks_snapshot_conds = []
+        ks_line_conds = []
+        ks_partial_conds = []
+        ks_columns = []
+        for i, (ks_date_from, ks_date_to) in enumerate(ks_periods):
+            ks_full_from, ks_full_to = (False, False)
+            if 'posted' in ks_states:
+                ks_full_from, ks_full_to = self.ks_get_snapshot_period(ks_date_from, ks_date_to)
+            ks_params.update({
+                'ks_date_from_%s' % i: ks_date_from or datetime.date.min,
+                'ks_date_to_%s' % i: ks_date_to,
+                'ks_full_from_%s' % i: ks_full_from or datetime.date.min,
+                'ks_full_to_%s' % i: ks_full_to or datetime.date.min,
+            })
+            ks_in_full = "date >= %(ks_full_from_{0})s AND date < %(ks_full_to_{0})s".format(i)
+            ks_in_period = "date >= %(ks_date_from_{0})s AND date <= %(ks_date_to_{0})s".format(i)
+            ks_snapshot_conds.append('(%s)' % ks_in_full)
+            ks_line_conds.append("%s AND NOT (state = 'posted' AND %s)" % (ks_in_period, ks_in_full))
+            ks_partial_conds.append("(%s AND NOT (%s))" % (ks_in_period, ks_in_full))
+            ks_period_cond = "(src = 'snapshot' AND %s) OR (src = 'line' AND %s)" % (
+                ks_snapshot_conds[-1], ks_line_conds[-1])
+            ks_columns.append(
+                "SUM(debit) FILTER (WHERE {cond}) AS debit_{i}, "
+                "SUM(credit) FILTER (WHERE {cond}) AS credit_{i}, "
+                "SUM(balance) FILTER (WHERE {cond}) AS balance_{i}".format(cond=ks_period_cond, i=i))
+
+        ks_journal_where = " AND journal_id IN %(ks_journal_ids)s" if ks_journal_ids else ""
+        self.env.flush_all()
+        self.env.cr.execute("""
+            SELECT id, {columns}
+            FROM (
+                SELECT 'snapshot' AS src, account_id AS id, date, 'posted' AS state, debit, credit, balance
+                FROM ks_dynamic_financial_balance
+                WHERE account_id IN %(ks_account_ids)s
+                    AND company_id IN %(ks_company_ids)s
+                    AND ({snapshot_conds})
+                    {journal_where}
+                UNION ALL
+                SELECT 'line' AS src, account_id AS id, date, parent_state AS state, debit, credit, balance
+                FROM account_move_line
+                WHERE account_id IN %(ks_account_ids)s
+                    AND company_id IN %(ks_company_ids)s
+                    AND parent_state IN %(ks_states)s
+                    AND (parent_state != 'posted' OR {partial_conds})
+                    {journal_where}
+            ) ks_balances
+            GROUP BY id
+        """.format(
+            columns=', '.join(ks_columns),
+            snapshot_conds=' OR '.join(ks_snapshot_conds),
+            partial_conds=' OR '.join(ks_partial_conds),
+            journal_where=ks_journal_where,
+        ), ks_params)
+        ks_rows = self.env.cr.dictfetchall()
+        ks_res = []
+        for i in range(len(ks_periods)):
+            ks_res.append([{
+                'id': ks_row['id'],
+                'debit': ks_row['debit_%s' % i],
+                'credit': ks_row['credit_%s' % i],
+                'balance': ks_row['balance_%s' % i],
+            } for ks_row in ks_rows if ks_row['debit_%s' % i] is not None])
+        return ks_res
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+
+from odoo import models, fields, api, _
+
+_logger = logging.getLogger(__name__)
+
+
+class KsDynamicFinancialExport(models.Model):
+    """ XLSX export of a dynamic financial report queued for the background worker.
+
+    The export is built by the cron in its own transaction, stored as an attachment of
+    the record and the requesting user is notified on the bus once it is ready.
+    """
+    _name = 'ks.dynamic.financial.export'
+    _description = 'Dynamic Financial Report Export'
+    _order = 'id desc'
+
+    name = fields.Char(required=True, readonly=True)
+    ks_report_id = fields.Many2one('ks.dynamic.financial.reports', string='Report', required=True,
+                                   readonly=True, ondelete='cascade')
+    ks_user_id = fields.Many2one('res.users', string='User', required=True, readonly=True,
+                                 default=lambda self: self.env.user, ondelete='cascade')
+    ks_company_ids = fields.Many2many('res.company', string='Companies', readonly=True)
+    ks_df_informations = fields.Text(readonly=True)
+    ks_state = fields.Selection([
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='Status', default='queued', required=True, readonly=True, index=True)
+    ks_attachment_id = fields.Many2one('ir.attachment', string='File', readonly=True)
+    ks_error = fields.Text('Error', readonly=True)
+
+    @api.model
+    def ks_enqueue_export(self, ks_report, ks_df_informations):
+        ''' Queue the XLSX export of a report and wake up the worker '''
+        ks_export = self.sudo().create({
+            'name': '%s.xlsx' % (ks_report.report_name or ks_report.display_name),
+            'ks_report_id': ks_report.id,
+            'ks_user_id': self.env.uid,
+            'ks_company_ids': [(6, 0, self.env.companies.ids)],
+            'ks_df_informations': json.dumps(ks_df_informations),
+        })
+        self.env.ref('ks_dynamic_financial_report.ks_dfr_export_cron').sudo()._trigger()
+        return ks_export
+
+    @api.model
+    def _ks_cron_process_exports(self):
+        ''' Build the queued exports one by one, each in its own transaction. The rows are locked
+        with SKIP LOCKED so several workers can share the queue. '''
+        while True:
+            self.env.cr.execute("""
+                SELECT id FROM ks_dynamic_financial_export
+                WHERE ks_state = 'queued'
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            """)
+            ks_row = self.env.cr.fetchone()
+            if not ks_row:
+                break
+            self.browse(ks_row[0])._ks_process_export()
+            self.env.cr.commit()
+
+    def _ks_process_export(self):
+        self.ensure_one()
+        self.ks_state = 'running'
+        try:
+            with self.env.cr.savepoint():
+                ks_report = self.ks_report_id.with_user(self.ks_user_id).with_context(
+                    allowed_company_ids=self.ks_company_ids.ids or self.ks_user_id.company_id.ids)
+                ks_file = ks_report.ks_get_xlsx_file(json.loads(self.ks_df_informations))
+                try:
+                    ks_content = ks_file.read()
+                finally:
+                    ks_file.close()
+                self.ks_attachment_id = self.env['ir.attachment'].create({
+                    'name': self.name,
+                    'raw': ks_content,
+                    'mimetype': self.ks_report_id.ks_get_export_plotting_type('xlsx'),
+                    'res_model': self._name,
+                    'res_id': self.id,
+                })
+                self.ks_state = 'done'
+        except Exception as e:
+            _logger.exception("Export %s of the dynamic financial report failed", self.id)
+            self.write({'ks_state': 'failed', 'ks_error': str(e)})
+        self._ks_notify_user()
+
+    def _ks_notify_user(self):
+        self.ensure_one()
+        if self.ks_state == 'done':
+            ks_message = {
+                'type': 'success',
+                'title': _('Export ready'),
+                'message': _('%(name)s is ready: %(url)s', name=self.name,
+                             url='/web/content/%s?download=true' % self.ks_attachment_id.id),
+                'sticky': True,
+            }
+        else:
+            ks_message = {
+                'type': 'danger',
+                'title': _('Export failed'),
+                'message': _('%(name)s could not be generated: %(error)s', name=self.name, error=self.ks_error),
+                'sticky': True,
+            }
+        self.env['bus.bus']._sendone(self.ks_user_id.partner_id, 'simple_notification', ks_message)
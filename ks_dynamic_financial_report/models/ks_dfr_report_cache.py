@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import copy
+import hashlib
+import json
+
+from odoo import models, fields, api
+from odoo.tools.lru import LRU
+
+KS_REPORT_CACHE_SIZE = 64
+KS_CACHE_CONFIG_PARAMETERS = ('ks_enable_ledger_in_bal', 'ks_disable_trial_en_bal')
+
+# results of the reports computed by this worker, least recently used entries are evicted first
+ks_report_cache = LRU(KS_REPORT_CACHE_SIZE)
+
+
+class KsDynamicFinancialCache(models.AbstractModel):
+    """ In memory cache of the computed dynamic financial reports.
+
+    An entry is keyed by a fingerprint of the report, its filters, the companies and the access
+    rights of the user, and by the ledger version. The ledger version is a database sequence
+    bumped whenever journal entries or report definitions change, so a worker never serves
+    figures computed before the last committed change.
+    """
+    _name = 'ks.dynamic.financial.cache'
+    _description = 'Dynamic Financial Report Cache'
+
+    def init(self):
+        self.env.cr.execute("CREATE SEQUENCE IF NOT EXISTS ks_dfr_ledger_version_seq")
+
+    @api.model
+    def ks_get_ledger_version(self):
+        self.env.cr.execute("SELECT last_value FROM ks_dfr_ledger_version_seq")
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def ks_bump_ledger_version(self):
+        ''' Invalidate the cached results now and once more after the commit of the current
+        transaction, so results computed in between from the old data are not served either '''
+        ks_data = self.env.cr.postcommit.data
+        if ks_data.get('ks_dfr_ledger_version'):
+            return
+        ks_data['ks_dfr_ledger_version'] = True
+        self.env.cr.execute("SELECT nextval('ks_dfr_ledger_version_seq')")
+        ks_registry = self.env.registry
+
+        # nextval is not transactional: the bump above is seen by the other workers at once,
+        # while the data of this transaction is not before its commit. A report computed in
+        # between from the old data would be cached under the new version and served stale,
+        # so the version is bumped once more after the commit. Postcommit callbacks run once the
+        # transaction of this cursor is over, hence the short lived cursor, opened only by the
+        # transactions that changed the ledger.
+        @self.env.cr.postcommit.add
+        def ks_bump_after_commit():
+            with ks_registry.cursor() as ks_cr:
+                ks_cr.execute("SELECT nextval('ks_dfr_ledger_version_seq')")
+
+    @api.model
+    def _ks_cache_key(self, ks_report, ks_df_informations):
+        ks_config = self.env['ir.config_parameter'].sudo()
+        ks_fingerprint = json.dumps({
+            'report': ks_report.id,
+            'informations': {k: v for k, v in ks_df_informations.items() if k != 'ks_filter_context'},
+            'company': self.env.company.id,
+            'companies': sorted(self.env.companies.ids),
+            'groups': sorted(self.env.user.groups_id.ids),
+            'su': self.env.su,
+            'lang': self.env.lang,
+            'today': fields.Date.context_today(self),
+            'config': [ks_config.get_param(ks_param) for ks_param in KS_CACHE_CONFIG_PARAMETERS],
+        }, sort_keys=True, default=str)
+        return (self.env.cr.dbname, self.ks_get_ledger_version(),
+                hashlib.sha256(ks_fingerprint.encode()).hexdigest())
+
+    @api.model
+    def ks_get_or_compute(self, ks_report, ks_df_informations, ks_compute):
+        '''
+        Return the cached result of the report for these filters, or compute and cache it
+        :param ks_compute: function computing the result when it is not cached
+        :return: a copy of the result, free to be altered by the caller
+        '''
+        # a transaction which changed the ledger sees data the other workers do not: the cached
+        # results miss its changes and its own results must not be shared before its commit
+        if self.env.cr.postcommit.data.get('ks_dfr_ledger_version'):
+            return ks_compute()
+        ks_key = self._ks_cache_key(ks_report, ks_df_informations)
+        ks_result = ks_report_cache.get(ks_key)
+        if ks_result is None:
+            ks_result = ks_compute()
+            ks_report_cache[ks_key] = copy.deepcopy(ks_result)
+            return ks_result
+        return copy.deepcopy(ks_result)
@@ -10,13 +10,20 @@ from odoo.tools.misc import xlsxwriter
 from odoo.addons.web.controllers.main import clean_action
 import json
 import io
+import itertools
+import uuid
 import ast
 import base64
-import re
 from odoo.osv import expression
 from datetime import date
 
 FETCH_RANGE = 2000
+KS_STREAM_CHUNK_SIZE = 5000
+KS_ACCOUNT_BALANCE_MAPPING = {
+    'balance': "COALESCE(SUM(debit),0) - COALESCE(SUM(credit), 0) as balance",
+    'debit': "COALESCE(SUM(debit), 0) as debit",
+    'credit': "COALESCE(SUM(credit), 0) as credit",
+}
 _logger = logging.getLogger(__name__)
 
 
@@ -35,6 +42,47 @@ def ks_build_analytic_distribution_filter(context):
     return analytic_distribution_filter
 
 
+class KsSqlFilter(object):
+    '''
+    Filters of the report queries on account_move_line (l), account_move (m), account_account (a),
+    account_journal (j) and res_partner (p), kept apart from their values. Sets of ids are bound
+    as arrays with = ANY(), so the text of a query only depends on which filters are active and
+    PostgreSQL can reuse its plan whatever records are selected.
+    '''
+
+    def __init__(self, ks_conditions=None, ks_params=None):
+        self.ks_conditions = list(ks_conditions or [])
+        self.ks_params = dict(ks_params or {})
+
+    def ks_add(self, ks_condition, **ks_params):
+        self.ks_conditions.append(ks_condition)
+        self.ks_params.update(ks_params)
+        return self
+
+    def ks_add_any(self, ks_column, ks_name, ks_values):
+        return self.ks_add('%s = ANY(%%(%s)s)' % (ks_column, ks_name), **{ks_name: list(ks_values)})
+
+    def ks_get(self, ks_name, ks_default=None):
+        return self.ks_params.get(ks_name, ks_default)
+
+    def ks_copy(self):
+        return KsSqlFilter(self.ks_conditions, self.ks_params)
+
+    def ks_where(self, *ks_conditions):
+        '''
+        :param ks_conditions: extra conditions of the query, not kept in the filter
+        :return: WHERE clause joining all the conditions
+        '''
+        return ' AND '.join(['(1=1)'] + ['(%s)' % c for c in self.ks_conditions + list(ks_conditions)])
+
+    def ks_query_params(self, **ks_params):
+        '''
+        :param ks_params: extra parameters of the query
+        :return: parameters of the filter merged with ks_params
+        '''
+        return dict(self.ks_params, **ks_params)
+
+
 class ks_dynamic_financial_base(models.Model):
     _name = 'ks.dynamic.financial.base'
     _description = 'ks_dynamic_financial_base'
@@ -177,7 +225,80 @@ class ks_dynamic_financial_base(models.Model):
     ks_reconciled = fields.Boolean('reconciled')
     ks_comparison_range = fields.Boolean("Date Range Constrained")
 
-    def _ks_calculate_report_balance(self, ks_df_reports, ks_df_informations):
+    def _ks_new_report_plan(self):
+        '''
+        Evaluation plan shared by all the _ks_calculate_report_balance calls of one report request,
+        including the comparison periods.
+        accounts: memo of the account searches, keyed on the domain
+        account_ids: union of the accounts of the report tree, balances are fetched for all of them at once
+        balances: memo of the account balances, keyed on the date context
+        reports: memo of the evaluated sub-reports, keyed on the report ids and the date context
+        '''
+        return {
+            'accounts': {},
+            'account_ids': set(),
+            'balances': {},
+            'reports': {},
+        }
+
+    def _ks_search_accounts(self, ks_domain, ks_plan=None):
+        if ks_plan is None:
+            return self.env['account.account'].sudo().search(ks_domain)
+        ks_key = repr(ks_domain)
+        if ks_key not in ks_plan['accounts']:
+            ks_plan['accounts'][ks_key] = self.env['account.account'].sudo().search(ks_domain)
+        return ks_plan['accounts'][ks_key]
+
+    def _ks_report_coa_type_domains(self, ks_report):
+        if ks_report == self.env.ref('ks_dynamic_financial_report.ks_df_bs_pre_year_unallocate_earnings'):
+            return [["|", "|", ('account_type', '=', account_type.ks_account_type),
+                     ('account_type', 'ilike', 'income'),
+                     ('account_type', 'ilike', 'expense')] for account_type in ks_report.ks_dfr_account_type_ids]
+        return [[('account_type', '=', account_type.ks_account_type)]
+                for account_type in ks_report.ks_dfr_account_type_ids]
+
+    def _ks_prepare_report_plan(self, ks_df_reports, ks_plan):
+        '''
+        Resolve the account sets of the whole report tree up front so that the balances of their
+        union can be fetched with one query per date context
+        '''
+        ks_visited = set()
+        ks_todo = list(ks_df_reports)
+        while ks_todo:
+            ks_report = ks_todo.pop()
+            if ks_report.id in ks_visited:
+                continue
+            ks_visited.add(ks_report.id)
+            if ks_report.ks_df_report_account_type == 'accounts':
+                ks_plan['account_ids'].update(ks_report.sudo().ks_df_report_account_ids.ids)
+            elif ks_report.ks_df_report_account_type == 'ks_coa_type':
+                for ks_domain in self._ks_report_coa_type_domains(ks_report):
+                    ks_plan['account_ids'].update(self._ks_search_accounts(ks_domain, ks_plan).ids)
+            elif ks_report.ks_df_report_account_type == 'account_report':
+                ks_todo.extend(ks_report.ks_df_report_account_report_ids)
+            else:
+                ks_todo.extend(ks_report.ks_children_id)
+        return ks_plan
+
+    def _ks_balance_context_key(self, prv_year_dates=False):
+        ks_context = self._context
+        return repr((
+            [(ks_key, ks_context.get(ks_key)) for ks_key in (
+                'date_from', 'date_to', 'state', 'journal_ids', 'company_id', 'account_ids',
+                'analytic_account_ids', 'analytic_tag_ids')],
+            prv_year_dates,
+        ))
+
+    def _ks_calculate_sub_report_balance(self, ks_df_reports, ks_df_informations, ks_plan=None):
+        if ks_plan is None:
+            return self._ks_calculate_report_balance(ks_df_reports, ks_df_informations)
+        ks_key = (tuple(ks_df_reports.ids), self._ks_balance_context_key())
+        if ks_key not in ks_plan['reports']:
+            ks_plan['reports'][ks_key] = self._ks_calculate_report_balance(ks_df_reports, ks_df_informations,
+                                                                           ks_plan=ks_plan)
+        return ks_plan['reports'][ks_key]
+
+    def _ks_calculate_report_balance(self, ks_df_reports, ks_df_informations, ks_plan=None):
         ks_res = {}
         ks_fields = ['credit', 'debit', 'balance']
         for ks_report in ks_df_reports:
@@ -187,7 +308,7 @@ class ks_dynamic_financial_base(models.Model):
             if ks_report.ks_df_report_account_type == 'accounts':
                 ks_res[ks_report.id]['account'] = self.sudo()._ks_compute_account_balance(
                     ks_report.sudo().ks_df_report_account_ids,
-                    ks_df_informations, ks_report=ks_report)
+                    ks_df_informations, ks_report=ks_report, ks_plan=ks_plan)
                 for ks_value in ks_res[ks_report.id]['account'].values():
                     for field in ks_fields:
                         ks_res[ks_report.id][field] += ks_value.get(field)
@@ -197,20 +318,11 @@ class ks_dynamic_financial_base(models.Model):
                 if self.ks_df_report_account_report_ids != self.env.ref(
                         'ks_dynamic_financial_report.ks_df_report_cash_flow0'):
                     ks_accounts = []
-                    for account_type in ks_report.ks_dfr_account_type_ids:
-                        ks_acc_id = self.env['account.account'].sudo().search(
-                            [('account_type', '=', account_type.ks_account_type)])
+                    for ks_domain in self._ks_report_coa_type_domains(ks_report):
+                        ks_acc_id = self._ks_search_accounts(ks_domain, ks_plan)
                         if ks_acc_id:
                             ks_accounts.append(ks_acc_id)
                     if ks_report == self.env.ref('ks_dynamic_financial_report.ks_df_bs_pre_year_unallocate_earnings'):
-                        ks_accounts = []
-                        for account_type in ks_report.ks_dfr_account_type_ids:
-                            ks_acc_id = self.env['account.account'].sudo().search(
-                                ["|", "|", ('account_type', '=', account_type.ks_account_type),
-                                 ('account_type', 'ilike', 'income'),
-                                 ('account_type', 'ilike', 'expense')])
-                            if ks_acc_id:
-                                ks_accounts.append(ks_acc_id)
                         if self._context.get('date_from', False):
                             prv_year_dates = {
                                 'date_from': datetime.date(fields.Date.from_string(self._context['date_from']).year - 1,
@@ -227,7 +339,8 @@ class ks_dynamic_financial_base(models.Model):
                         ks_res[ks_report.id]['account'] = self.sudo()._ks_compute_account_balance(ks_accounts,
                                                                                                   ks_df_informations,
                                                                                                   prv_year_dates,
-                                                                                                  ks_report=ks_report)
+                                                                                                  ks_report=ks_report,
+                                                                                                  ks_plan=ks_plan)
 
                     elif ks_report == self.env.ref(
                             'ks_dynamic_financial_report.ks_dynamic_financial_balancesheet_current_year_earnings'):
@@ -253,24 +366,26 @@ class ks_dynamic_financial_base(models.Model):
                                                                                                   ks_df_informations,
                                                                                                   prv_year_dates,
                                                                                                   current_year=True,
-                                                                                                  ks_report=ks_report)
+                                                                                                  ks_report=ks_report,
+                                                                                                  ks_plan=ks_plan)
                     else:
                         ks_res[ks_report.id]['account'] = self.sudo()._ks_compute_account_balance(ks_accounts,
                                                                                                   ks_df_informations,
-                                                                                                  ks_report=ks_report)
+                                                                                                  ks_report=ks_report,
+                                                                                                  ks_plan=ks_plan)
                     for ks_value in ks_res[ks_report.id]['account'].values():
                         for field in ks_fields:
                             ks_res[ks_report.id][field] += ks_value.get(field)
                 else:
                     ks_accounts = []
-                    for account_type in ks_report.ks_dfr_account_type_ids:
-                        ks_acc_id = self.env['account.account'].sudo().search(
-                            [('account_type', '=', account_type.ks_account_type)])
+                    for ks_domain in self._ks_report_coa_type_domains(ks_report):
+                        ks_acc_id = self._ks_search_accounts(ks_domain, ks_plan)
                         if ks_acc_id:
                             ks_accounts.append(ks_acc_id)
                     ks_res[ks_report.id]['account'] = self.sudo()._ks_compute_account_balance(ks_accounts,
                                                                                               ks_df_informations,
-                                                                                              ks_report=ks_report)
+                                                                                              ks_report=ks_report,
+                                                                                              ks_plan=ks_plan)
                     for ks_value in ks_res[ks_report.id]['account'].values():
                         for field in ks_fields:
                             ks_res[ks_report.id][field] += ks_value.get(field)
@@ -278,14 +393,15 @@ class ks_dynamic_financial_base(models.Model):
                 # it's the amount of the linked report
                 if self.ks_df_report_account_report_ids != \
                         self.env.ref('ks_dynamic_financial_report.ks_df_report_cash_flow0'):
-                    ks_res2 = self._ks_calculate_report_balance(ks_report.ks_df_report_account_report_ids,
-                                                                ks_df_informations)
+                    ks_res2 = self._ks_calculate_sub_report_balance(ks_report.ks_df_report_account_report_ids,
+                                                                    ks_df_informations, ks_plan=ks_plan)
                     for key, ks_value in ks_res2.items():
                         for field in ks_fields:
                             ks_res[ks_report.id][field] += ks_value[field]
 
             elif ks_report.ks_df_report_account_type == 'total':
-                ks_res2 = self.sudo()._ks_calculate_report_balance(ks_report.ks_children_id, ks_df_informations)
+                ks_res2 = self.sudo()._ks_calculate_sub_report_balance(ks_report.ks_children_id, ks_df_informations,
+                                                                       ks_plan=ks_plan)
                 for key, ks_value in ks_res2.items():
                     for field in ks_fields:
                         ks_res[ks_report.id][field] += ks_value[field]
@@ -294,7 +410,8 @@ class ks_dynamic_financial_base(models.Model):
                 # it's the sum of the children of this account.report
                 if self.ks_df_report_account_report_ids != \
                         self.env.ref('ks_dynamic_financial_report.ks_df_report_cash_flow0'):
-                    ks_res2 = self.sudo()._ks_calculate_report_balance(ks_report.ks_children_id, ks_df_informations)
+                    ks_res2 = self.sudo()._ks_calculate_sub_report_balance(ks_report.ks_children_id,
+                                                                           ks_df_informations, ks_plan=ks_plan)
                     for key, ks_value in ks_res2.items():
                         for field in ks_fields:
                             if ks_res[ks_report.id][field] == 0.0:
@@ -312,21 +429,155 @@ class ks_dynamic_financial_base(models.Model):
                             [('company_id', 'in', ks_df_informations.get('company_ids')),
                              ('ks_cash_flow_category', 'not in', [0])])
                     ks_res[ks_report.id]['account'] = self._ks_compute_account_balance(ks_accounts, ks_df_informations,
-                                                                                       ks_report=ks_report)
+                                                                                       ks_report=ks_report,
+                                                                                       ks_plan=ks_plan)
                     for ks_values in ks_res[ks_report.id]['account'].values():
                         for field in ks_fields:
                             [ks_report.id][field] = ks_values.get(field) - [ks_report.id][field]
         return ks_res
 
+    def _ks_use_balance_snapshot(self):
+        """ The balance snapshot has no analytic, tag nor partner dimension, reports filtered on them
+        keep reading the journal items
+        """
+        ks_context = self._context
+        if not ks_context.get('date_to') or ks_context.get('aged_balance') or ks_context.get('reconcile_date'):
+            return False
+        return not any(ks_context.get(ks_key) for ks_key in (
+            'analytic_account_ids', 'analytic_tag_ids', 'account_tag_ids', 'partner_ids', 'partner_categories'))
+
+    def _ks_snapshot_filters(self, account_ids):
+        """ Translate the filter context of _query_get into the arguments of ks.dynamic.financial.balance """
+        ks_context = self._context
+        if ks_context.get('company_id'):
+            ks_company_ids = [ks_context['company_id']]
+        elif ks_context.get('allowed_company_ids'):
+            ks_company_ids = self.env.companies.ids
+        else:
+            ks_company_ids = [self.env.company.id]
+        if ks_context.get('account_ids'):
+            account_ids = [ks_id for ks_id in account_ids if ks_id in ks_context['account_ids'].ids]
+        ks_state = ks_context.get('state')
+        ks_states = (ks_state,) if ks_state and ks_state.lower() != 'all' else ('posted', 'draft')
+        return {
+            'ks_account_ids': account_ids,
+            'ks_company_ids': ks_company_ids,
+            'ks_journal_ids': ks_context.get('journal_ids') or [],
+            'ks_states': ks_states,
+        }
+
+    def _ks_fetch_snapshot_balances(self, account_ids, prv_year_dates=False):
+        """ Same figures as the account_move_line query of _ks_compute_account_balance, read from
+        ks.dynamic.financial.balance for the complete months of the period
+        """
+        ks_date_from = self._context.get('date_from')
+        ks_date_to = self._context.get('date_to')
+        if prv_year_dates:
+            ks_date_from = ks_date_from and prv_year_dates['date_from']
+            ks_date_to = prv_year_dates['date_to']
+        ks_filters = self._ks_snapshot_filters(account_ids)
+        if not ks_filters['ks_account_ids']:
+            return []
+        return self.env['ks.dynamic.financial.balance'].sudo().ks_fetch_account_balances(
+            ks_filters['ks_account_ids'], fields.Date.to_date(ks_date_from), fields.Date.to_date(ks_date_to),
+            ks_filters['ks_company_ids'], ks_journal_ids=ks_filters['ks_journal_ids'],
+            ks_states=ks_filters['ks_states'])
+
+    def _ks_prefetch_period_balances(self, ks_plan, ks_filter_contexts, ks_df_informations):
+        '''
+        Fill the balance memo of the plan for several filter contexts at once. Contexts which only
+        differ by their dates are served by one query with a conditional sum per period, so the
+        comparison columns do not cost one full evaluation each.
+        :param ks_filter_contexts: list of filter contexts, the main one and those of the comparison periods
+        '''
+        if not ks_plan['account_ids']:
+            return
+        ks_groups = {}
+        for ks_filter_context in ks_filter_contexts:
+            # same context as the one _ks_compute_account_balance builds before fetching the balances
+            ks_self = self.with_context(ks_filter_context).with_context(
+                date_from=ks_filter_context.get('date_from'), company_id=ks_df_informations.get('company_id'))
+            if not ks_self._ks_use_balance_snapshot():
+                continue
+            ks_key = ks_self._ks_balance_context_key()
+            if ks_key in ks_plan['balances']:
+                continue
+            ks_filters = ks_self._ks_snapshot_filters(list(ks_plan['account_ids']))
+            ks_group = ks_groups.setdefault(repr(ks_filters), {'filters': ks_filters, 'periods': [], 'keys': []})
+            if ks_key not in ks_group['keys']:
+                ks_group['keys'].append(ks_key)
+                ks_group['periods'].append((fields.Date.to_date(ks_filter_context.get('date_from')),
+                                            fields.Date.to_date(ks_filter_context.get('date_to'))))
+        for ks_group in ks_groups.values():
+            ks_filters = ks_group['filters']
+            ks_period_rows = []
+            if ks_filters['ks_account_ids']:
+                ks_period_rows = self.env['ks.dynamic.financial.balance'].sudo().ks_fetch_period_account_balances(
+                    ks_filters['ks_account_ids'], ks_group['periods'], ks_filters['ks_company_ids'],
+                    ks_journal_ids=ks_filters['ks_journal_ids'], ks_states=ks_filters['ks_states'])
+            for i, ks_key in enumerate(ks_group['keys']):
+                ks_plan['balances'][ks_key] = {
+                    'account_ids': set(ks_plan['account_ids']),
+                    'rows': {ks_row['id']: ks_row for ks_row in (ks_period_rows[i] if ks_period_rows else [])},
+                }
+
+    def _ks_fetch_account_balance_rows(self, account_ids, prv_year_dates=False):
+        if self._ks_use_balance_snapshot():
+            return self._ks_fetch_snapshot_balances(account_ids, prv_year_dates)
+
+        ks_tables, ks_where_clause, ks_where_params = self.env['account.move.line'].with_context(
+            strict_range=True if self._context.get('date_from') else False)._query_get()
+        ks_tables = ks_tables.replace('"', '') if ks_tables else "account_move_line"
+        wheres = [""]
+        if ks_where_clause.strip():
+            wheres.append(ks_where_clause.strip())
+        ks_filters = " AND ".join(wheres)
+
+        if prv_year_dates:
+            ks_context = dict(self._context or {})
+            if ks_context.get('date_to'):
+                ks_where_params[0] = str(prv_year_dates['date_to'])
+            if ks_context.get('date_from'):
+                ks_where_params[1] = str(prv_year_dates['date_from'])
+
+        if self._context.get('analytic_account_ids', False):
+            context_data = self._context
+            analytic_distribution_filter = ks_build_analytic_distribution_filter(context_data)
+            request = "SELECT account_id as id, " + ', '.join(KS_ACCOUNT_BALANCE_MAPPING.values()) + \
+                      " FROM " + ks_tables + \
+                      " WHERE account_id IN %s " \
+                      + ks_filters + analytic_distribution_filter \
+                      + " GROUP BY account_id"
+        else:
+            request = "SELECT account_id as id, " + ', '.join(KS_ACCOUNT_BALANCE_MAPPING.values()) + \
+                      " FROM " + ks_tables + \
+                      " WHERE account_id IN %s " \
+                      + ks_filters + \
+                      " GROUP BY account_id"
+        ks_params = (tuple(account_ids),) + tuple(ks_where_params)
+        self.env.cr.execute(request, ks_params)
+        return self.env.cr.dictfetchall()
+
+    def _ks_fetch_planned_balance_rows(self, account_ids, prv_year_dates, ks_plan):
+        '''
+        Balances of the given accounts taken from the plan. The first request of a date context fetches
+        the balances of every account of the report tree at once.
+        '''
+        ks_memo = ks_plan['balances'].setdefault(self._ks_balance_context_key(prv_year_dates),
+                                                 {'account_ids': set(), 'rows': {}})
+        ks_missing = (ks_plan['account_ids'] | set(account_ids)) - ks_memo['account_ids']
+        if ks_missing:
+            for ks_row in self._ks_fetch_account_balance_rows(list(ks_missing), prv_year_dates):
+                ks_memo['rows'][ks_row['id']] = ks_row
+            ks_memo['account_ids'] |= ks_missing
+        # rows are copied as the callers flip the sign of the balance in place
+        return [dict(ks_memo['rows'][ks_id]) for ks_id in dict.fromkeys(account_ids) if ks_id in ks_memo['rows']]
+
     def _ks_compute_account_balance(self, accounts, ks_df_informations, prv_year_dates=False, current_year=False,
-                                    ks_report=None):
+                                    ks_report=None, ks_plan=None):
         """ compute the balance, debit and credit for the provided accounts
         """
-        ks_mapping = {
-            'balance': "COALESCE(SUM(debit),0) - COALESCE(SUM(credit), 0) as balance",
-            'debit': "COALESCE(SUM(debit), 0) as debit",
-            'credit': "COALESCE(SUM(credit), 0) as credit",
-        }
+        ks_mapping = KS_ACCOUNT_BALANCE_MAPPING
         ks_res = {}
         if current_year:
             self = self.with_context(date_from=prv_year_dates['date_from'])
@@ -337,42 +588,15 @@ class ks_dynamic_financial_base(models.Model):
             for rec in account:
                 ks_res[rec.id] = dict.fromkeys(ks_mapping, 0.0)
         if accounts:
-            ks_tables, ks_where_clause, ks_where_params = self.env['account.move.line'].with_context(
-                strict_range=True if self._context.get('date_from') else False)._query_get()
-            ks_tables = ks_tables.replace('"', '') if ks_tables else "account_move_line"
-            wheres = [""]
-            if ks_where_clause.strip():
-                wheres.append(ks_where_clause.strip())
-            ks_filters = " AND ".join(wheres)
-
-            if prv_year_dates:
-                ks_context = dict(self._context or {})
-                if ks_context.get('date_to'):
-                    ks_where_params[0] = str(prv_year_dates['date_to'])
-                if ks_context.get('date_from'):
-                    ks_where_params[1] = str(prv_year_dates['date_from'])
-
-            if self._context.get('analytic_account_ids', False):
-                context_data = self._context
-                analytic_distribution_filter = ks_build_analytic_distribution_filter(context_data)
-                request = "SELECT account_id as id, " + ', '.join(ks_mapping.values()) + \
-                          " FROM " + ks_tables + \
-                          " WHERE account_id IN %s " \
-                          + ks_filters + analytic_distribution_filter \
-                          + " GROUP BY account_id"
-            else:
-                request = "SELECT account_id as id, " + ', '.join(ks_mapping.values()) + \
-                          " FROM " + ks_tables + \
-                          " WHERE account_id IN %s " \
-                          + ks_filters + \
-                          " GROUP BY account_id"
             account_ids = []
             for account in accounts:
                 for rec in account:
                     account_ids.append(rec.id)
-            ks_params = (tuple(account_ids),) + tuple(ks_where_params)
-            self.env.cr.execute(request, ks_params)
-            for row in self.env.cr.dictfetchall():
+            if ks_plan is not None:
+                ks_rows = self._ks_fetch_planned_balance_rows(account_ids, prv_year_dates, ks_plan)
+            else:
+                ks_rows = self._ks_fetch_account_balance_rows(account_ids, prv_year_dates)
+            for row in ks_rows:
                 # row['balance'] = 0 - row['balance']
                 if self.ks_name == _('Balance Sheet') or self.ks_name == "Balance Sheet":
                     if (ks_report.ks_parent_id and _(
@@ -411,6 +635,50 @@ class ks_dynamic_financial_base(models.Model):
                     ks_res[row['id']] = row
         return ks_res
 
+    def _ks_comparison_filter_context(self, ks_df_informations, rec):
+        if self.ks_date_filter.get('ks_process') == 'range':
+            ks_comp_filter_context = {
+                'date_from': rec['ks_start_date'],
+                'date_to': rec['ks_end_date'],
+                'company_id': ks_df_informations.get('company_id'),
+                'journal_ids': [],
+            }
+        else:
+            ks_comp_filter_context = {
+                'date_from': False,
+                'date_to': rec['ks_end_date'],
+                'company_id': ks_df_informations.get('company_id'),
+                'journal_ids': [],
+            }
+
+        if ks_df_informations.get('ks_posted_entries') and not ks_df_informations.get('ks_unposted_entries'):
+            ks_comp_filter_context['state'] = 'posted'
+        elif ks_df_informations.get('ks_unposted_entries') and not ks_df_informations.get('ks_posted_entries'):
+            ks_comp_filter_context['state'] = 'draft'
+
+        for ks_selected_journal in ks_df_informations.get('journals', []):
+            if not ks_selected_journal['id'] in ('divider', 'group') and ks_selected_journal['selected']:
+                ks_comp_filter_context['journal_ids'].append(ks_selected_journal['id'])
+
+        if self.ks_analytic_account_visibility and self.ks_analytic_filter and self.display_name != 'Executive Summary':
+            if ks_df_informations.get('analytic_accounts', False):
+                ks_analytic_account_ids = [int(acc) for acc in ks_df_informations['analytic_accounts']]
+                ks_added_analytic_accounts = ks_analytic_account_ids \
+                                             and self.env['account.analytic.account'].browse(
+                    ks_analytic_account_ids) \
+                                             or self.env['account.analytic.account']
+
+                ks_comp_filter_context['analytic_account_ids'] = ks_added_analytic_accounts
+
+            if ks_df_informations.get('analytic_tags', False):
+                ks_analytic_tag_ids = [int(acc) for acc in ks_df_informations['analytic_tags']]
+                ks_added_analytic_tags = ks_analytic_tag_ids \
+                                         and self.env['account.analytic.tag'].browse(ks_analytic_tag_ids) \
+                                         or self.env['account.analytic.tag']
+
+                ks_comp_filter_context['analytic_tag_ids'] = ks_added_analytic_tags
+        return ks_comp_filter_context
+
     def ks_fetch_report_account_lines(self, ks_df_informations):
         ks_account_report = self.ks_df_report_account_report_ids
 
@@ -431,58 +699,24 @@ class ks_dynamic_financial_base(models.Model):
         if ks_df_informations.get('ks_filter_context', False) and self.ks_date_filter.get('ks_process') == 'single':
             ks_df_informations['ks_filter_context']['date_from'] = False
 
+        ks_intervals = ks_df_informations.get('ks_differ')['ks_intervals']
+        ks_comp_filter_contexts = [self._ks_comparison_filter_context(ks_df_informations, rec) for rec in ks_intervals]
+        # one evaluation plan for the report and all its comparison periods, their balances being
+        # fetched together
+        ks_plan = self._ks_prepare_report_plan(ks_child_reports, self._ks_new_report_plan())
+        self._ks_prefetch_period_balances(
+            ks_plan, [ks_df_informations.get('ks_filter_context')] + ks_comp_filter_contexts, ks_df_informations)
         res = self.with_context(ks_df_informations.get('ks_filter_context'))._ks_calculate_report_balance(
-            ks_child_reports, ks_df_informations)
+            ks_child_reports, ks_df_informations, ks_plan=ks_plan)
         ks_main_res = {}
         ks_main_cmp_res = {}
-        if len(ks_df_informations.get('ks_differ')['ks_intervals']):
-            for rec in ks_df_informations.get('ks_differ')['ks_intervals']:
-                if self.ks_date_filter.get('ks_process') == 'range':
-                    ks_comp_filter_context = {
-                        'date_from': rec['ks_start_date'],
-                        'date_to': rec['ks_end_date'],
-                        'company_id': ks_df_informations.get('company_id'),
-                        'journal_ids': [],
-                    }
-                else:
-                    ks_comp_filter_context = {
-                        'date_from': False,
-                        'date_to': rec['ks_end_date'],
-                        'company_id': ks_df_informations.get('company_id'),
-                        'journal_ids': [],
-                    }
-
-                if ks_df_informations.get('ks_posted_entries') and not ks_df_informations.get('ks_unposted_entries'):
-                    ks_comp_filter_context['state'] = 'posted'
-                elif ks_df_informations.get('ks_unposted_entries') and not ks_df_informations.get('ks_posted_entries'):
-                    ks_comp_filter_context['state'] = 'draft'
-
-                for ks_selected_journal in ks_df_informations.get('journals', []):
-                    if not ks_selected_journal['id'] in ('divider', 'group') and ks_selected_journal['selected']:
-                        ks_comp_filter_context['journal_ids'].append(ks_selected_journal['id'])
-
-                if self.ks_analytic_account_visibility and self.ks_analytic_filter and self.display_name != 'Executive Summary':
-                    if ks_df_informations.get('analytic_accounts', False):
-                        ks_analytic_account_ids = [int(acc) for acc in ks_df_informations['analytic_accounts']]
-                        ks_added_analytic_accounts = ks_analytic_account_ids \
-                                                     and self.env['account.analytic.account'].browse(
-                            ks_analytic_account_ids) \
-                                                     or self.env['account.analytic.account']
-
-                        ks_comp_filter_context['analytic_account_ids'] = ks_added_analytic_accounts
-
-                    if ks_df_informations.get('analytic_tags', False):
-                        ks_analytic_tag_ids = [int(acc) for acc in ks_df_informations['analytic_tags']]
-                        ks_added_analytic_tags = ks_analytic_tag_ids \
-                                                 and self.env['account.analytic.tag'].browse(ks_analytic_tag_ids) \
-                                                 or self.env['account.analytic.tag']
-
-                        ks_comp_filter_context['analytic_tag_ids'] = ks_added_analytic_tags
-
+        if len(ks_intervals):
+            for rec, ks_comp_filter_context in zip(ks_intervals, ks_comp_filter_contexts):
                 ks_df_informations['ks_diff_filter_context'] = ks_comp_filter_context
                 ks_comparison_res = self.with_context(
                     ks_df_informations.get('ks_diff_filter_context'))._ks_calculate_report_balance(ks_child_reports,
-                                                                                                   ks_df_informations)
+                                                                                                   ks_df_informations,
+                                                                                                   ks_plan=ks_plan)
                 ks_main_res['comp_bal_' + rec['ks_string']] = res
                 ks_main_cmp_res['comp_bal_' + rec['ks_string']] = ks_comparison_res
 
@@ -717,6 +951,248 @@ class ks_dynamic_financial_base(models.Model):
         return ks_filter_context
 
     # Method to fetch data for General ledger
+    def ks_fetch_general_ledger_balances(self, ks_df_informations, ks_account_ids):
+        '''
+        Single pass balance engine of the General Ledger. Initial, period and ending figures of
+        every account are computed together by one grouped query using filtered aggregates,
+        instead of running a set of queries per account.
+        :param ks_account_ids: list of account ids to compute
+        :return: dict {account_id: {initial_*, period_*, ending_*, count}}
+        '''
+        if not ks_account_ids:
+            return {}
+        ks_filter = self.ks_df_where_clause(ks_df_informations)[0]
+        ks_date = ks_df_informations['date']
+        ks_params = ks_filter.ks_query_params(
+            ks_account_ids=list(ks_account_ids),
+            ks_start_date=ks_date.get('ks_start_date'),
+            ks_end_date=ks_date.get('ks_end_date') or fields.Date.context_today(self),
+        )
+        if ks_date['ks_process'] == 'range':
+            KS_INIT_COND = "l.date < %(ks_start_date)s"
+        else:
+            KS_INIT_COND = "FALSE"
+        sql = ('''
+            SELECT
+                l.account_id AS account_id,
+                COALESCE(SUM(l.debit) FILTER (WHERE {init}),0) AS initial_debit,
+                COALESCE(SUM(l.credit) FILTER (WHERE {init}),0) AS initial_credit,
+                COALESCE(SUM(l.debit - l.credit) FILTER (WHERE {init}),0) AS initial_balance,
+                COALESCE(SUM(l.debit) FILTER (WHERE NOT ({init})),0) AS period_debit,
+                COALESCE(SUM(l.credit) FILTER (WHERE NOT ({init})),0) AS period_credit,
+                COALESCE(SUM(l.debit - l.credit) FILTER (WHERE NOT ({init})),0) AS period_balance,
+                COUNT(*) FILTER (WHERE NOT ({init})) AS count
+            FROM account_move_line l
+            JOIN account_move m ON (l.move_id=m.id)
+            JOIN account_account a ON (l.account_id=a.id)
+            LEFT JOIN res_partner p ON (l.partner_id=p.id)
+            JOIN account_journal j ON (l.journal_id=j.id)
+            WHERE {where}
+                AND l.account_id = ANY(%(ks_account_ids)s)
+                AND l.date <= %(ks_end_date)s
+            GROUP BY l.account_id
+        ''').format(init=KS_INIT_COND, where=ks_filter.ks_where())
+        self.env.cr.execute(sql, ks_params)
+        ks_res = {}
+        for ks_row in self.env.cr.dictfetchall():
+            for ks_field in ('debit', 'credit', 'balance'):
+                ks_row['ending_' + ks_field] = ks_row['initial_' + ks_field] + ks_row['period_' + ks_field]
+            ks_res[ks_row['account_id']] = ks_row
+        return ks_res
+
+    def _ks_general_ledger_lines_query(self, ks_df_informations, ks_account_ids):
+        '''
+        Query of the period move lines of the given accounts, ordered account by account in the
+        order of ks_account_ids. The running balance of each account is computed by a window
+        function so Python never re-sums rows.
+        :return: (sql, params)
+        '''
+        ks_filter = self.ks_df_where_clause(ks_df_informations)[0]
+        ks_date = ks_df_informations['date']
+        ks_params = ks_filter.ks_query_params(
+            ks_account_ids=list(ks_account_ids),
+            ks_start_date=ks_date.get('ks_start_date'),
+            ks_end_date=ks_date.get('ks_end_date') or fields.Date.context_today(self),
+        )
+        if ks_date['ks_process'] == 'range':
+            WHERE = ks_filter.ks_where('l.date >= %(ks_start_date)s')
+        else:
+            WHERE = ks_filter.ks_where()
+        if ks_df_informations.get('sort_accounts_by') == 'date':
+            KS_ORDER_BY_CURRENT = 'l.date, l.move_id, l.id'
+        else:
+            KS_ORDER_BY_CURRENT = 'j.code, p.name, l.move_id, l.id'
+        sql = ('''
+            SELECT
+                l.id AS lid,
+                l.account_id AS account_id,
+                l.date AS ldate,
+                j.code AS lcode,
+                p.name AS partner_name,
+                m.name AS move_name,
+                l.name AS lname,
+                COALESCE(l.debit,0) AS debit,
+                COALESCE(l.credit,0) AS credit,
+                COALESCE(l.debit - l.credit,0) AS line_balance,
+                SUM(COALESCE(l.debit - l.credit,0)) OVER (
+                    PARTITION BY l.account_id ORDER BY {order}
+                    ROWS UNBOUNDED PRECEDING) AS balance,
+                COALESCE(l.amount_currency,0) AS amount_currency
+            FROM account_move_line l
+            JOIN unnest(%(ks_account_ids)s::int[]) WITH ORDINALITY AS ks_acc(id, seq) ON (l.account_id=ks_acc.id)
+            JOIN account_move m ON (l.move_id=m.id)
+            JOIN account_account a ON (l.account_id=a.id)
+            LEFT JOIN res_partner p ON (l.partner_id=p.id)
+            JOIN account_journal j ON (l.journal_id=j.id)
+            WHERE {where}
+                AND l.date <= %(ks_end_date)s
+            ORDER BY ks_acc.seq, {order}
+        ''').format(order=KS_ORDER_BY_CURRENT, where=WHERE)
+        return sql, ks_params
+
+    def ks_fetch_general_ledger_lines(self, ks_df_informations, ks_account_ids):
+        '''
+        Fetch the period move lines of the given accounts in one ordered query.
+        :param ks_account_ids: list of account ids whose lines are unfolded
+        :return: dict {account_id: [lines]}, line balances start from zero for each account
+        '''
+        ks_res = {}
+        if not ks_account_ids:
+            return ks_res
+        sql, ks_params = self._ks_general_ledger_lines_query(ks_df_informations, ks_account_ids)
+        self.env.cr.execute(sql, ks_params)
+        for ks_row in self.env.cr.dictfetchall():
+            ks_row['initial_bal'] = False
+            ks_row['ending_bal'] = False
+            ks_res.setdefault(ks_row['account_id'], []).append(ks_row)
+        return ks_res
+
+    def ks_iter_query_rows(self, sql, ks_params, ks_chunk_size=KS_STREAM_CHUNK_SIZE):
+        '''
+        Iterate over the rows of a query through a server side cursor, so only ks_chunk_size
+        rows are held in memory at a time whatever the size of the result.
+        '''
+        ks_cursor_name = 'ks_stream_%s' % uuid.uuid4().hex
+        self.env.cr.execute('DECLARE ' + ks_cursor_name + ' NO SCROLL CURSOR FOR ' + sql, ks_params)
+        try:
+            while True:
+                self.env.cr.execute('FETCH FORWARD %s FROM ' + ks_cursor_name, (ks_chunk_size,))
+                ks_rows = self.env.cr.dictfetchall()
+                if not ks_rows:
+                    break
+                yield from ks_rows
+        finally:
+            self.env.cr.execute('CLOSE ' + ks_cursor_name)
+
+    def _ks_general_ledger_accounts(self, ks_df_informations):
+        '''
+        Accounts displayed in the General Ledger, sorted by code, with their balances
+        :return: (account.account, {account_id: balances})
+        '''
+        ks_account_ids = self.env['account.account'].sudo().search(self.ks_df_where_clause(ks_df_informations)[1])
+        ks_company_id = self.env['res.company'].sudo().browse(ks_df_informations.get('company_id'))
+        ks_balances = self.ks_fetch_general_ledger_balances(ks_df_informations, ks_account_ids.ids)
+        # with the initial balance, an account without movement in the period is still displayed
+        # when it has an opening balance, as its ending figures include it
+        ks_prefix = 'ending_' if ks_df_informations.get('initial_balance') else 'period_'
+        ks_displayed_accounts = self.env['account.account']
+        for ks_account in ks_account_ids.filtered(lambda a: a.id in ks_balances):
+            ks_currency = ks_account.company_id.currency_id or ks_company_id.currency_id
+            if not (ks_currency.is_zero(ks_balances[ks_account.id][ks_prefix + 'debit'])
+                    and ks_currency.is_zero(ks_balances[ks_account.id][ks_prefix + 'credit'])):
+                ks_displayed_accounts |= ks_account
+        return ks_displayed_accounts.sorted(lambda a: a.code), ks_balances
+
+    def _ks_general_ledger_account_values(self, ks_df_informations, ks_account, ks_balance):
+        '''
+        Summary line of an account of the General Ledger, without its detail lines
+        '''
+        ks_company_id = self.env['res.company'].sudo().browse(ks_df_informations.get('company_id'))
+        ks_currency = ks_account.company_id.currency_id or ks_company_id.currency_id
+        if ks_df_informations.get('initial_balance'):
+            ks_ending = {ks_field: ks_balance['ending_' + ks_field] for ks_field in ('debit', 'credit', 'balance')}
+        else:
+            ks_ending = {ks_field: ks_balance['period_' + ks_field] for ks_field in ('debit', 'credit', 'balance')}
+        ks_initial_balance = 0.0
+        if self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal') and \
+                ks_df_informations['date']['ks_process'] == 'range' and \
+                ks_account.internal_group not in ['income', 'expense']:
+            ks_initial_balance = ks_balance['initial_balance']
+        return {
+            'name': ks_account.name,
+            'code': ks_account.code,
+            'id': ks_account.id,
+            'initial_balance': ks_initial_balance,
+            'debit': ks_ending['debit'],
+            'credit': ks_ending['credit'],
+            'balance': ks_ending['balance'] + ks_initial_balance,
+            'company_currency_id': ks_currency.id,
+            'company_currency_symbol': ks_currency.symbol,
+            'company_currency_precision': ks_currency.rounding,
+            'company_currency_position': ks_currency.position,
+            'count': ks_balance['count'],
+            'pages': self.ks_fetch_page_list(ks_balance['count']),
+            'single_page': True if ks_balance['count'] <= FETCH_RANGE else False,
+        }
+
+    def _ks_general_ledger_account_lines(self, ks_df_informations, ks_account, ks_balance, ks_rows):
+        '''
+        Detail lines of an account of the General Ledger: the initial balance, the move lines
+        with their running balance and the ending balance
+        :param ks_rows: iterable of the rows of _ks_general_ledger_lines_query for the account
+        '''
+        ks_opening_balance = 0
+        if ks_df_informations.get('initial_balance'):
+            ks_opening_balance = ks_balance['initial_balance']
+            yield {
+                'move_name': 'Initial Balance',
+                'account_id': ks_account.id,
+                'initial_bal': True,
+                'ending_bal': False,
+                'debit': ks_balance['initial_debit'],
+                'credit': ks_balance['initial_credit'],
+                'balance': ks_balance['initial_balance'],
+            }
+        for ks_row in ks_rows:
+            ks_row['balance'] += ks_opening_balance
+            ks_row['initial_bal'] = False
+            ks_row['ending_bal'] = False
+            yield ks_row
+
+        if ks_df_informations.get('initial_balance'):
+            ks_ending = {ks_field: ks_balance['ending_' + ks_field] for ks_field in ('debit', 'credit', 'balance')}
+        else:
+            ks_ending = {ks_field: ks_balance['period_' + ks_field] for ks_field in ('debit', 'credit', 'balance')}
+        ks_ending.update({'ending_bal': True, 'initial_bal': False})
+        yield ks_ending
+
+    def ks_iter_general_ledger(self, ks_df_informations):
+        '''
+        Streaming counterpart of ks_process_general_ledger for the exports. Yields the summary
+        line of each account with an iterator over its detail lines, the move lines being read
+        chunk by chunk from a server side cursor. The detail lines of an account must be consumed
+        before the next account is requested.
+        :return: generator of (account values, lines)
+        '''
+        ks_accounts, ks_balances = self._ks_general_ledger_accounts(ks_df_informations)
+        ks_groups = iter(())
+        if ks_df_informations.get('ks_report_with_lines') and ks_accounts:
+            sql, ks_params = self._ks_general_ledger_lines_query(ks_df_informations, ks_accounts.ids)
+            ks_groups = itertools.groupby(self.ks_iter_query_rows(sql, ks_params), key=lambda r: r['account_id'])
+        ks_group = next(ks_groups, None)
+        for ks_account in ks_accounts:
+            ks_balance = ks_balances[ks_account.id]
+            ks_rows = ()
+            if ks_group and ks_group[0] == ks_account.id:
+                ks_rows = ks_group[1]
+                ks_group = None
+            ks_lines = ()
+            if ks_df_informations.get('ks_report_with_lines'):
+                ks_lines = self._ks_general_ledger_account_lines(ks_df_informations, ks_account, ks_balance, ks_rows)
+            yield self._ks_general_ledger_account_values(ks_df_informations, ks_account, ks_balance), ks_lines
+            if ks_group is None:
+                ks_group = next(ks_groups, None)
+
     def ks_process_general_ledger(self, ks_df_informations):
         '''
         It is the method for showing summary details of each accounts. Just basic details to show up
@@ -724,194 +1200,36 @@ class ks_dynamic_financial_base(models.Model):
         1. Initial Balance
         2. Current Balance
         3. Final Balance
+        The balances of all accounts come from one grouped query. Detail lines are only fetched when
+        the report is printed with lines, the web view loads them on unfold through
+        ks_build_detailed_gen_move_lines.
         :return:
         '''
-        cr = self.env.cr
-        WHERE = self.ks_df_where_clause(ks_df_informations)[0]
-        ks_account_ids = self.env['account.account'].sudo().search(self.ks_df_where_clause(ks_df_informations)[1])
-        ks_move_lines = {
-            x.code: {
-                'name': x.name,
-                'code': x.code,
-                'company_currency_id': 0,
-                'company_currency_symbol': 'AED',
-                'company_currency_precision': 0.0100,
-                'company_currency_position': 'after',
-                'id': x.id,
-                'lines': []
-            } for x in sorted(ks_account_ids, key=lambda a: a.code)
-        }  # base for accounts to display
-        for ks_account in ks_account_ids:
-            ks_company_id = self.env['res.company'].sudo().browse(ks_df_informations.get('company_id'))
-            ks_currency = ks_account.company_id.currency_id or ks_company_id.currency_id
-            ks_symbol = ks_currency.symbol
-            ks_rounding = ks_currency.rounding
-            ks_position = ks_currency.position
-
-            ks_opening_balance = 0
-            KS_WHERE_INIT = WHERE
-            if ks_df_informations['date']['ks_process'] == 'range':
-                KS_WHERE_INIT = KS_WHERE_INIT + " AND l.date < '%s'" % ks_df_informations['date'].get('ks_start_date')
-            # else:
-            # KS_WHERE_INIT += " AND l.account_id = %s" % ks_account.id
-            KS_WHERE_INIT += " AND l.code = %s" % "\'" + ks_account.code + '\''
-            if ks_df_informations.get('sort_accounts_by') == 'date':
-                KS_ORDER_BY_CURRENT = 'l.date, l.move_id'
-            else:
-                KS_ORDER_BY_CURRENT = 'j.code, p.name, l.move_id'
-            if ks_df_informations.get('initial_balance'):
-                sql = ('''
-                    SELECT 
-                        COALESCE(SUM(l.debit),0) AS debit, 
-                        COALESCE(SUM(l.credit),0) AS credit, 
-                        COALESCE(SUM(l.debit - l.credit),0) AS balance
-                    FROM account_move_line l
-                    JOIN account_move m ON (l.move_id=m.id)
-                    JOIN account_account a ON (l.account_id=a.id)
-                   
-                    LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                    LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                    JOIN account_journal j ON (l.journal_id=j.id)
-                    WHERE %s
-                ''') % KS_WHERE_INIT
-                cr.execute(sql)
-                for ks_row in cr.dictfetchall():
-                    ks_row['move_name'] = 'Initial Balance'
-                    ks_row['account_id'] = ks_account.id
-                    ks_row['initial_bal'] = True
-                    ks_row['ending_bal'] = False
-                    ks_opening_balance += ks_row['balance']
-                    ks_move_lines[ks_account.code]['lines'].append(ks_row)
-            if ks_df_informations['date']['ks_process'] == 'range':
-                KS_WHERE_CURRENT = WHERE + " AND l.date >= '%s'" % ks_df_informations['date'].get(
-                    'ks_start_date') + " AND l.date <= '%s'" % ks_df_informations['date'].get('ks_end_date')
-            else:
-                KS_WHERE_CURRENT = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get('ks_end_date')
-            # KS_WHERE_CURRENT += " AND a.id = %s" % ks_account.id
-            KS_WHERE_CURRENT += " AND a.code = %s" % "\'" + ks_account.code + '\''
-            sql = ('''
-                SELECT
-                    l.id AS lid,
-                    l.date AS ldate,
-                    j.code AS lcode,
-                    p.name AS partner_name,
-                    m.name AS move_name,
-                    l.name AS lname,
-                    COALESCE(l.debit,0) AS debit,
-                    COALESCE(l.credit,0) AS credit,
-                    COALESCE(l.debit - l.credit,0) AS balance,
-                    COALESCE(l.amount_currency,0) AS amount_currency
-                FROM account_move_line l
-                JOIN account_move m ON (l.move_id=m.id)
-                JOIN account_account a ON (l.account_id=a.id)
-           
-                LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                LEFT JOIN res_currency cc ON (l.company_currency_id=cc.id)
-                LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                JOIN account_journal j ON (l.journal_id=j.id)
-                WHERE %s
-                GROUP BY l.id, l.account_id, l.date, j.code, l.currency_id, l.ref, l.name, m.id, m.name, c.rounding, cc.rounding, cc.position, c.position, c.symbol, cc.symbol, p.name
-                ORDER BY %s
-            ''') % (KS_WHERE_CURRENT, KS_ORDER_BY_CURRENT)
-            cr.execute(sql)
-            ks_current_lines = cr.dictfetchall()
-            for ks_row in ks_current_lines:
-                ks_row['initial_bal'] = False
-                ks_row['ending_bal'] = False
-
-                ks_current_balance = ks_row['balance']
-                ks_row['balance'] = ks_opening_balance + ks_current_balance
-                ks_opening_balance += ks_current_balance
-                ks_row['initial_bal'] = False
-
-                ks_move_lines[ks_account.code]['lines'].append(ks_row)
-            if ks_df_informations.get('initial_balance') and ks_df_informations['date']['ks_process'] == 'range':
-                KS_WHERE_FULL = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get('ks_start_date')
-            else:
-                if ks_df_informations['date']['ks_process'] == 'range':
-                    KS_WHERE_FULL = WHERE + " AND l.date >= '%s'" % ks_df_informations['date'].get(
-                        'ks_start_date') + " AND l.date <= '%s'" % ks_df_informations['date'].get('ks_end_date')
-                else:
-                    KS_WHERE_FULL = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get('ks_end_date')
-            # KS_WHERE_FULL += " AND a.id = %s" % ks_account.id
-            KS_WHERE_FULL += " AND a.code = %s" % "\'" + ks_account.code + '\''
-            sql = ('''
-                SELECT 
-                    COALESCE(SUM(l.debit),0) AS debit, 
-                    COALESCE(SUM(l.credit),0) AS credit, 
-                    COALESCE(SUM(l.debit - l.credit),0) AS balance
-                FROM account_move_line l
-                JOIN account_move m ON (l.move_id=m.id)
-                JOIN account_account a ON (l.account_id=a.id)
-            
-                LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                JOIN account_journal j ON (l.journal_id=j.id) 
-                WHERE %s
-            ''') % KS_WHERE_FULL
-
-            initial_bal_data = []
-            if self.env['ir.config_parameter'].sudo().get_param(
-                    'ks_enable_ledger_in_bal') and ks_account.internal_group not in ['income', 'expense'] and \
-                    ks_df_informations['date']['ks_process'] == 'range':
-                KS_INIT_BAL_WHERE_FULL = WHERE + " AND l.date < '%s'" % ks_df_informations['date'].get('ks_start_date')
-                KS_INIT_BAL_WHERE_FULL += " AND a.code = %s" % "\'" + ks_account.code + '\''
-                ks_init_bal_sql = ('''
-                                    SELECT 
-                                        COALESCE(SUM(l.debit),0) AS debit, 
-                                        COALESCE(SUM(l.credit),0) AS credit, 
-                                        COALESCE(SUM(l.debit - l.credit),0) AS initial_balance
-                                    FROM account_move_line l
-                                    JOIN account_move m ON (l.move_id=m.id)
-                                    JOIN account_account a ON (l.account_id=a.id)
-                                   
-                                    LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                                    LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                                    JOIN account_journal j ON (l.journal_id=j.id) 
-                                    WHERE %s
-                                ''') % KS_INIT_BAL_WHERE_FULL
-                cr.execute(ks_init_bal_sql)
-                initial_bal_data = cr.dictfetchall()
+        ks_displayed_accounts, ks_balances = self._ks_general_ledger_accounts(ks_df_informations)
+        ks_detail_lines = {}
+        if ks_df_informations.get('ks_report_with_lines'):
+            ks_detail_lines = self.ks_fetch_general_ledger_lines(ks_df_informations, ks_displayed_accounts.ids)
 
-            cr.execute(sql)
-            for ks_row in cr.dictfetchall():
-                if ks_currency.is_zero(ks_row['debit']) and ks_currency.is_zero(ks_row['credit']):
-                    ks_move_lines.pop(ks_account.code, None)
-                else:
-                    ks_row['ending_bal'] = True
-                    ks_row['initial_bal'] = False
-                    ks_move_lines[ks_account.code]['lines'].append(ks_row)
-                    ks_move_lines[ks_account.code]['initial_balance'] = initial_bal_data[0].get('initial_balance', 0.0) \
-                        if len(initial_bal_data) > 0 else 0.0
-                    ks_move_lines[ks_account.code]['debit'] = ks_row['debit']
-                    ks_move_lines[ks_account.code]['credit'] = ks_row['credit']
-                    ks_move_lines[ks_account.code]['balance'] = ks_row['balance'] + ks_move_lines[ks_account.code][
-                        'initial_balance']
-                    ks_move_lines[ks_account.code]['company_currency_id'] = ks_currency.id
-                    ks_move_lines[ks_account.code]['company_currency_symbol'] = ks_symbol
-                    ks_move_lines[ks_account.code]['company_currency_precision'] = ks_rounding
-                    ks_move_lines[ks_account.code]['company_currency_position'] = ks_position
-                    ks_move_lines[ks_account.code]['count'] = len(ks_current_lines)
-                    ks_move_lines[ks_account.code]['pages'] = self.ks_fetch_page_list(len(ks_current_lines))
-                    ks_move_lines[ks_account.code]['single_page'] = True if len(
-                        ks_current_lines) <= FETCH_RANGE else False
-                    for i in range(0, len(ks_move_lines[ks_account.code]['lines'])):
-                        lang = self.env.user.lang
-                        lang_id = self.env['res.lang'].search([('code', '=', lang)])['date_format'].replace('/', '-')
-                        if ks_move_lines[ks_account.code]['lines'][i].get('ldate') != None:
-                            ks_move_lines[ks_account.code]['lines'][i]['ldate'] = datetime.datetime.strptime(
-                                (ks_move_lines[ks_account.code]['lines'][i]['ldate']).strftime(lang_id), lang_id).date()
+        lang = self.env.user.lang
+        lang_id = self.env['res.lang'].search([('code', '=', lang)])['date_format'].replace('/', '-')
+        ks_move_lines = {}  # base for accounts to display
+        for ks_account in ks_displayed_accounts:
+            ks_balance = ks_balances[ks_account.id]
+            ks_lines = list(self._ks_general_ledger_account_lines(
+                ks_df_informations, ks_account, ks_balance, ks_detail_lines.get(ks_account.id, [])))
+            for ks_row in ks_lines:
+                if ks_row.get('ldate') is not None:
+                    ks_row['ldate'] = datetime.datetime.strptime(ks_row['ldate'].strftime(lang_id), lang_id).date()
+            ks_move_lines[ks_account.code] = dict(
+                self._ks_general_ledger_account_values(ks_df_informations, ks_account, ks_balance), lines=ks_lines)
 
         return ks_move_lines, 0.0, 0.0, 0.0
 
     def ks_df_where_clause(self, ks_df_informations):
-        WHERE = self.ks_df_build_where_clause(ks_df_informations)
-        if ks_df_informations.get('ks_posted_entries') and not ks_df_informations.get('ks_unposted_entries'):
-            WHERE += " AND m.state = 'posted'"
-        elif ks_df_informations.get('ks_unposted_entries') and not ks_df_informations.get('ks_posted_entries'):
-            WHERE += " AND m.state = 'draft'"
-        else:
-            WHERE += " AND m.state IN ('posted', 'draft') "
+        '''
+        :return: (KsSqlFilter of the move lines, domain of the accounts to display)
+        '''
+        ks_filter = self.ks_df_build_filter(ks_df_informations)
 
         ks_df_account_company_domain = [('company_id', 'in', ks_df_informations.get('company_ids'))]
 
@@ -921,7 +1239,7 @@ class ks_dynamic_financial_base(models.Model):
         account_ids = ks_df_informations.get('account_ids', [])
         if account_ids and any(account_ids):
             ks_df_account_company_domain.append(('id', 'in', account_ids))
-        return WHERE, ks_df_account_company_domain
+        return ks_filter, ks_df_account_company_domain
 
     def ks_executive_where(self, ks_df_informations):
         ks_move_where = ''
@@ -1760,42 +2078,20 @@ class ks_dynamic_financial_base(models.Model):
 
     # Method to fetch data for trial balance
     def ks_process_trial_balance(self, ks_df_informations):
-        ks_domain = False
-        ksaccount_ids = []
-
         if ks_df_informations:
             cr = self.env.cr
-            WHERE = self.ks_df_build_where_clause(ks_df_informations)
-
-            if 'a.id' in WHERE:
-                ks_where = WHERE
-                ks_where = ks_where.replace(')', ']')
-                ks_where = ks_where.replace('(', '[')
-                regex = r"[^[]*\[([^]]*)\]"
-                ks_match = re.findall(regex, ks_where)
-                for i in ks_match:
-                    if 'a.id' in i:
-                        ks_domain = i
-                        if 'OR' in i:
-                            temp = i.split('OR')
-                            for j in temp:
-                                ksaccount_ids.append(j.split('=')[-1])
-                        else:
-                            ksaccount_ids.append(i.split('=')[-1])
+            ks_filter = self.ks_df_build_filter(ks_df_informations)
+            ksaccount_ids = ks_filter.ks_get('ks_filter_account_ids', [])
+            ks_disable_trial_en_bal = self.env['ir.config_parameter'].sudo().get_param('ks_disable_trial_en_bal', False)
 
             ks_account_type_ids = False
-            ks_temp_domain = ks_domain
-            if self.env['ir.config_parameter'].sudo().get_param('ks_disable_trial_en_bal', False) and ks_domain:
-                for ksaccountid in ksaccount_ids:
-                    ksaccount = self.env['account.account'].sudo().browse(int(ksaccountid))
-                    if ksaccount.account_type == 'equity_unaffected':
-
-                        ks_account_type_ids = self.env['account.account'].search(
-                            ["|", ('account_type', 'ilike', 'Income'), ('account_type', 'ilike', 'Expenses')])
-                        for ks_account_type_id in ks_account_type_ids:
-                            if ks_account_type_id.id not in ksaccount_ids:
-                                ks_temp_domain += " OR a.id = " + str(ks_account_type_id.id)
-                WHERE = WHERE.replace(ks_domain, ks_temp_domain)
+            if ks_disable_trial_en_bal and ksaccount_ids:
+                if 'equity_unaffected' in self.env['account.account'].sudo().browse(ksaccount_ids).mapped(
+                        'account_type'):
+                    ks_account_type_ids = self.env['account.account'].search(
+                        ["|", ('account_type', 'ilike', 'Income'), ('account_type', 'ilike', 'Expenses')])
+                    ks_filter.ks_params['ks_filter_account_ids'] = ksaccount_ids + [
+                        ks_id for ks_id in ks_account_type_ids.ids if ks_id not in ksaccount_ids]
 
             ks_account_ids = self.env['account.account'].sudo().search([])
             ks_company_id = self.env['res.company'].sudo().browse(ks_df_informations.get('company_id'))
@@ -1833,29 +2129,42 @@ class ks_dynamic_financial_base(models.Model):
             ks_total_init_deb = 0.0
             ks_total_init_cre = 0.0
             ks_total_init_bal = 0.0
+            ks_current_date = ks_df_informations['ks_differ'] if self.ks_dif_filter_bool else ks_df_informations['date']
+            ks_params = ks_filter.ks_query_params(
+                ks_start_date=ks_df_informations['date'].get('ks_start_date'),
+                ks_current_start_date=ks_current_date.get('ks_start_date'),
+                ks_current_end_date=ks_current_date.get('ks_end_date'),
+            )
+            if self.ks_date_filter.get('ks_process') == 'range':
+                KS_INIT_COND = "l.date < %(ks_start_date)s"
+                KS_CURRENT_COND = "l.date >= %(ks_current_start_date)s AND l.date <= %(ks_current_end_date)s"
+            else:
+                KS_INIT_COND = "FALSE"
+                KS_CURRENT_COND = "l.date <= %(ks_current_end_date)s"
+            # initial and current figures of every account code in one grouped query
+            sql = ('''
+                SELECT
+                    a.code AS code,
+                    COALESCE(SUM(l.debit) FILTER (WHERE {init}),0) AS initial_debit,
+                    COALESCE(SUM(l.credit) FILTER (WHERE {init}),0) AS initial_credit,
+                    COALESCE(SUM(l.debit - l.credit) FILTER (WHERE {init}),0) AS initial_balance,
+                    COALESCE(SUM(l.debit) FILTER (WHERE {current}),0) AS debit,
+                    COALESCE(SUM(l.credit) FILTER (WHERE {current}),0) AS credit,
+                    COALESCE(SUM(l.debit - l.credit) FILTER (WHERE {current}),0) AS balance
+                FROM account_move_line l
+                JOIN account_move m ON (l.move_id=m.id)
+                JOIN account_account a ON (l.account_id=a.id)
+                LEFT JOIN res_partner p ON (l.partner_id=p.id)
+                JOIN account_journal j ON (l.journal_id=j.id)
+                WHERE {where}
+                GROUP BY a.code
+            ''').format(init=KS_INIT_COND, current=KS_CURRENT_COND, where=ks_filter.ks_where())
+            cr.execute(sql, ks_params)
+            ks_code_balances = {ks_row['code']: ks_row for ks_row in cr.dictfetchall()}
+            ks_no_balance = dict.fromkeys(
+                ('initial_debit', 'initial_credit', 'initial_balance', 'debit', 'credit', 'balance'), 0.0)
             for ks_account in ks_account_ids:
-                KS_WHERE_INIT = WHERE + " AND l.date < '%s'" % ks_df_informations['date'].get('ks_start_date')
-                # KS_WHERE_INIT += " AND l.account_id = %s" % ks_account.id
-                KS_WHERE_INIT += " AND a.code = %s" % "\'" + ks_account.code + '\''
-                ks_init_blns = {}
-                if self.ks_date_filter.get('ks_process') == 'range':
-                    sql = ('''
-                                    SELECT
-                                        COALESCE(SUM(l.debit),0) AS initial_debit,
-                                        COALESCE(SUM(l.credit),0) AS initial_credit,
-                                        COALESCE(SUM(l.debit),0) - COALESCE(SUM(l.credit),0) AS initial_balance
-                                    FROM account_move_line l
-                                    JOIN account_move m ON (l.move_id=m.id)
-                                    JOIN account_account a ON (l.account_id=a.id)
-
-                                    LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                                    LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                                    JOIN account_journal j ON (l.journal_id=j.id)
-                                    WHERE %s
-                                ''') % KS_WHERE_INIT
-                    cr.execute(sql)
-                    ks_init_blns = cr.dictfetchone()
-
+                ks_init_blns = ks_code_balances.get(ks_account.code, ks_no_balance)
                 if ks_move_lines.get(ks_account.code, False):
                     ks_move_lines[ks_account.code]['initial_balance'] = ks_init_blns.get('initial_balance', 0)
                     ks_move_lines[ks_account.code]['initial_debit'] = ks_init_blns.get('initial_debit', 0)
@@ -1865,43 +2174,9 @@ class ks_dynamic_financial_base(models.Model):
                     ks_total_init_cre += ks_init_blns.get('initial_credit', 0)
                     ks_total_init_bal += ks_init_blns.get('initial_balance', 0)
 
-                    if not self.ks_dif_filter_bool:
-                        if self.ks_date_filter.get('ks_process') == 'range':
-                            KS_WHERE_CURRENT = WHERE + " AND l.date >= '%s'" % ks_df_informations['date'].get(
-                                'ks_start_date') + " AND l.date <= '%s'" % ks_df_informations['date'].get('ks_end_date')
-                        else:
-                            KS_WHERE_CURRENT = WHERE + " AND l.date <= '%s'" \
-                                               % ks_df_informations['date'].get('ks_end_date')
-                    if self.ks_dif_filter_bool:
-                        if self.ks_date_filter.get('ks_process') == 'range':
-                            KS_WHERE_CURRENT = WHERE + " AND l.date >= '%s'" % ks_df_informations['ks_differ'].get(
-                                'ks_start_date') + " AND l.date <= '%s'" % ks_df_informations['ks_differ'].get(
-                                'ks_end_date')
-                        else:
-                            KS_WHERE_CURRENT = WHERE + " AND l.date <= '%s'" % ks_df_informations['ks_differ'].get(
-                                'ks_end_date')
-                    # KS_WHERE_CURRENT += " AND a.id = %s" % ks_account.id
-                    KS_WHERE_CURRENT += " AND a.code = %s" % "\'" + ks_account.code + '\''
-                    sql = ('''
-                                    SELECT
-                                        COALESCE(SUM(l.debit),0) AS debit,
-                                        COALESCE(SUM(l.credit),0) AS credit,
-                                        COALESCE(SUM(l.debit),0) - COALESCE(SUM(l.credit),0) AS balance
-                                    FROM account_move_line l
-                                    JOIN account_move m ON (l.move_id=m.id)
-                                    JOIN account_account a ON (l.account_id=a.id)
-                            
-
-                                    LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                                    LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                                    JOIN account_journal j ON (l.journal_id=j.id)
-                                    WHERE %s
-                                ''') % KS_WHERE_CURRENT
-                    cr.execute(sql)
-                    ks_op = cr.dictfetchone()
-                    ks_deb = ks_op['debit']
-                    ks_cre = ks_op['credit']
-                    ks_bln = ks_op['balance']
+                    ks_deb = ks_init_blns['debit']
+                    ks_cre = ks_init_blns['credit']
+                    ks_bln = ks_init_blns['balance']
                     ks_move_lines[ks_account.code]['debit'] = ks_deb
                     ks_move_lines[ks_account.code]['credit'] = ks_cre
                     ks_move_lines[ks_account.code]['balance'] = ks_bln
@@ -1914,7 +2189,7 @@ class ks_dynamic_financial_base(models.Model):
                     ks_move_lines[ks_account.code]['ending_credit'] = ks_end_cr
                     ks_move_lines[ks_account.code]['ending_debit'] = ks_end_dr
 
-                    if self.env['ir.config_parameter'].sudo().get_param('ks_disable_trial_en_bal', False) and \
+                    if ks_disable_trial_en_bal and \
                             (ks_account.internal_group == 'income' or ks_account.internal_group == 'expense') and \
                             self.ks_date_filter.get('ks_process') == 'range':
                         if ks_account.code not in ks_initial_account_code:
@@ -1953,12 +2228,11 @@ class ks_dynamic_financial_base(models.Model):
                     elif ks_company_currency_id.is_zero(ks_end_cr) and ks_company_currency_id.is_zero(ks_end_dr):
                         ks_move_lines.pop(ks_account.code)
 
-            if self.env['ir.config_parameter'].sudo().get_param('ks_disable_trial_en_bal', False) \
-                    and ks_account_type_id.id and self.ks_date_filter.get('ks_process') == 'range':
+            if ks_disable_trial_en_bal and ks_account_type_id.id and self.ks_date_filter.get('ks_process') == 'range':
                 ks_initial_account_line['initial_balance'] = ks_initial_account_line['initial_debit'] - \
                                                              ks_initial_account_line['initial_credit']
                 ks_move_lines[ks_account_type_id.code] = ks_initial_account_line
-                if 'a.id' in WHERE and str(ks_account_type_id.id) not in WHERE:
+                if ksaccount_ids and ks_account_type_id.id not in ks_filter.ks_get('ks_filter_account_ids'):
                     if ks_move_lines.get(ks_account_type_id.code, False):
                         ks_move_lines.pop(ks_account_type_id.code)
             for code in ks_initial_account_code:
@@ -1991,8 +2265,6 @@ class ks_dynamic_financial_base(models.Model):
     def ks_process_tax_report(self, ks_df_informations):
         if ks_df_informations:
             cr = self.env.cr
-            WHERE = self.ks_df_build_where_clause(ks_df_informations)
-            KS_WHERE_INIT = WHERE + " AND l.date < '%s'" % ks_df_informations['date'].get('ks_start_date')
             ks_company_id = self.env['res.company'].sudo().browse(ks_df_informations.get('company_id'))
             ks_company_currency_id = ks_company_id.currency_id
             ks_data = self.ks_get_tax_line(ks_df_informations)
@@ -2457,14 +2729,72 @@ class ks_dynamic_financial_base(models.Model):
                 ks_periods_options_list.append(ks_period_options)
         return ks_periods_options_list
 
-    def ks_build_detailed_gen_move_lines(self, offset=0, ks_account=0, ks_df_informations=False,
-                                         fetch_range=FETCH_RANGE):
+    def _ks_fetch_keyset_page(self, ks_select, ks_from, WHERE, ks_sort_keys, ks_params, ks_cursor=False,
+                              ks_skip=0, fetch_range=FETCH_RANGE):
+        '''
+        Fetch one page of detail lines by keyset pagination. The lines are ordered by ks_sort_keys,
+        which must be unique together, and the page starts right after the key of the last line of
+        the previous page, so reading a page costs the same whatever its depth.
+        When no cursor is given but ks_skip lines must be skipped (direct jump to a page), the key
+        and running balance of the last skipped line are found by one windowed query.
+        :param ks_select: SELECT list of the lines
+        :param ks_from: FROM and JOIN clauses
+        :param ks_sort_keys: list of SQL expressions defining the order of the lines
+        :param ks_cursor: dict returned with the previous page, holding its last 'key'
+        :return: (lines, balance of the skipped lines, key of the last line or False)
+        '''
+        cr = self.env.cr
+        ks_keys = ', '.join(ks_sort_keys)
+        ks_key_columns = ', '.join('%s AS ks_key_%s' % (ks_key, i) for i, ks_key in enumerate(ks_sort_keys))
+        ks_params = dict(ks_params)
+        ks_skipped_balance = 0.0
+        ks_last_key = ks_cursor and ks_cursor.get('key')
+        if not ks_last_key and ks_skip:
+            cr.execute(('''
+                SELECT {key_columns},
+                    SUM(COALESCE(l.debit - l.credit,0)) OVER (ORDER BY {keys} ROWS UNBOUNDED PRECEDING) AS ks_running
+                {from_clause}
+                WHERE {where}
+                ORDER BY {keys}
+                OFFSET %(ks_skip)s ROWS
+                FETCH FIRST 1 ROWS ONLY
+            ''').format(key_columns=ks_key_columns, keys=ks_keys, from_clause=ks_from, where=WHERE),
+                dict(ks_params, ks_skip=ks_skip - 1))
+            ks_row = cr.dictfetchone()
+            if not ks_row:
+                return [], 0.0, False
+            ks_last_key = [ks_row['ks_key_%s' % i] for i in range(len(ks_sort_keys))]
+            ks_skipped_balance = ks_row['ks_running']
+        if ks_last_key:
+            ks_params.update({'ks_key_%s' % i: ks_value for i, ks_value in enumerate(ks_last_key)})
+            WHERE += ' AND (%s) > (%s)' % (ks_keys, ', '.join('%%(ks_key_%s)s' % i for i in range(len(ks_sort_keys))))
+        cr.execute(('''
+            SELECT {select}, {key_columns}
+            {from_clause}
+            WHERE {where}
+            ORDER BY {keys}
+            FETCH FIRST %(ks_fetch_range)s ROWS ONLY
+        ''').format(select=ks_select, key_columns=ks_key_columns, keys=ks_keys, from_clause=ks_from, where=WHERE),
+            dict(ks_params, ks_fetch_range=fetch_range))
+        ks_rows = cr.dictfetchall()
+        if ks_rows:
+            ks_last_key = [ks_rows[-1]['ks_key_%s' % i] for i in range(len(ks_sort_keys))]
+        for ks_row in ks_rows:
+            for i in range(len(ks_sort_keys)):
+                del ks_row['ks_key_%s' % i]
+        return ks_rows, ks_skipped_balance, ks_last_key
+
+    def ks_build_detailed_gen_move_lines(self, offset=0, ks_account=0, ks_df_informations=False,
+                                         fetch_range=FETCH_RANGE, ks_cursor=False):
         '''
         It is used for showing detailed move lines as sub lines. It is defered loading compatable
         :param offset: It is nothing but page numbers. Multiply with fetch_range to get final range
         :param account: Integer - Account_id
         :param fetch_range: Global Variable. Can be altered from calling model
-        :return: count(int-Total rows without offset), offset(integer), ks_move_lines(list of dict)
+        :param ks_cursor: cursor returned with the previous page. The page is then read by keyset
+                          after its last line, and the count and balances it carries are reused
+        :return: count(int-Total rows without offset), offset(integer), ks_move_lines(list of dict),
+                 cursor of the next page
 
         Three sections,
         1. Initial Balance
@@ -2473,272 +2803,143 @@ class ks_dynamic_financial_base(models.Model):
         '''
         cr = self.env.cr
         ks_offset_count = offset * fetch_range
-        count = 0
-        ks_opening_balance = 0
-
-        ks_company_id = self.env.user.company_id
-        ks_currency_id = ks_company_id.currency_id
-
-        WHERE = self.ks_df_build_where_clause(ks_df_informations)
-        KSINITWHERE = WHERE
-        KS_WHERE_INIT = WHERE
-        if ks_df_informations['date']['ks_process'] == 'range':
-            KS_WHERE_INIT = KS_WHERE_INIT + " AND l.date < '%s'" % ks_df_informations['date'].get('ks_start_date')
-            KS_WHERE_CURRENT = WHERE + " AND l.date >= '%s'" % ks_df_informations['date'].get(
-                'ks_start_date') + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                'ks_end_date')
-        else:
-            KS_WHERE_CURRENT = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                'ks_end_date')
-
-        KS_WHERE_INIT += " AND l.account_id = %s" % ks_account
-        # KS_WHERE_INIT += WHERE
-
-        KS_WHERE_CURRENT += " AND a.id = %s" % ks_account
-        KSINITWHERE += " AND a.id = %s" % ks_account
-
+        ks_cursor = ks_cursor or {}
+        ks_currency_id = self.env.user.company_id.currency_id
+        ks_is_range = ks_df_informations['date']['ks_process'] == 'range'
+        ks_filter = self.ks_df_build_filter(ks_df_informations)
+        ks_params = ks_filter.ks_query_params(
+            ks_account=ks_account,
+            ks_start_date=ks_df_informations['date'].get('ks_start_date'),
+            ks_end_date=ks_df_informations['date'].get('ks_end_date') or fields.Date.context_today(self),
+        )
+
+        WHERE = ks_filter.ks_where('l.account_id = %(ks_account)s')
+        KS_WHERE_INIT = WHERE + " AND l.date < %(ks_start_date)s"
+        KS_WHERE_CURRENT = WHERE + " AND l.date <= %(ks_end_date)s"
+        if ks_is_range:
+            KS_WHERE_CURRENT += " AND l.date >= %(ks_start_date)s"
         if ks_df_informations.get('initial_balance'):
-            KS_WHERE_FULL = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get('ks_start_date')
-            # KS_WHERE_INIT += WHERE
+            KS_WHERE_FULL = WHERE + " AND l.date <= %(ks_end_date)s"
         else:
-            KS_WHERE_FULL = WHERE + " AND l.date >= '%s'" % ks_df_informations['date'].get(
-                'ks_start_date') + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                'ks_end_date')
-        KS_WHERE_FULL += " AND a.id = %s" % ks_account
-
-        if ks_df_informations.get('sort_accounts_by') == 'date':
-            KS_ORDER_BY_CURRENT = 'l.date, l.move_id'
-        else:
-            KS_ORDER_BY_CURRENT = 'j.code, p.name, l.move_id'
-
-        ks_move_lines = []
-        if ks_df_informations.get('initial_balance'):
-            sql = ('''
-                    SELECT 
-                        COALESCE(SUM(l.debit - l.credit),0) AS balance
-                    FROM account_move_line l
-                    JOIN account_move m ON (l.move_id=m.id)
-                    JOIN account_account a ON (l.account_id=a.id)
-                    LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                    LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                    JOIN account_journal j ON (l.journal_id=j.id)
-                    WHERE %s
-                ''') % KS_WHERE_INIT
-            cr.execute(sql)
-            row = cr.dictfetchone()
-            ks_opening_balance += row.get('balance')
-
-        sql = ('''
-            SELECT 
-                COALESCE(SUM(l.debit - l.credit),0) AS balance
+            KS_WHERE_FULL = KS_WHERE_CURRENT
+        KS_FROM = '''
             FROM account_move_line l
             JOIN account_move m ON (l.move_id=m.id)
             JOIN account_account a ON (l.account_id=a.id)
             LEFT JOIN res_currency c ON (l.currency_id=c.id)
+            LEFT JOIN res_currency cc ON (l.company_currency_id=cc.id)
             LEFT JOIN res_partner p ON (l.partner_id=p.id)
             JOIN account_journal j ON (l.journal_id=j.id)
-            WHERE %s
-            GROUP BY j.code, p.name, l.date, l.move_id
-            ORDER BY %s
-            OFFSET %s ROWS
-            FETCH FIRST %s ROWS ONLY
-        ''') % (KS_WHERE_CURRENT, KS_ORDER_BY_CURRENT, 0, ks_offset_count)
-        cr.execute(sql)
-        ks_running_balance_list = cr.fetchall()
-        for ks_running_balance in ks_running_balance_list:
-            ks_opening_balance += ks_running_balance[0]
-
-        sql = ('''
-            SELECT COUNT(*)
-            FROM account_move_line l
-                JOIN account_move m ON (l.move_id=m.id)
-                JOIN account_account a ON (l.account_id=a.id)
-                LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                LEFT JOIN res_currency cc ON (l.company_currency_id=cc.id)
-                LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                JOIN account_journal j ON (l.journal_id=j.id)
-            WHERE %s
-        ''') % (KS_WHERE_CURRENT)
-        cr.execute(sql)
-        count = cr.fetchone()[0]
-        ks_initial_bal_data = 0
-        if self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal') and \
-                ks_df_informations['date']['ks_process'] == 'range':
-            KSINITWHERE_CURRENT = KSINITWHERE + " AND l.date < '%s'" % ks_df_informations['date'].get('ks_start_date')
-            KSINITWHERE_CURRENT += " AND a.internal_group not in ('income', 'expense')"
-            ks_initial_bal_sql = ('''
-                    SELECT
-                        l.id AS lid,
-                        l.account_id AS account_id,
-                        l.date AS ldate,
-                        j.code AS lcode,
-                        l.currency_id,
-                        --l.ref AS lref,
-                        l.name AS lname,
-                        m.id AS move_id,
-                        m.name AS move_name,
-                        c.symbol AS currency_symbol,
-                        c.position AS currency_position,
-                        c.rounding AS currency_precision,
-                        cc.id AS company_currency_id,
-                        cc.symbol AS company_currency_symbol,
-                        cc.rounding AS company_currency_precision,
-                        cc.position AS company_currency_position,
-                        p.name AS partner_name,
-                        COALESCE(l.debit,0) AS debit,
-                        COALESCE(l.credit,0) AS credit,
-                        COALESCE(l.debit - l.credit,0) AS balance,
-                        COALESCE(l.amount_currency,0) AS amount_currency
-                    FROM account_move_line l
-                    JOIN account_move m ON (l.move_id=m.id)
-                    JOIN account_account a ON (l.account_id=a.id)
-                    LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                    LEFT JOIN res_currency cc ON (l.company_currency_id=cc.id)
-                    LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                    JOIN account_journal j ON (l.journal_id=j.id)
-                    WHERE %s
-                    GROUP BY l.id, l.account_id, l.date, j.code, l.currency_id, l.amount_currency, l.name, m.id, m.name, c.rounding, cc.id, cc.rounding, cc.position, c.position, c.symbol, cc.symbol, p.name
-                    ORDER BY %s
-                    OFFSET %s ROWS
-                    FETCH FIRST %s ROWS ONLY
-                ''') % (KSINITWHERE_CURRENT, KS_ORDER_BY_CURRENT, ks_offset_count, fetch_range)
-            cr.execute(ks_initial_bal_sql)
-            ks_dict = cr.dictfetchall()
-            ks_temp_dict = {
-                'lcode': 'Initial Balance',
-                'partner_name': "-",
-                'move_name': "-",
-                'lname': "-",
-                'currency_id': False,
-                'currency_symbol': False,
-                'currency_position': False,
-                'company_currency_symbol': False,
-                'company_currency_id': False,
-                'amount_currency': 0,
-                'initial_balance': 0,
-                'debit': 0,
-                'credit': 0,
-                'balance': 0,
-            }
-            for row in ks_dict:
-                current_balance = row['balance']
-                row['balance'] = ks_opening_balance + current_balance
-                ks_opening_balance += current_balance
-                row['initial_balance'] = row['balance']
-                row['initial_bal'] = False
-
-                ks_temp_dict['currency_id'] = row['currency_id']
-                ks_temp_dict['currency_symbol'] = row['currency_symbol']
-                ks_temp_dict['currency_position'] = row['currency_position']
-                ks_temp_dict['company_currency_symbol'] = row['company_currency_symbol']
-                ks_temp_dict['company_currency_id'] = row['company_currency_id']
-
-                ks_temp_dict['debit'] += row['debit']
-                ks_temp_dict['credit'] += row['credit']
-                ks_temp_dict['balance'] = row['balance']
-                ks_temp_dict['initial_balance'] = row['balance']
-                ks_temp_dict['amount_currency'] += row['amount_currency']
+        '''
+        KS_SUMS = '''
+            SELECT
+                COALESCE(SUM(l.debit),0) AS debit,
+                COALESCE(SUM(l.credit),0) AS credit,
+                COALESCE(SUM(l.debit - l.credit),0) AS balance
+        '''
+        if ks_df_informations.get('sort_accounts_by') == 'date':
+            KS_SORT_KEYS = ['l.date', 'l.move_id', 'l.id']
+        else:
+            KS_SORT_KEYS = ['j.code', '(p.name IS NULL)', "COALESCE(p.name, '')", 'l.move_id', 'l.id']
 
-                ks_initial_bal_data += row['balance']
-            ks_move_lines.append(ks_temp_dict)
+        # count and opening balances are computed once, the next pages get them from the cursor
+        count = ks_cursor.get('count')
+        if count is None:
+            cr.execute('SELECT COUNT(*) ' + KS_FROM + ' WHERE ' + KS_WHERE_CURRENT, ks_params)
+            count = cr.fetchone()[0]
 
-        if (int(ks_offset_count / fetch_range) == 0) and ks_df_informations.get('initial_balance'):
-            sql = ('''
-                    SELECT 
-                        COALESCE(SUM(l.debit),0) AS debit, 
-                        COALESCE(SUM(l.credit),0) AS credit, 
-                        COALESCE(SUM(l.debit - l.credit),0) AS balance
-                    FROM account_move_line l
-                    JOIN account_move m ON (l.move_id=m.id)
-                    JOIN account_account a ON (l.account_id=a.id)
-      
-                    LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                    LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                    JOIN account_journal j ON (l.journal_id=j.id)
-                    WHERE %s
-                ''') % KS_WHERE_INIT
-            cr.execute(sql)
-            for ks_row in cr.dictfetchall():
-                ks_row['move_name'] = 'Initial Balance'
-                ks_row['account_id'] = ks_account
-                ks_row['company_currency_id'] = ks_currency_id.id
-                ks_move_lines.append(ks_row)
-        sql = ('''
-                SELECT
-                    l.id AS lid,
-                    l.account_id AS account_id,
-                    l.date AS ldate,
-                    j.code AS lcode,
-                    l.currency_id,
-                    --l.ref AS lref,
-                    l.name AS lname,
-                    m.id AS move_id,
-                    m.name AS move_name,
-                    c.symbol AS currency_symbol,
-                    c.position AS currency_position,
-                    c.rounding AS currency_precision,
-                    cc.id AS company_currency_id,
-                    cc.symbol AS company_currency_symbol,
-                    cc.rounding AS company_currency_precision,
-                    cc.position AS company_currency_position,
-                    p.name AS partner_name,
-                    COALESCE(l.debit,0) AS debit,
-                    COALESCE(l.credit,0) AS credit,
-                    COALESCE(l.debit - l.credit,0) AS balance,
-                    COALESCE(l.amount_currency,0) AS amount_currency
-                FROM account_move_line l
-                JOIN account_move m ON (l.move_id=m.id)
-                JOIN account_account a ON (l.account_id=a.id)
-      
-                LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                LEFT JOIN res_currency cc ON (l.company_currency_id=cc.id)
-                LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                JOIN account_journal j ON (l.journal_id=j.id)
-                WHERE %s
-                GROUP BY l.id, l.account_id, l.date, j.code, l.currency_id, l.amount_currency, l.name, m.id, m.name, c.rounding, cc.id, cc.rounding, cc.position, c.position, c.symbol, cc.symbol, p.name
-                ORDER BY %s
-                OFFSET %s ROWS
-                FETCH FIRST %s ROWS ONLY
-            ''') % (KS_WHERE_CURRENT, KS_ORDER_BY_CURRENT, ks_offset_count, fetch_range)
-        cr.execute(sql)
-        for ks_row in cr.dictfetchall():
-            lang = self.env.user.lang
-            lang_id = self.env['res.lang'].search([('code', '=', lang)])['date_format'].replace('/', '-')
+        ks_move_lines = []
+        ks_initial_bal_data = ks_cursor.get('ks_initial_bal', 0.0)
+        ks_opening_balance = ks_cursor.get('balance', 0.0)
+        if not ks_cursor:
+            if self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal') and ks_is_range:
+                cr.execute(KS_SUMS + KS_FROM + ' WHERE ' + KS_WHERE_INIT +
+                           " AND a.internal_group NOT IN ('income', 'expense')", ks_params)
+                ks_row = cr.dictfetchone()
+                ks_initial_bal_data = ks_row['balance']
+                ks_opening_balance += ks_row['balance']
+                if not ks_offset_count:
+                    ks_move_lines.append({
+                        'lcode': 'Initial Balance',
+                        'partner_name': "-",
+                        'move_name': "-",
+                        'lname': "-",
+                        'currency_id': False,
+                        'currency_symbol': False,
+                        'currency_position': False,
+                        'company_currency_symbol': ks_currency_id.symbol,
+                        'company_currency_id': ks_currency_id.id,
+                        'amount_currency': 0,
+                        'initial_balance': ks_opening_balance,
+                        'debit': ks_row['debit'],
+                        'credit': ks_row['credit'],
+                        'balance': ks_opening_balance,
+                    })
+            if ks_df_informations.get('initial_balance') and ks_is_range:
+                cr.execute(KS_SUMS + KS_FROM + ' WHERE ' + KS_WHERE_INIT, ks_params)
+                ks_row = cr.dictfetchone()
+                ks_opening_balance += ks_row['balance']
+                if not ks_offset_count:
+                    ks_row.update({
+                        'move_name': 'Initial Balance',
+                        'account_id': ks_account,
+                        'company_currency_id': ks_currency_id.id,
+                    })
+                    ks_move_lines.append(ks_row)
+
+        ks_rows, ks_skipped_balance, ks_last_key = self._ks_fetch_keyset_page('''
+                l.id AS lid,
+                l.account_id AS account_id,
+                l.date AS ldate,
+                j.code AS lcode,
+                l.currency_id,
+                l.name AS lname,
+                m.id AS move_id,
+                m.name AS move_name,
+                c.symbol AS currency_symbol,
+                c.position AS currency_position,
+                c.rounding AS currency_precision,
+                cc.id AS company_currency_id,
+                cc.symbol AS company_currency_symbol,
+                cc.rounding AS company_currency_precision,
+                cc.position AS company_currency_position,
+                p.name AS partner_name,
+                COALESCE(l.debit,0) AS debit,
+                COALESCE(l.credit,0) AS credit,
+                COALESCE(l.debit - l.credit,0) AS balance,
+                COALESCE(l.amount_currency,0) AS amount_currency
+        ''', KS_FROM, KS_WHERE_CURRENT, KS_SORT_KEYS, ks_params,
+            ks_cursor=ks_cursor, ks_skip=ks_offset_count, fetch_range=fetch_range)
+        ks_opening_balance += ks_skipped_balance
 
+        lang = self.env.user.lang
+        lang_id = self.env['res.lang'].search([('code', '=', lang)])['date_format'].replace('/', '-')
+        for ks_row in ks_rows:
             dt_con_dt_maturity = ks_row['ldate'].strftime(lang_id)
             ks_row['ldate'] = datetime.datetime.strptime(dt_con_dt_maturity, lang_id).date()
-            ks_current_balance = ks_row['balance']
-            ks_row['balance'] = ks_opening_balance + ks_current_balance
-            ks_opening_balance += ks_current_balance
+            ks_opening_balance += ks_row['balance']
+            ks_row['balance'] = ks_opening_balance
             ks_row['initial_bal'] = False
             ks_move_lines.append(ks_row)
 
         if ((count - ks_offset_count) <= fetch_range) and ks_df_informations.get('initial_balance'):
-            sql = ('''
-                    SELECT 
-                        COALESCE(SUM(l.debit),0) AS debit, 
-                        COALESCE(SUM(l.credit),0) AS credit, 
-                        COALESCE(SUM(l.debit - l.credit),0) AS balance
-                    FROM account_move_line l
-                    JOIN account_move m ON (l.move_id=m.id)
-                    JOIN account_account a ON (l.account_id=a.id)
-                   
-                    LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                    LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                    JOIN account_journal j ON (l.journal_id=j.id)
-                    WHERE %s
-                ''') % KS_WHERE_FULL
-            cr.execute(sql)
-            for ks_row in cr.dictfetchall():
-                ks_row['move_name'] = 'Ending Balance'
-                ks_row['account_id'] = ks_account
-                ks_row['company_currency_id'] = ks_currency_id.id
-                ks_move_lines.append(ks_row)
-        if len(ks_move_lines) > 0 and ks_move_lines[-1].get('move_name') == 'Ending Balance':
-            ks_move_lines[-1]['initial_balance'] = ks_initial_bal_data
-            # ks_move_lines[-1]['debit'] = ks_initial_bal_data
-            ks_move_lines[-1]['balance'] += ks_initial_bal_data
-        return count, ks_offset_count, ks_move_lines
+            cr.execute(KS_SUMS + KS_FROM + ' WHERE ' + KS_WHERE_FULL, ks_params)
+            ks_row = cr.dictfetchone()
+            ks_row.update({
+                'move_name': 'Ending Balance',
+                'account_id': ks_account,
+                'company_currency_id': ks_currency_id.id,
+                'initial_balance': ks_initial_bal_data,
+            })
+            ks_row['balance'] += ks_initial_bal_data
+            ks_move_lines.append(ks_row)
+        ks_next_cursor = {
+            'key': ks_last_key,
+            'balance': ks_opening_balance,
+            'count': count,
+            'ks_initial_bal': ks_initial_bal_data,
+        }
+        return count, ks_offset_count, ks_move_lines, ks_next_cursor
 
     def ks_fetch_page_list(self, ks_total_count):
         '''
@@ -2751,87 +2952,59 @@ class ks_dynamic_financial_base(models.Model):
             ks_page_count += 1
         return [i + 1 for i in range(0, int(ks_page_count))] or []
 
-    def ks_df_build_where_clause(self, ks_df_informations=False):
-
-        if ks_df_informations:
-            WHERE = '(1=1)'
-            journal_domain = None
-            analytics_domain = None
-            analytics_tag_domain = None
-            account_domain = None
-            for journal in ks_df_informations.get('journals', []):
-                if not journal['id'] in ('divider', 'group') and journal['selected']:
-                    if not journal_domain:
-                        journal_domain = 'j.id = %s' % journal['id']
-                    else:
-                        journal_domain += ' OR j.id = %s' % journal['id']
+    def ks_get_move_states(self, ks_df_informations):
+        '''
+        :return: list of the move states selected in the filters
+        '''
+        if ks_df_informations.get('ks_posted_entries') and not ks_df_informations.get('ks_unposted_entries'):
+            return ['posted']
+        elif ks_df_informations.get('ks_unposted_entries') and not ks_df_informations.get('ks_posted_entries'):
+            return ['draft']
+        return ['posted', 'draft']
 
-            if journal_domain:
-                WHERE += ' AND' + '(' + journal_domain + ')'
+    def ks_df_build_filter(self, ks_df_informations=False):
+        '''
+        Filter of the account based reports: journals, accounts, analytic accounts, partners,
+        companies and move states selected by the user
+        :return: KsSqlFilter
+        '''
+        ks_filter = KsSqlFilter()
+        if not ks_df_informations:
+            return ks_filter
 
-            for account in ks_df_informations.get('account', []):
-                # pass
-                if not account['id'] in ('divider', 'group') and account['selected']:
-                    if not account_domain:
-                        account_domain = 'a.id = %s' % (account['id'])
-                    else:
-                        account_domain += ' OR a.id = %s' % (account['id'])
+        ks_journal_ids = [journal['id'] for journal in ks_df_informations.get('journals', [])
+                          if journal['id'] not in ('divider', 'group') and journal['selected']]
+        if ks_journal_ids:
+            ks_filter.ks_add_any('j.id', 'ks_filter_journal_ids', ks_journal_ids)
 
-            if account_domain:
-                WHERE += ' AND' + '(' + account_domain + ')'
+        ks_account_ids = [account['id'] for account in ks_df_informations.get('account', [])
+                          if account['id'] not in ('divider', 'group') and account['selected']]
+        if ks_account_ids:
+            ks_filter.ks_add_any('a.id', 'ks_filter_account_ids', ks_account_ids)
 
-            if ks_df_informations.get('analytic_accounts'):
-                analytic_distribution_filter_conditions = []
-
-                for ks_ana_id in ks_df_informations['analytic_accounts']:
-                    i_str = str(ks_ana_id)
-                    condition = f"(jsonb_exists(analytic_distribution, '{i_str}'))"
-                    analytic_distribution_filter_conditions.append(condition)
-                analytic_distribution_filter = ' OR '.join(analytic_distribution_filter_conditions)
-                WHERE += " AND " + "(" + analytic_distribution_filter + ")"
-
-                #     if not analytics_domain:
-                #         analytics_domain = 'anl.id = %s' % ks_ana_id
-                #     else:
-                #         analytics_domain += ' OR anl.id = %s' % ks_ana_id
-                #
-                # if analytics_domain:
-                #     WHERE += ' AND' + '(' + analytics_domain + ')'
-
-            # if ks_df_informations.get('analytic_tags'):
-            #     tag_ids = tuple(ks_df_informations['analytic_tags'])
-            #     if not analytics_tag_domain:
-            #         if len(tag_ids) == 1:
-            #             analytics_tag_domain = 'l.id in (SELECT "account_move_line_id" FROM "account_analytic_tag_account_move_line_rel" WHERE "account_analytic_tag_id" IN (%s))' % tag_ids
-            #         else:
-            #             analytics_tag_domain = 'l.id in (SELECT "account_move_line_id" FROM "account_analytic_tag_account_move_line_rel" WHERE "account_analytic_tag_id" IN %s)' % (tag_ids,)
-            #     else:
-            #         if len(tag_ids) == 1:
-            #             analytics_tag_domain += 'OR l.id in (SELECT "account_move_line_id" FROM "account_analytic_tag_account_move_line_rel" WHERE "account_analytic_tag_id" IN (%s))' % tag_ids
-            #         else:
-            #             analytics_tag_domain += 'OR l.id in (SELECT "account_move_line_id" FROM "account_analytic_tag_account_move_line_rel" WHERE "account_analytic_tag_id" IN %s)' % (tag_ids,)
-            #
-            #     if analytics_tag_domain:
-            #         WHERE += ' AND' + '(' + analytics_tag_domain + ')'
-
-            if ks_df_informations.get('partner_ids', []):
-                WHERE += ' AND p.id IN %s' % str(tuple(ks_df_informations.get('ks_partner_ids')) + tuple([0]))
+        if ks_df_informations.get('analytic_accounts'):
+            ks_filter.ks_add('l.analytic_distribution ?| %(ks_filter_analytic_ids)s::text[]',
+                             ks_filter_analytic_ids=[str(ks_ana_id) for ks_ana_id in
+                                                     ks_df_informations['analytic_accounts']])
 
-            if ks_df_informations.get('company_id', False):
-                WHERE += ' AND l.company_id in %s' % str(tuple(ks_df_informations.get('company_ids')) + tuple([0]))
+        if ks_df_informations.get('partner_ids', []):
+            ks_filter.ks_add_any('p.id', 'ks_filter_partner_ids', ks_df_informations.get('ks_partner_ids') or [])
 
-            if ks_df_informations.get('ks_posted_entries') and not ks_df_informations.get('ks_unposted_entries'):
-                WHERE += " AND m.state = 'posted'"
-            elif ks_df_informations.get('ks_unposted_entries') and not ks_df_informations.get('ks_posted_entries'):
-                WHERE += " AND m.state = 'draft'"
-            else:
-                WHERE += " AND m.state IN ('posted', 'draft') "
+        if ks_df_informations.get('company_id', False):
+            ks_filter.ks_add_any('l.company_id', 'ks_filter_company_ids', ks_df_informations.get('company_ids') or [])
 
-            return WHERE
+        ks_filter.ks_add_any('m.state', 'ks_filter_states', self.ks_get_move_states(ks_df_informations))
+        return ks_filter
 
     ###########################################################################################
     # For partner ledger
     ###########################################################################################
+    def _ks_partner_ledger_partners(self, ks_df_informations):
+        if ks_df_informations.get('ks_partner_ids', []):
+            ks_partner_ids = ks_df_informations.get('ks_partner_ids', [])
+            return self.env['account.move'].sudo().search([('partner_id', 'in', ks_partner_ids)]).mapped('partner_id')
+        return self.ks_build_aging_where_clause(ks_df_informations)[0]
+
     def ks_partner_process_data(self, ks_df_informations):
         '''
         It is the method for showing summary details of each accounts. Just basic details to show up
@@ -2843,26 +3016,10 @@ class ks_dynamic_financial_base(models.Model):
         '''
         cr = self.env.cr
         initial_bal_data = []
-        WHERE = self.ks_build_where_clause(ks_df_informations, partner_ledger=True)
+        ks_filter = self.ks_build_partner_filter(ks_df_informations, partner_ledger=True)
+        WHERE = ks_filter.ks_where('l.partner_id = %(ks_partner)s')
         ks_company_id = self.env['res.company'].sudo().browse(ks_df_informations.get('company_id'))
-        ks_df_partner_company_domain = ['|', ('parent_id', '=', False),
-                                        ('company_id', '=', ks_company_id.id),
-                                        ('company_id', '=', False)]
-        if ks_df_informations.get('ks_posted_entries') and not ks_df_informations.get('ks_unposted_entries'):
-            WHERE += " AND m.state = 'posted'"
-        elif ks_df_informations.get('ks_unposted_entries') and not ks_df_informations.get('ks_posted_entries'):
-            WHERE += " AND m.state = 'draft'"
-        else:
-            WHERE += " AND m.state IN ('posted', 'draft') "
-
-        if self.partner_category_ids:
-            ks_df_partner_company_domain.append(('category_id', 'in', self.partner_category_ids.ids))
-
-        if ks_df_informations.get('ks_partner_ids', []):
-            ks_partner_ids = ks_df_informations.get('ks_partner_ids', [])
-            ks_partner_ids = self.env['account.move'].sudo().search([('partner_id', 'in', ks_partner_ids)]).mapped('partner_id')
-        else:
-            ks_partner_ids = self.ks_build_aging_where_clause(ks_df_informations)[0]
+        ks_partner_ids = self._ks_partner_ledger_partners(ks_df_informations)
 
         ks_move_lines = {
             x.id: {
@@ -2882,11 +3039,15 @@ class ks_dynamic_financial_base(models.Model):
             ks_rounding = ks_currency.rounding
             ks_position = ks_currency.position
             ks_opening_balance = 0.0
+            ks_params = ks_filter.ks_query_params(
+                ks_partner=ks_partner.id,
+                ks_start_date=ks_df_informations['date'].get('ks_start_date'),
+                ks_end_date=ks_df_informations['date'].get('ks_end_date'),
+            )
             KS_WHERE_INIT = WHERE
 
             if self.ks_date_filter.get('ks_process') == 'range':
-                KS_WHERE_INIT = KS_WHERE_INIT + " AND l.date < '%s'" % ks_df_informations['date'].get('ks_start_date')
-            KS_WHERE_INIT += " AND l.partner_id = %s" % ks_partner.id
+                KS_WHERE_INIT += " AND l.date < %(ks_start_date)s"
             KS_ORDER_BY_CURRENT = 'l.date'
             ks_df_informations['initial_balance'] = True
             if ks_df_informations.get('initial_balance'):
@@ -2903,7 +3064,7 @@ class ks_dynamic_financial_base(models.Model):
                     JOIN account_journal j ON (l.journal_id=j.id)
                     WHERE %s
                 ''') % KS_WHERE_INIT
-                cr.execute(sql)
+                cr.execute(sql, ks_params)
                 for ks_row in cr.dictfetchall():
                     ks_row['move_name'] = 'Initial Balance'
                     ks_row['partner_id'] = ks_partner.id
@@ -2912,13 +3073,9 @@ class ks_dynamic_financial_base(models.Model):
                     ks_opening_balance += ks_row['balance']
                     ks_move_lines[ks_partner.id]['lines'].append(ks_row)
             if self.ks_date_filter.get('ks_process') == 'range':
-                KS_WHERE_CURRENT = WHERE + " AND l.date >= '%s'" % ks_df_informations['date'].get(
-                    'ks_start_date') + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                    'ks_end_date')
+                KS_WHERE_CURRENT = WHERE + " AND l.date >= %(ks_start_date)s AND l.date <= %(ks_end_date)s"
             else:
-                KS_WHERE_CURRENT = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                    'ks_end_date')
-            KS_WHERE_CURRENT += " AND p.id = %s" % ks_partner.id
+                KS_WHERE_CURRENT = WHERE + " AND l.date <= %(ks_end_date)s"
             sql = ('''
                 SELECT
                     l.id AS lid,
@@ -2943,7 +3100,7 @@ class ks_dynamic_financial_base(models.Model):
                 ORDER BY %s
             ''') % (KS_WHERE_CURRENT, KS_ORDER_BY_CURRENT)
 
-            cr.execute(sql)
+            cr.execute(sql, ks_params)
             ks_current_lines = cr.dictfetchall()
             for ks_row in ks_current_lines:
                 ks_row['initial_bal'] = False
@@ -2956,17 +3113,9 @@ class ks_dynamic_financial_base(models.Model):
 
                 ks_move_lines[ks_partner.id]['lines'].append(ks_row)
             if ks_df_informations.get('initial_balance') and self.ks_date_filter.get('ks_process') == 'range':
-                KS_WHERE_FULL = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get('ks_end_date')
+                KS_WHERE_FULL = WHERE + " AND l.date <= %(ks_end_date)s"
             else:
-                if self.ks_date_filter.get('ks_process') == 'range':
-                    KS_WHERE_FULL = WHERE + " AND l.date >= '%s'" % ks_df_informations['date'].get(
-                        'ks_start_date') + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                        'ks_end_date')
-                else:
-                    KS_WHERE_FULL = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                        'ks_end_date')
-
-            KS_WHERE_FULL += " AND p.id = %s" % ks_partner.id
+                KS_WHERE_FULL = KS_WHERE_CURRENT
             sql = ('''
                 SELECT
                     COALESCE(SUM(l.debit),0) AS debit,
@@ -2982,8 +3131,7 @@ class ks_dynamic_financial_base(models.Model):
             ''') % KS_WHERE_FULL
             if self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal') and \
                     self.ks_date_filter.get('ks_process') == 'range':
-                KS_INIT_BAL_WHERE_FULL = WHERE + " AND l.date < '%s'" % ks_df_informations['date'].get('ks_start_date')
-                KS_INIT_BAL_WHERE_FULL += " AND p.id = %s" % ks_partner.id
+                KS_INIT_BAL_WHERE_FULL = WHERE + " AND l.date < %(ks_start_date)s"
                 KS_INIT_BAL_WHERE_FULL += " AND a.internal_group not in ('income', 'expense')"
                 sql_query = ('''
                         SELECT
@@ -2996,10 +3144,10 @@ class ks_dynamic_financial_base(models.Model):
                         LEFT JOIN res_currency c ON (l.currency_id=c.id)
                         LEFT JOIN res_partner p ON (l.partner_id=p.id)
                         JOIN account_journal j ON (l.journal_id=j.id) WHERE %s''') % KS_INIT_BAL_WHERE_FULL
-                cr.execute(sql_query)
+                cr.execute(sql_query, ks_params)
                 initial_bal_data = cr.dictfetchall()
 
-            cr.execute(sql)
+            cr.execute(sql, ks_params)
             for ks_row in cr.dictfetchall():
                 if ks_currency.is_zero(ks_row['debit']) and ks_currency.is_zero(ks_row['credit']):
                     ks_move_lines.pop(ks_partner.id, None)
@@ -3024,61 +3172,219 @@ class ks_dynamic_financial_base(models.Model):
                         ks_current_lines) <= FETCH_RANGE else False
         return ks_move_lines, 0.0, 0.0, 0.0
 
-    @api.model
-    def ks_build_where_clause(self, ks_df_informations=False, partner_ledger=False):
-        if ks_df_informations:
-
-            # WHERE = '(1=1)'
-            ks_type = ('asset_receivable', 'liability_payable')
-            WHERE = '(1=1)'
-            journal_domain = None
-            for journal in ks_df_informations.get('journals', []):
-                if not journal['id'] in ('divider', 'group') and journal['selected']:
-                    if not journal_domain:
-                        journal_domain = 'j.id = %s' % journal['id']
-                    else:
-                        journal_domain += ' OR j.id = %s' % journal['id']
-
-            if journal_domain:
-                WHERE += ' AND' + '(' + journal_domain + ')'
-
-            if ks_df_informations['account_type'] is not None:
-                if ks_df_informations['account_type'][0].get('selected'):
-                    WHERE += " AND a.account_type = '%s'" % str(ks_type[1])
-                elif ks_df_informations['account_type'][1].get('selected'):
-                    WHERE += " AND a.account_type = '%s' " % str(ks_type[0])
-
-            if (ks_df_informations['account_type'][0].get('selected') and ks_df_informations['account_type'][1].get(
-                    'selected')) or \
-                    (partner_ledger and not ks_df_informations['account_type'][0].get('selected') and not
-                    ks_df_informations['account_type'][1].get('selected')):
-                WHERE = '(1=1)'
-                WHERE += ' AND a.account_type IN %s' % str(ks_type)
-
-            if ks_df_informations.get('ks_reconciled') and not ks_df_informations.get('ks_unreconciled'):
-                WHERE += ' AND l.amount_residual = 0'
+    def ks_fetch_partner_ledger_balances(self, ks_df_informations, ks_partner_ids):
+        '''
+        Initial, period and ending figures of every partner of the Partner Ledger in one grouped query
+        :return: dict {partner_id: {initial_*, period_*, ending_*, ledger_initial_*}}
+        '''
+        if not ks_partner_ids:
+            return {}
+        ks_filter = self.ks_build_partner_filter(ks_df_informations, partner_ledger=True)
+        ks_date = ks_df_informations['date']
+        ks_params = ks_filter.ks_query_params(
+            ks_partner_ids=list(ks_partner_ids),
+            ks_start_date=ks_date.get('ks_start_date'),
+            ks_end_date=ks_date.get('ks_end_date') or fields.Date.context_today(self),
+        )
+        if ks_date['ks_process'] == 'range':
+            KS_INIT_COND = "l.date < %(ks_start_date)s"
+        else:
+            KS_INIT_COND = "FALSE"
+        KS_LEDGER_INIT_COND = KS_INIT_COND + " AND a.internal_group NOT IN ('income', 'expense')"
+        sql = ('''
+            SELECT
+                l.partner_id AS partner_id,
+                COALESCE(SUM(l.debit) FILTER (WHERE {init}),0) AS initial_debit,
+                COALESCE(SUM(l.credit) FILTER (WHERE {init}),0) AS initial_credit,
+                COALESCE(SUM(l.debit - l.credit) FILTER (WHERE {init}),0) AS initial_balance,
+                COALESCE(SUM(l.debit) FILTER (WHERE NOT ({init})),0) AS period_debit,
+                COALESCE(SUM(l.credit) FILTER (WHERE NOT ({init})),0) AS period_credit,
+                COALESCE(SUM(l.debit - l.credit) FILTER (WHERE NOT ({init})),0) AS period_balance,
+                COALESCE(SUM(l.debit) FILTER (WHERE {ledger_init}),0) AS ledger_initial_debit,
+                COALESCE(SUM(l.credit) FILTER (WHERE {ledger_init}),0) AS ledger_initial_credit,
+                COALESCE(SUM(l.debit - l.credit) FILTER (WHERE {ledger_init}),0) AS ledger_initial_balance
+            FROM account_move_line l
+            JOIN account_move m ON (l.move_id=m.id)
+            JOIN account_account a ON (l.account_id=a.id)
+            JOIN account_journal j ON (l.journal_id=j.id)
+            WHERE {where}
+                AND l.partner_id = ANY(%(ks_partner_ids)s)
+                AND l.date <= %(ks_end_date)s
+            GROUP BY l.partner_id
+        ''').format(init=KS_INIT_COND, ledger_init=KS_LEDGER_INIT_COND, where=ks_filter.ks_where())
+        self.env.cr.execute(sql, ks_params)
+        ks_res = {}
+        for ks_row in self.env.cr.dictfetchall():
+            for ks_field in ('debit', 'credit', 'balance'):
+                ks_row['ending_' + ks_field] = ks_row['initial_' + ks_field] + ks_row['period_' + ks_field]
+            ks_res[ks_row['partner_id']] = ks_row
+        return ks_res
 
-            elif ks_df_informations.get('ks_unreconciled') and not ks_df_informations.get('ks_reconciled'):
-                WHERE += ' AND l.amount_residual != 0'
-            elif ks_df_informations.get('ks_reconciled') and ks_df_informations.get('ks_unreconciled'):
-                WHERE += ' AND l.amount_residual = 0' + 'OR l.amount_residual != 0'
+    def _ks_partner_ledger_lines_query(self, ks_df_informations, ks_partner_ids):
+        '''
+        Query of the period move lines of the given partners, ordered partner by partner in the
+        order of ks_partner_ids, with the running balance computed by a window function
+        :return: (sql, params)
+        '''
+        ks_filter = self.ks_build_partner_filter(ks_df_informations, partner_ledger=True)
+        ks_date = ks_df_informations['date']
+        ks_params = ks_filter.ks_query_params(
+            ks_partner_ids=list(ks_partner_ids),
+            ks_start_date=ks_date.get('ks_start_date'),
+            ks_end_date=ks_date.get('ks_end_date') or fields.Date.context_today(self),
+        )
+        KS_WHERE_CURRENT = ''
+        if ks_date['ks_process'] == 'range':
+            KS_WHERE_CURRENT = " AND l.date >= %(ks_start_date)s"
+        sql = ('''
+            SELECT
+                l.id AS lid,
+                l.partner_id AS partner_id,
+                l.date AS ldate,
+                j.code AS lcode,
+                a.name AS account_name,
+                m.name AS move_name,
+                l.name AS lname,
+                COALESCE(l.debit,0) AS debit,
+                COALESCE(l.credit,0) AS credit,
+                SUM(COALESCE(l.balance,0)) OVER (
+                    PARTITION BY l.partner_id ORDER BY l.date, l.id
+                    ROWS UNBOUNDED PRECEDING) AS balance,
+                COALESCE(l.amount_currency,0) AS balance_currency
+            FROM account_move_line l
+            JOIN unnest(%(ks_partner_ids)s::int[]) WITH ORDINALITY AS ks_partner(id, seq) ON (l.partner_id=ks_partner.id)
+            JOIN account_move m ON (l.move_id=m.id)
+            JOIN account_account a ON (l.account_id=a.id)
+            JOIN account_journal j ON (l.journal_id=j.id)
+            WHERE {where}
+                AND l.date <= %(ks_end_date)s
+                {current}
+            ORDER BY ks_partner.seq, l.date, l.id
+        ''').format(where=ks_filter.ks_where(), current=KS_WHERE_CURRENT)
+        return sql, ks_params
+
+    def ks_iter_partner_ledger(self, ks_df_informations):
+        '''
+        Streaming counterpart of ks_partner_process_data for the exports. Yields the summary line
+        of each partner with an iterator over its detail lines, read chunk by chunk from a server
+        side cursor. The detail lines of a partner must be consumed before the next partner is
+        requested.
+        :return: generator of (partner values, lines)
+        '''
+        ks_company_id = self.env['res.company'].sudo().browse(ks_df_informations.get('company_id'))
+        ks_ledger_in_bal = self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal') and \
+            ks_df_informations['date']['ks_process'] == 'range'
+        ks_partners = self._ks_partner_ledger_partners(ks_df_informations)
+        ks_balances = self.ks_fetch_partner_ledger_balances(ks_df_informations, ks_partners.ids)
+        ks_displayed_partners = self.env['res.partner']
+        for ks_partner in ks_partners.filtered(lambda p: p.id in ks_balances):
+            ks_currency = ks_partner.company_id.currency_id or ks_company_id.currency_id
+            if not (ks_currency.is_zero(ks_balances[ks_partner.id]['ending_debit'])
+                    and ks_currency.is_zero(ks_balances[ks_partner.id]['ending_credit'])):
+                ks_displayed_partners |= ks_partner
+
+        ks_groups = iter(())
+        if ks_df_informations.get('ks_report_with_lines') and ks_displayed_partners:
+            sql, ks_params = self._ks_partner_ledger_lines_query(ks_df_informations, ks_displayed_partners.ids)
+            ks_groups = itertools.groupby(self.ks_iter_query_rows(sql, ks_params), key=lambda r: r['partner_id'])
+        ks_group = next(ks_groups, None)
+        for ks_partner in ks_displayed_partners:
+            ks_balance = ks_balances[ks_partner.id]
+            ks_rows = ()
+            if ks_group and ks_group[0] == ks_partner.id:
+                ks_rows = ks_group[1]
+                ks_group = None
+            ks_values = {
+                'name': ks_partner.name,
+                'code': ks_partner.id,
+                'id': ks_partner.id,
+                'initial_balance': ks_balance['ledger_initial_balance'] if ks_ledger_in_bal else 0.0,
+                'debit': ks_balance['ending_debit'] - (ks_balance['ledger_initial_debit'] if ks_ledger_in_bal else 0.0),
+                'credit': ks_balance['ending_credit'] - (
+                    ks_balance['ledger_initial_credit'] if ks_ledger_in_bal else 0.0),
+                'balance': ks_balance['ending_balance'],
+            }
+            ks_lines = ()
+            if ks_df_informations.get('ks_report_with_lines'):
+                ks_lines = self._ks_partner_ledger_partner_lines(ks_partner, ks_balance, ks_rows)
+            yield ks_values, ks_lines
+            if ks_group is None:
+                ks_group = next(ks_groups, None)
+
+    def _ks_partner_ledger_partner_lines(self, ks_partner, ks_balance, ks_rows):
+        yield {
+            'move_name': 'Initial Balance',
+            'partner_id': ks_partner.id,
+            'initial_bal': True,
+            'ending_bal': False,
+            'debit': ks_balance['initial_debit'],
+            'credit': ks_balance['initial_credit'],
+            'balance': ks_balance['initial_balance'],
+        }
+        for ks_row in ks_rows:
+            ks_row['balance'] += ks_balance['initial_balance']
+            ks_row['initial_bal'] = False
+            ks_row['ending_bal'] = False
+            yield ks_row
+        yield {
+            'debit': ks_balance['ending_debit'],
+            'credit': ks_balance['ending_credit'],
+            'balance': ks_balance['ending_balance'],
+            'initial_bal': False,
+            'ending_bal': True,
+        }
 
-            if ks_df_informations.get('ks_df_report_account_ids', []):
-                WHERE += ' AND a.id IN %s' % str(tuple(ks_df_informations.get('ks_df_report_account_ids')) + tuple([0]))
+    @api.model
+    def ks_build_partner_filter(self, ks_df_informations=False, partner_ledger=False):
+        '''
+        Filter of the partner based reports: journals, receivable and payable accounts, reconciliation,
+        report accounts, companies and move states selected by the user
+        :return: KsSqlFilter
+        '''
+        ks_filter = KsSqlFilter()
+        if not ks_df_informations:
+            return ks_filter
+
+        ks_journal_ids = [journal['id'] for journal in ks_df_informations.get('journals', [])
+                          if journal['id'] not in ('divider', 'group') and journal['selected']]
+        if ks_journal_ids:
+            ks_filter.ks_add_any('j.id', 'ks_filter_journal_ids', ks_journal_ids)
+
+        ks_payable = ks_df_informations['account_type'][0].get('selected')
+        ks_receivable = ks_df_informations['account_type'][1].get('selected')
+        if (ks_payable and ks_receivable) or (partner_ledger and not ks_payable and not ks_receivable):
+            ks_filter.ks_add_any('a.account_type', 'ks_filter_account_types',
+                                 ['asset_receivable', 'liability_payable'])
+        elif ks_payable:
+            ks_filter.ks_add_any('a.account_type', 'ks_filter_account_types', ['liability_payable'])
+        elif ks_receivable:
+            ks_filter.ks_add_any('a.account_type', 'ks_filter_account_types', ['asset_receivable'])
+
+        if ks_df_informations.get('ks_reconciled') and not ks_df_informations.get('ks_unreconciled'):
+            ks_filter.ks_add('l.amount_residual = 0')
+        elif ks_df_informations.get('ks_unreconciled') and not ks_df_informations.get('ks_reconciled'):
+            ks_filter.ks_add('l.amount_residual != 0')
+
+        if ks_df_informations.get('ks_df_report_account_ids', []):
+            ks_filter.ks_add_any('a.id', 'ks_filter_report_account_ids',
+                                 ks_df_informations.get('ks_df_report_account_ids'))
 
-            if ks_df_informations.get('company_id', False):
-                WHERE += ' AND l.company_id in %s' % str(tuple(ks_df_informations.get('company_ids')) + tuple([0]))
+        if ks_df_informations.get('company_id', False):
+            ks_filter.ks_add_any('l.company_id', 'ks_filter_company_ids', ks_df_informations.get('company_ids') or [])
 
-            return WHERE
+        ks_filter.ks_add_any('m.state', 'ks_filter_states', self.ks_get_move_states(ks_df_informations))
+        return ks_filter
 
     def ks_build_detailed_move_lines(self, offset=0, partner=0, ks_df_informations=False, partner_ledger=False,
-                                     fetch_range=FETCH_RANGE):
+                                     fetch_range=FETCH_RANGE, ks_cursor=False):
         '''
         It is used for showing detailed move lines as sub lines. It is defered loading compatable
         :param offset: It is nothing but page numbers. Multiply with fetch_range to get final range
         :param partner: Integer - Partner_id
         :param fetch_range: Global Variable. Can be altered from calling model
-        :return: count(int-Total rows without offset), offset(integer), ks_move_lines(list of dict)
+        :param ks_cursor: cursor returned with the previous page, see ks_build_detailed_gen_move_lines
+        :return: count(int-Total rows without offset), offset(integer), ks_move_lines(list of dict),
+                 cursor of the next page
 
         Three sections,
         1. Initial Balance
@@ -3086,255 +3392,137 @@ class ks_dynamic_financial_base(models.Model):
         3. Final Balance
         '''
         cr = self.env.cr
-        # data = self.get_filters(default_filters={})
         ks_offset_count = offset * fetch_range
-        count = 0
-        ks_opening_balance = 0
+        ks_cursor = ks_cursor or {}
         company_id = self.env.company
         currency_id = company_id.currency_id
-
-        WHERE = self.ks_build_where_clause(ks_df_informations, partner_ledger=True if partner_ledger else False)
-        KSINITWHERE = WHERE
-        KS_WHERE_INIT = WHERE + " AND l.date < '%s'" % ks_df_informations['date'].get('ks_start_date')
-        KS_WHERE_INIT += " AND l.partner_id = %s" % partner
-        if self.ks_date_filter.get('ks_process') == 'range':
-            KS_WHERE_CURRENT = WHERE + " AND l.date >= '%s'" % ks_df_informations['date'].get(
-                'ks_start_date') + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                'ks_end_date')
+        ks_is_range = self.ks_date_filter.get('ks_process') == 'range'
+        ks_filter = self.ks_build_partner_filter(ks_df_informations, partner_ledger=bool(partner_ledger))
+        ks_params = ks_filter.ks_query_params(
+            ks_partner=partner,
+            ks_start_date=ks_df_informations['date'].get('ks_start_date'),
+            ks_end_date=ks_df_informations['date'].get('ks_end_date') or fields.Date.context_today(self),
+        )
+
+        WHERE = ks_filter.ks_where('l.partner_id = %(ks_partner)s')
+        KS_WHERE_CURRENT = WHERE + " AND l.date <= %(ks_end_date)s"
+        if ks_is_range:
+            KS_WHERE_CURRENT += " AND l.date >= %(ks_start_date)s"
+        if ks_df_informations.get('initial_balance') and ks_is_range:
+            KS_WHERE_FULL = WHERE + " AND l.date <= %(ks_end_date)s"
         else:
-            KS_WHERE_CURRENT = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                'ks_end_date')
-        KS_WHERE_CURRENT += " AND p.id = %s" % partner
-        if ks_df_informations.get('ks_posted_entries') and not ks_df_informations.get('ks_unposted_entries'):
-            KS_WHERE_CURRENT += " AND m.state = 'posted'"
-            KSINITWHERE += " AND m.state = 'posted'"
-        elif ks_df_informations.get('ks_unposted_entries') and not ks_df_informations.get('ks_posted_entries'):
-            KS_WHERE_CURRENT += " AND m.state = 'draft'"
-            KSINITWHERE += " AND m.state = 'draft'"
-        else:
-            KS_WHERE_CURRENT += " AND m.state IN ('posted', 'draft') "
-            KSINITWHERE += " AND m.state IN ('posted', 'draft') "
-
-        if ks_df_informations.get('initial_balance') and self.ks_date_filter.get('ks_process') == 'range':
-            KS_WHERE_FULL = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get('ks_end_date')
-        else:
-            if self.ks_date_filter.get('ks_process') == 'range':
-                KS_WHERE_FULL = WHERE + " AND l.date >= '%s'" % ks_df_informations['date'].get(
-                    'ks_start_date') + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                    'ks_end_date')
-            else:
-                KS_WHERE_FULL = WHERE + " AND l.date <= '%s'" % ks_df_informations['date'].get(
-                    'ks_end_date')
-        KS_WHERE_FULL += " AND p.id = %s" % partner
+            KS_WHERE_FULL = KS_WHERE_CURRENT
+        KS_FROM = '''
+            FROM account_move_line l
+            JOIN account_move m ON (l.move_id=m.id)
+            JOIN account_account a ON (l.account_id=a.id)
+            LEFT JOIN res_currency c ON (l.currency_id=c.id)
+            LEFT JOIN res_currency cc ON (l.company_currency_id=cc.id)
+            LEFT JOIN res_partner p ON (l.partner_id=p.id)
+            JOIN account_journal j ON (l.journal_id=j.id)
+        '''
+        KS_SUMS = '''
+            SELECT
+                COALESCE(SUM(l.debit),0) AS debit,
+                COALESCE(SUM(l.credit),0) AS credit,
+                COALESCE(SUM(l.debit - l.credit),0) AS balance
+        '''
 
-        KS_ORDER_BY_CURRENT = 'l.date'
+        # count and opening balance are computed once, the next pages get them from the cursor
+        count = ks_cursor.get('count')
+        if count is None:
+            cr.execute('SELECT COUNT(*) ' + KS_FROM + ' WHERE ' + KS_WHERE_CURRENT, ks_params)
+            count = cr.fetchone()[0]
 
         ks_move_lines = []
-        sql = ('''
-                    SELECT
-                        COALESCE(SUM(l.debit - l.credit),0) AS balance
-                    FROM account_move_line l
-                    JOIN account_move m ON (l.move_id=m.id)
-                    JOIN account_account a ON (l.account_id=a.id)
-                    LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                    LEFT JOIN res_currency cc ON (l.company_currency_id=cc.id)
-                    LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                    JOIN account_journal j ON (l.journal_id=j.id)
-                    WHERE %s
-                    GROUP BY l.date, l.move_id
-                    ORDER BY %s
-                    OFFSET %s ROWS
-                    FETCH FIRST %s ROWS ONLY
-                ''') % (KS_WHERE_CURRENT, KS_ORDER_BY_CURRENT, 0, ks_offset_count)
-        cr.execute(sql)
-        ks_running_balance_list = cr.fetchall()
-        for ks_running_balance in ks_running_balance_list:
-            ks_opening_balance += ks_running_balance[0]
-        sql = ('''
-            SELECT COUNT(*)
-            FROM account_move_line l
-                JOIN account_move m ON (l.move_id=m.id)
-                JOIN account_account a ON (l.account_id=a.id)
-                LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                LEFT JOIN res_currency cc ON (l.company_currency_id=cc.id)
-                LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                JOIN account_journal j ON (l.journal_id=j.id)
-            WHERE %s
-        ''') % (KS_WHERE_CURRENT)
-        cr.execute(sql)
-        count = cr.fetchone()[0]
-
-        ks_initial_bal_data = 0
-        if self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal') and \
-                self.ks_date_filter.get('ks_process') == 'range':
-            KSINITWHERE_CURRENT = KSINITWHERE + " AND l.date < '%s'" % ks_df_informations['date'].get('ks_start_date')
-            KSINITWHERE_CURRENT += " AND l.partner_id = %s" % partner
-            KSINITWHERE_CURRENT += " AND a.internal_group not in ('income', 'expense')"
-
-            ks_initial_bal_sql = ('''
-                            SELECT
-                                l.id AS lid,
-                                l.account_id AS account_id,
-                                l.partner_id AS partner_id,
-                                l.date AS ldate,
-                                j.code AS lcode,
-                                l.currency_id,
-                                l.amount_currency,
-                                --l.ref AS lref,
-                                l.name AS lname,
-                                m.id AS move_id,
-                                m.name AS move_name,
-                                c.symbol AS currency_symbol,
-                                c.position AS currency_position,
-                                c.rounding AS currency_precision,
-                                cc.id AS company_currency_id,
-                                cc.symbol AS company_currency_symbol,
-                                cc.rounding AS company_currency_precision,
-                                cc.position AS company_currency_position,
-                                p.name AS partner_name,
-                                a.name AS account_name,
-                                COALESCE(l.debit,0) AS debit,
-                                COALESCE(l.credit,0) AS credit,
-                                COALESCE(l.debit - l.credit,0) AS balance,
-                                COALESCE(l.amount_currency,0) AS amount_currency
-                            FROM account_move_line l
-                            JOIN account_move m ON (l.move_id=m.id)
-                            JOIN account_account a ON (l.account_id=a.id)
-                            LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                            LEFT JOIN res_currency cc ON (l.company_currency_id=cc.id)
-                            LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                            JOIN account_journal j ON (l.journal_id=j.id)
-                            WHERE %s
-                            GROUP BY l.id, l.partner_id, a.name, l.account_id, l.date, j.code, l.currency_id, l.amount_currency, l.name, m.id, m.name, c.rounding, cc.id, cc.rounding, cc.position, c.position, c.symbol, cc.symbol, p.name
-                            ORDER BY %s
-                            OFFSET %s ROWS
-                            FETCH FIRST %s ROWS ONLY
-                        ''') % (KSINITWHERE_CURRENT, KS_ORDER_BY_CURRENT, ks_offset_count, fetch_range)
-            cr.execute(ks_initial_bal_sql)
-            ks_dict = cr.dictfetchall()
-            ks_temp_dict = {
-                'lcode': 'Initial Balance',
-                'account_name': "-",
-                'move_name': "-",
-                'lname': "-",
-                'currency_id': False,
-                'currency_symbol': False,
-                'currency_position': False,
-                'company_currency_symbol': False,
-                'company_currency_id': False,
-                'amount_currency': 0,
-                'initial_balance': 0,
-                'debit': 0,
-                'credit': 0,
-                'balance': 0,
-            }
-            for row in ks_dict:
-                current_balance = row['balance']
-                row['balance'] = ks_opening_balance + current_balance
-                ks_opening_balance += current_balance
-                row['initial_balance'] = row['balance']
-                row['initial_bal'] = False
-
-                ks_temp_dict['currency_id'] = row['currency_id']
-                ks_temp_dict['currency_symbol'] = row['currency_symbol']
-                ks_temp_dict['currency_position'] = row['currency_position']
-                ks_temp_dict['company_currency_symbol'] = row['company_currency_symbol']
-                ks_temp_dict['company_currency_id'] = row['company_currency_id']
-
-                ks_temp_dict['debit'] += row['debit']
-                ks_temp_dict['credit'] += row['credit']
-                ks_temp_dict['balance'] = row['balance']
-                ks_temp_dict['initial_balance'] = row['balance']
-                ks_temp_dict['amount_currency'] += row['amount_currency']
-                # ks_move_lines.append(row)
-            ks_initial_bal_data = ks_temp_dict['balance']
-            ks_move_lines.append(ks_temp_dict)
+        ks_opening_balance = ks_cursor.get('balance', 0.0)
+        if not ks_cursor and self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal') and \
+                ks_is_range:
+            cr.execute(KS_SUMS + KS_FROM + ' WHERE ' + WHERE +
+                       " AND l.date < %(ks_start_date)s AND a.internal_group NOT IN ('income', 'expense')",
+                       ks_params)
+            ks_row = cr.dictfetchone()
+            ks_opening_balance += ks_row['balance']
+            if not ks_offset_count:
+                ks_move_lines.append({
+                    'lcode': 'Initial Balance',
+                    'account_name': "-",
+                    'move_name': "-",
+                    'lname': "-",
+                    'currency_id': False,
+                    'currency_symbol': False,
+                    'currency_position': False,
+                    'company_currency_symbol': currency_id.symbol,
+                    'company_currency_id': currency_id.id,
+                    'amount_currency': 0,
+                    'initial_balance': ks_opening_balance,
+                    'debit': ks_row['debit'],
+                    'credit': ks_row['credit'],
+                    'balance': ks_opening_balance,
+                })
 
-        sql = ('''
-                        SELECT
-                            l.id AS lid,
-                            l.account_id AS account_id,
-                            l.partner_id AS partner_id,
-                            l.date AS ldate,
-                            j.code AS lcode,
-                            l.currency_id,
-                            l.amount_currency,
-                            --l.ref AS lref,
-                            l.name AS lname,
-                            m.id AS move_id,
-                            m.name AS move_name,
-                            c.symbol AS currency_symbol,
-                            c.position AS currency_position,
-                            c.rounding AS currency_precision,
-                            cc.id AS company_currency_id,
-                            cc.symbol AS company_currency_symbol,
-                            cc.rounding AS company_currency_precision,
-                            cc.position AS company_currency_position,
-                            p.name AS partner_name,
-                            a.name AS account_name,
-                            COALESCE(l.debit,0) AS debit,
-                            COALESCE(l.credit,0) AS credit,
-                            COALESCE(l.debit - l.credit,0) AS balance,
-                            COALESCE(l.amount_currency,0) AS amount_currency
-                        FROM account_move_line l
-                        JOIN account_move m ON (l.move_id=m.id)
-                        JOIN account_account a ON (l.account_id=a.id)
-                        LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                        LEFT JOIN res_currency cc ON (l.company_currency_id=cc.id)
-                        LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                        JOIN account_journal j ON (l.journal_id=j.id)
-                        WHERE %s
-                        GROUP BY l.id, l.partner_id, a.name, l.account_id, l.date, j.code, l.currency_id, l.amount_currency, l.name, m.id, m.name, c.rounding, cc.id, cc.rounding, cc.position, c.position, c.symbol, cc.symbol, p.name
-                        ORDER BY %s
-                        OFFSET %s ROWS
-                        FETCH FIRST %s ROWS ONLY
-                    ''') % (KS_WHERE_CURRENT, KS_ORDER_BY_CURRENT, ks_offset_count, fetch_range)
-        cr.execute(sql)
-        for row in cr.dictfetchall():
-            current_balance = row['balance']
-            row['balance'] = ks_opening_balance + current_balance
-            ks_opening_balance += current_balance
+        ks_rows, ks_skipped_balance, ks_last_key = self._ks_fetch_keyset_page('''
+                l.id AS lid,
+                l.account_id AS account_id,
+                l.partner_id AS partner_id,
+                l.date AS ldate,
+                j.code AS lcode,
+                l.currency_id,
+                l.name AS lname,
+                m.id AS move_id,
+                m.name AS move_name,
+                c.symbol AS currency_symbol,
+                c.position AS currency_position,
+                c.rounding AS currency_precision,
+                cc.id AS company_currency_id,
+                cc.symbol AS company_currency_symbol,
+                cc.rounding AS company_currency_precision,
+                cc.position AS company_currency_position,
+                p.name AS partner_name,
+                a.name AS account_name,
+                COALESCE(l.debit,0) AS debit,
+                COALESCE(l.credit,0) AS credit,
+                COALESCE(l.debit - l.credit,0) AS balance,
+                COALESCE(l.amount_currency,0) AS amount_currency
+        ''', KS_FROM, KS_WHERE_CURRENT, ['l.date', 'l.move_id', 'l.id'], ks_params,
+            ks_cursor=ks_cursor, ks_skip=ks_offset_count, fetch_range=fetch_range)
+        ks_opening_balance += ks_skipped_balance
+        for row in ks_rows:
+            ks_opening_balance += row['balance']
+            row['balance'] = ks_opening_balance
             row['initial_balance'] = 0.0
             row['initial_bal'] = False
-
             ks_move_lines.append(row)
 
         if ((count - ks_offset_count) <= fetch_range) and ks_df_informations.get('initial_balance'):
-            if ks_df_informations.get('ks_posted_entries') and not ks_df_informations.get('ks_unposted_entries'):
-                KS_WHERE_FULL += " AND m.state = 'posted'"
-            elif ks_df_informations.get('ks_unposted_entries') and not ks_df_informations.get('ks_posted_entries'):
-                KS_WHERE_FULL += " AND m.state = 'draft'"
-            else:
-                KS_WHERE_FULL += " AND m.state IN ('posted', 'draft') "
-                KSINITWHERE += " AND m.state IN ('posted', 'draft') "
-            sql = ('''
-                    SELECT
-                        COALESCE(SUM(l.debit),0) AS debit,
-                        COALESCE(SUM(l.credit),0) AS credit,
-                        COALESCE(SUM(l.debit - l.credit),0) AS balance
-                    FROM account_move_line l
-                    JOIN account_move m ON (l.move_id=m.id)
-                    JOIN account_account a ON (l.account_id=a.id)
-                    LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                    LEFT JOIN res_partner p ON (l.partner_id=p.id)
-                    JOIN account_journal j ON (l.journal_id=j.id)
-                    WHERE %s
-                ''') % KS_WHERE_FULL
-            cr.execute(sql)
-            for row in cr.dictfetchall():
-                row['move_name'] = 'Ending Balance'
-                row['partner_id'] = partner
-                row['company_currency_id'] = currency_id.id
-                ks_move_lines.append(row)
-            # if len(ks_move_lines) > 0 and ks_move_lines[-1].get('move_name') == 'Ending Balance':
-            # ks_move_lines[-1]['initial_balance'] = ks_initial_bal_data
-            # ks_move_lines[-1]['debit'] = ks_initial_bal_data
-            # ks_move_lines[-1]['balance'] += ks_initial_bal_data
-        return count, ks_offset_count, ks_move_lines
+            cr.execute(KS_SUMS + KS_FROM + ' WHERE ' + KS_WHERE_FULL, ks_params)
+            row = cr.dictfetchone()
+            row.update({
+                'move_name': 'Ending Balance',
+                'partner_id': partner,
+                'company_currency_id': currency_id.id,
+            })
+            ks_move_lines.append(row)
+        ks_next_cursor = {
+            'key': ks_last_key,
+            'balance': ks_opening_balance,
+            'count': count,
+        }
+        return count, ks_offset_count, ks_move_lines, ks_next_cursor
 
     ######################################################################
     #   Age Receivable
     ######################################################################
+    def ks_build_aging_filter(self, ks_df_informations):
+        '''
+        Filter of the aged receivable and payable: move states and companies selected by the user
+        :return: KsSqlFilter
+        '''
+        ks_filter = KsSqlFilter()
+        ks_filter.ks_add_any('m.state', 'ks_filter_states', self.ks_get_move_states(ks_df_informations))
+        ks_filter.ks_add_any('l.company_id', 'ks_filter_company_ids', ks_df_informations.get('company_ids') or [])
+        return ks_filter
+
     def ks_build_aging_where_clause(self, ks_df_informations):
         domain = ['|', ('company_id', 'in', ks_df_informations.get('company_ids')), ('company_id', '=', False)]
         if self.ks_partner_type == 'customer':
@@ -3350,16 +3538,118 @@ class ks_dynamic_financial_base(models.Model):
         else:
             partner_ids = self.env['account.move'].sudo().search([]).mapped('partner_id')
 
-        WHERE = " AND m.state IN ('posted', 'draft') "
+        return partner_ids, self.ks_build_aging_filter(ks_df_informations)
 
-        if ks_df_informations.get('ks_posted_entries') and not ks_df_informations.get('ks_unposted_entries'):
-            WHERE += " AND m.state = 'posted'"
-        elif ks_df_informations.get('ks_unposted_entries') and not ks_df_informations.get('ks_posted_entries'):
-            WHERE += " AND m.state = 'draft'"
+    def ks_fetch_aging_buckets(self, ks_df_informations, ks_type, ks_period_dict, ks_detail=False):
+        '''
+        Aging engine. Every open line is assigned to its due bucket by a single CASE expression and
+        the amounts are aggregated per partner in one query. Partial reconciliations are pre-aggregated
+        once for the lines in scope instead of running correlated sub-queries for each line.
+        :param ks_type: account type, asset_receivable or liability_payable
+        :param ks_period_dict: due buckets from ks_prepare_due_bucket_list
+        :param ks_detail: also return the detailed lines of each partner
+        :return: (dict {partner_id: {'count', 'range_0' ... 'range_6'}}, dict {partner_id: [lines]})
+        '''
+        ks_as_on_date = ks_df_informations['date'].get('ks_end_date')
+        ks_filter = self.ks_build_aging_filter(ks_df_informations)
+        if ks_df_informations.get('ks_partner_ids', []):
+            ks_filter.ks_add_any('l.partner_id', 'ks_partner_ids', ks_df_informations.get('ks_partner_ids'))
         else:
-            WHERE += " AND m.state IN ('posted', 'draft') "
+            ks_filter.ks_add('l.partner_id IS NOT NULL')
+        WHERE = ks_filter.ks_where()
+        ks_params = ks_filter.ks_query_params(ks_type=ks_type, ks_as_on_date=ks_as_on_date)
+
+        ks_bucket_case = ''
+        ks_bucket_sums = ''
+        for ks_period in ks_period_dict:
+            ks_start_key = 'ks_start_%s' % ks_period
+            ks_stop_key = 'ks_stop_%s' % ks_period
+            ks_params[ks_start_key] = ks_period_dict[ks_period].get('start')
+            ks_params[ks_stop_key] = ks_period_dict[ks_period].get('stop')
+            if ks_period_dict[ks_period].get('start') and ks_period_dict[ks_period].get('stop'):
+                ks_condition = "BETWEEN %%(%s)s AND %%(%s)s" % (ks_start_key, ks_stop_key)
+            elif not ks_period_dict[ks_period].get('start'):
+                ks_condition = ">= %%(%s)s" % ks_stop_key
+            else:
+                ks_condition = "<= %%(%s)s" % ks_start_key
+            ks_bucket_case += " WHEN COALESCE(l.date_maturity,l.date) %s THEN %s" % (ks_condition, ks_period)
+            ks_bucket_sums += ", COALESCE(SUM(ol.amount) FILTER (WHERE ol.bucket = %s),0) AS range_%s" % (
+                ks_period, ks_period)
+
+        ks_with = """
+            WITH ks_lines AS (
+                SELECT
+                    l.id, l.partner_id, l.balance, l.date, l.date_maturity, l.move_id, l.journal_id,
+                    l.account_id, l.company_currency_id,
+                    CASE %s END AS bucket
+                FROM
+                    account_move_line AS l
+                LEFT JOIN
+                    account_move AS m ON m.id = l.move_id
+                LEFT JOIN
+                    account_account AS a ON a.id = l.account_id
+                WHERE
+                    l.balance <> 0
+                    AND %s
+                    AND a.account_type = %%(ks_type)s
+                    AND l.date <= %%(ks_as_on_date)s
+            ),
+            ks_partials AS (
+                SELECT pr.credit_move_id AS line_id, pr.amount AS amount
+                FROM account_partial_reconcile pr
+                JOIN ks_lines kl ON kl.id = pr.credit_move_id
+                WHERE pr.max_date <= %%(ks_as_on_date)s
+                UNION ALL
+                SELECT pr.debit_move_id AS line_id, -pr.amount AS amount
+                FROM account_partial_reconcile pr
+                JOIN ks_lines kl ON kl.id = pr.debit_move_id
+                WHERE pr.max_date <= %%(ks_as_on_date)s
+            ),
+            ks_residuals AS (
+                SELECT line_id, SUM(amount) AS amount
+                FROM ks_partials
+                GROUP BY line_id
+            ),
+            ks_open_lines AS (
+                SELECT kl.*, kl.balance + COALESCE(r.amount, 0) AS amount
+                FROM ks_lines kl
+                LEFT JOIN ks_residuals r ON r.line_id = kl.id
+            )
+        """ % (ks_bucket_case, WHERE)
+
+        sql = ks_with + """
+            SELECT ol.partner_id AS partner_id, COUNT(*) AS count %s
+            FROM ks_open_lines ol
+            GROUP BY ol.partner_id
+        """ % ks_bucket_sums
+        self.env.cr.execute(sql, ks_params)
+        ks_buckets = {ks_row['partner_id']: ks_row for ks_row in self.env.cr.dictfetchall()}
 
-        return partner_ids, WHERE
+        ks_detail_lines = {}
+        if ks_detail and ks_buckets:
+            sql = ks_with + """
+                SELECT
+                    ol.partner_id AS partner_id,
+                    m.name AS move_name,
+                    m.id AS move_id,
+                    ol.date AS date,
+                    ol.date_maturity AS date_maturity,
+                    j.name AS journal_name,
+                    ol.company_currency_id AS company_currency_id,
+                    a.name AS account_name %s
+                FROM ks_open_lines ol
+                LEFT JOIN account_move AS m ON m.id = ol.move_id
+                LEFT JOIN account_account AS a ON a.id = ol.account_id
+                LEFT JOIN account_journal AS j ON j.id = ol.journal_id
+                GROUP BY ol.partner_id, ol.date, ol.date_maturity, m.id, m.name, j.name, a.name,
+                    ol.company_currency_id
+                ORDER BY ol.partner_id
+            """ % ks_bucket_sums
+            self.env.cr.execute(sql, ks_params)
+            for ks_row in self.env.cr.dictfetchall():
+                if any(ks_row['range_%s' % ks_period] for ks_period in ks_period_dict):
+                    ks_detail_lines.setdefault(ks_row['partner_id'], []).append(ks_row)
+        return ks_buckets, ks_detail_lines
 
     def ks_partner_aging_process_data(self, ks_df_informations):
         ''' Query Start Here
@@ -3372,12 +3662,11 @@ class ks_dynamic_financial_base(models.Model):
             'ks_as_on_date_amount': 0.0,
             'total': 0.0}]
         1. Prepare ks_due_bucket range list from ks_due_bucket values
-        2. Fetch partner_ids and loop through ks_due_bucket range for values
+        2. Fetch the bucket totals of all partners at once with ks_fetch_aging_buckets
         '''
         ks_as_on_date = ks_df_informations['date'].get('ks_end_date')
         ks_period_dict = self.ks_prepare_due_bucket_list(ks_as_on_date)
         ks_company_id = self.env['res.company'].sudo().browse(ks_df_informations.get('company_id'))
-        ks_company_ids = ks_df_informations.get('company_ids')
         company_currency_id = ks_company_id.currency_id.id
 
         if self.id == self.env.ref('ks_dynamic_financial_report.ks_df_receivable0').id:
@@ -3385,116 +3674,41 @@ class ks_dynamic_financial_base(models.Model):
         else:
             ks_type = 'liability_payable'
 
-        ks_partner_ids, WHERE = self.ks_build_aging_where_clause(ks_df_informations)
-        ks_partner_dict = {}
-        ks_partner_dict_list = []
-        if ks_partner_ids:
-            ks_partner_ids = ks_partner_ids.sorted('id')
-        for ks_partner in ks_partner_ids:
-            ks_partner_dict.update({ks_partner.id: {}})
-            ks_partner_dict_list.append(ks_partner.id)
+        ks_buckets, ks_detail_lines = self.ks_fetch_aging_buckets(
+            ks_df_informations, ks_type, ks_period_dict, ks_detail=ks_df_informations.get('ks_report_with_lines'))
+        lang = self.env.user.lang
+        lang_id = self.env['res.lang'].search([('code', '=', lang)])['date_format'].replace('/', '-')
 
-        ks_partner_dict.update({'Total': {}})
+        ks_partner_dict = {}
+        ks_total = {}
         for ks_period in ks_period_dict:
-            ks_partner_dict['Total'].update({ks_period_dict[ks_period]['name']: 0.0})
-        ks_partner_dict['Total'].update({'total': 0.0, 'partner_name': 'ZZZZZZZZZ'})
-        ks_partner_dict['Total'].update({'company_currency_id': company_currency_id})
+            ks_total.update({ks_period_dict[ks_period]['name']: 0.0})
+        ks_total.update({'total': 0.0, 'partner_name': 'ZZZZZZZZZ'})
+        ks_total.update({'company_currency_id': company_currency_id})
 
-        for ks_partner in ks_partner_ids:
-            ks_partner_dict[ks_partner.id].update({'partner_name': ks_partner.name})
+        for ks_partner in self.env['res.partner'].browse(sorted(ks_buckets)):
+            ks_bucket = ks_buckets[ks_partner.id]
             ks_total_balance = 0.0
-
-            sql = """
-                SELECT
-                    COUNT(*) AS count
-                FROM
-                    account_move_line AS l
-                LEFT JOIN
-                    account_move AS m ON m.id = l.move_id
-                LEFT JOIN
-                    account_account AS a ON a.id = l.account_id
-                WHERE
-                    l.balance <> 0
-                    %s
-                    AND a.account_type = '%s'
-                    AND l.partner_id = %s
-                    AND l.date <= '%s'
-                    AND l.company_id in %s
-            """ % (WHERE, ks_type, ks_partner.id, ks_as_on_date, str(tuple(ks_company_ids) + tuple([0])))
-            self.env.cr.execute(sql)
-            ks_fetch_dict = self.env.cr.dictfetchone() or 0.0
-            count = ks_fetch_dict.get('count') or 0.0
-
-            if count:
-                for ks_period in ks_period_dict:
-
-                    ks_where = " AND l.date <= '%s' AND l.partner_id = %s AND COALESCE(l.date_maturity,l.date) " % (
-                        ks_as_on_date, ks_partner.id)
-                    if ks_period_dict[ks_period].get('start') and ks_period_dict[ks_period].get('stop'):
-                        ks_where += " BETWEEN '%s' AND '%s'" % (
-                            ks_period_dict[ks_period].get('start'), ks_period_dict[ks_period].get('stop'))
-                    elif not ks_period_dict[ks_period].get('start'):  # ie just
-                        ks_where += " >= '%s'" % (ks_period_dict[ks_period].get('stop'))
-                    else:
-                        ks_where += " <= '%s'" % (ks_period_dict[ks_period].get('start'))
-
-                    sql = """
-                        SELECT
-                            sum(l.balance) AS balance,
-                            sum(COALESCE((SELECT SUM(amount)FROM account_partial_reconcile
-                                WHERE credit_move_id = l.id AND max_date <= '%s'), 0)) AS sum_debit,
-                            sum(COALESCE((SELECT SUM(amount) FROM account_partial_reconcile 
-                                WHERE debit_move_id = l.id AND max_date <= '%s'), 0)) AS sum_credit
-                        FROM
-                            account_move_line AS l
-                        LEFT JOIN
-                            account_move AS m ON m.id = l.move_id
-                        LEFT JOIN
-                            account_account AS a ON a.id = l.account_id
-                        WHERE
-                            l.balance <> 0
-                            %s
-                            AND a.account_type = '%s'
-                            AND l.company_id in %s  
-
-                    """ % (ks_as_on_date, ks_as_on_date, WHERE, ks_type, str(tuple(ks_company_ids) + tuple([0])))
-                    amount = 0.0
-                    self.env.cr.execute(sql + ks_where)
-                    ks_fetch_dict = self.env.cr.dictfetchall() or 0.0
-
-                    if not ks_fetch_dict[0].get('balance'):
-                        ks_amount = 0.0
-                    else:
-                        ks_amount = ks_fetch_dict[0]['balance'] + ks_fetch_dict[0]['sum_debit'] - ks_fetch_dict[0][
-                            'sum_credit']
-                        ks_total_balance += ks_amount
-
-                    ks_partner_dict[ks_partner.id].update({ks_period_dict[ks_period]['name']: ks_amount})
-                    ks_partner_dict['Total'][ks_period_dict[ks_period]['name']] += ks_amount
-                ks_partner_dict[ks_partner.id].update({'count': count})
-                ks_partner_dict[ks_partner.id].update({'pages': self.ks_fetch_page_list(count)})
-                ks_partner_dict[ks_partner.id].update({'single_page': True if count <= FETCH_RANGE else False})
-                ks_partner_dict[ks_partner.id].update({'total': ks_total_balance})
-                ks_partner_dict[ks_partner.id]['lines'] = \
-                    self.ks_process_aging_data(ks_df_informations, offset=0, ks_partner=ks_partner.id,
-                                               fetch_range=FETCH_RANGE)[2]
-                ks_partner_dict['Total']['total'] += ks_total_balance
-                ks_partner_dict[ks_partner.id].update({'company_currency_id': company_currency_id})
-                ks_partner_dict['Total'].update({'company_currency_id': company_currency_id})
-
-                for i in range(0, len(ks_partner_dict[ks_partner.id]['lines'])):
-                    lang = self.env.user.lang
-                    lang_id = self.env['res.lang'].search([('code', '=', lang)])['date_format'].replace('/', '-')
-
-                    if ks_partner_dict[ks_partner.id]['lines'][i]['date_maturity']:
-                        ks_partner_dict[ks_partner.id]['lines'][i]['date_maturity'] = \
-                            ks_partner_dict[ks_partner.id]['lines'][i]['date_maturity'].strftime(lang_id)
-                    # ks_partner_dict[ks_partner.id]['lines'][i]['date_maturity'] = datetime.datetime.strptime(dt_con_dt_maturity, lang_id).date()
-
-            else:
-
-                ks_partner_dict.pop(ks_partner.id, None)
-
+            ks_partner_dict[ks_partner.id] = {'partner_name': ks_partner.name}
+            for ks_period in ks_period_dict:
+                ks_amount = ks_bucket['range_%s' % ks_period]
+                ks_total_balance += ks_amount
+                ks_partner_dict[ks_partner.id].update({ks_period_dict[ks_period]['name']: ks_amount})
+                ks_total[ks_period_dict[ks_period]['name']] += ks_amount
+            count = ks_bucket['count']
+            ks_partner_dict[ks_partner.id].update({'count': count})
+            ks_partner_dict[ks_partner.id].update({'pages': self.ks_fetch_page_list(count)})
+            ks_partner_dict[ks_partner.id].update({'single_page': True if count <= FETCH_RANGE else False})
+            ks_partner_dict[ks_partner.id].update({'total': ks_total_balance})
+            ks_partner_dict[ks_partner.id]['lines'] = ks_detail_lines.get(ks_partner.id, [])
+            ks_total['total'] += ks_total_balance
+            ks_partner_dict[ks_partner.id].update({'company_currency_id': company_currency_id})
+
+            for ks_line in ks_partner_dict[ks_partner.id]['lines']:
+                if ks_line['date_maturity']:
+                    ks_line['date_maturity'] = ks_line['date_maturity'].strftime(lang_id)
+
+        ks_partner_dict['Total'] = ks_total
         return ks_period_dict, ks_partner_dict
 
     def ks_process_aging_data(self, ks_df_informations, offset=0, ks_partner=0, fetch_range=FETCH_RANGE):
@@ -3509,9 +3723,7 @@ class ks_dynamic_financial_base(models.Model):
         ks_as_on_date = ks_df_informations['date'].get('ks_end_date')
         ks_period_dict = self.ks_prepare_due_bucket_list(ks_as_on_date)
         ks_period_list = [ks_period_dict[a]['name'] for a in ks_period_dict]
-        ks_company_id = ks_df_informations.get('company_id')
-        ks_company_ids = ks_df_informations.get('company_ids')
-        ks_partner_ids, WHERE = self.ks_build_aging_where_clause(ks_df_informations)
+        ks_filter = self.ks_build_aging_filter(ks_df_informations)
         if self.id == self.env.ref('ks_dynamic_financial_report.ks_df_receivable0').id:
             ks_type = 'asset_receivable'
         else:
@@ -3521,6 +3733,19 @@ class ks_dynamic_financial_base(models.Model):
         count = 0
 
         if ks_partner:
+            WHERE = ks_filter.ks_where(
+                'l.balance <> 0',
+                'a.account_type = %(ks_type)s',
+                'l.partner_id = %(ks_partner)s',
+                'l.date <= %(ks_as_on_date)s',
+            )
+            ks_params = ks_filter.ks_query_params(
+                ks_type=ks_type,
+                ks_partner=ks_partner,
+                ks_as_on_date=ks_as_on_date,
+                ks_offset=offset,
+                ks_fetch_range=fetch_range,
+            )
 
             sql = """
                     SELECT COUNT(*)
@@ -3532,15 +3757,9 @@ class ks_dynamic_financial_base(models.Model):
                         account_account AS a ON a.id = l.account_id
                     LEFT JOIN
                         account_journal AS j ON l.journal_id = j.id
-                    WHERE
-                        l.balance <> 0
-                        %s
-                        AND a.account_type =  '%s'
-                        AND l.partner_id = %s
-                        AND l.date <= '%s'
-                        AND l.company_id in %s
-                """ % (WHERE, ks_type, ks_partner, ks_as_on_date, str(tuple(ks_company_ids) + tuple([0])))
-            self.env.cr.execute(sql)
+                    WHERE %s
+                """ % WHERE
+            self.env.cr.execute(sql, ks_params)
             count = self.env.cr.fetchone()[0]
 
             SELECT = """SELECT m.name AS move_name,
@@ -3551,64 +3770,37 @@ class ks_dynamic_financial_base(models.Model):
                                 cc.id AS company_currency_id,
                                 a.name AS account_name, """
 
+            ks_columns = []
             for ks_period in ks_period_dict:
+                ks_start_key = 'ks_start_%s' % ks_period
+                ks_stop_key = 'ks_stop_%s' % ks_period
+                ks_params[ks_start_key] = ks_period_dict[ks_period].get('start')
+                ks_params[ks_stop_key] = ks_period_dict[ks_period].get('stop')
                 if ks_period_dict[ks_period].get('start') and ks_period_dict[ks_period].get('stop'):
-                    SELECT += """ CASE 
-                                    WHEN 
-                                        COALESCE(l.date_maturity,l.date) <= '%s' AND 
-                                        COALESCE(l.date_maturity,l.date) >= '%s'
-                                    THEN
-                                        sum(l.balance) +sum(COALESCE((SELECT SUM(amount)
-                                                FROM account_partial_reconcile
-                                                WHERE credit_move_id = l.id AND max_date <= '%s'), 0
-                                                )) -
-                                        sum(COALESCE((SELECT SUM(amount) 
-                                                FROM account_partial_reconcile 
-                                                WHERE debit_move_id = l.id AND max_date <= '%s'), 0
-                                                ))
-                                    ELSE
-                                        0
-                                    END AS %s,""" % (ks_period_dict[ks_period].get('stop'),
-                                                     ks_period_dict[ks_period].get('start'),
-                                                     ks_as_on_date,
-                                                     ks_as_on_date,
-                                                     'range_' + str(ks_period),
-                                                     )
+                    ks_condition = """
+                                        COALESCE(l.date_maturity,l.date) <= %%(%s)s AND 
+                                        COALESCE(l.date_maturity,l.date) >= %%(%s)s""" % (ks_stop_key, ks_start_key)
                 elif not ks_period_dict[ks_period].get('start'):
-                    SELECT += """ CASE 
-                                    WHEN 
-                                        COALESCE(l.date_maturity,l.date) >= '%s' 
-                                    THEN
-                                        sum(l.balance) +
-                                        sum(COALESCE(
-                                                (SELECT SUM(amount)
-                                                FROM account_partial_reconcile
-                                                WHERE credit_move_id = l.id AND max_date <= '%s'), 0)) -
-                                        sum(COALESCE((SELECT SUM(amount) 
-                                                FROM account_partial_reconcile 
-                                                WHERE debit_move_id = l.id AND max_date <= '%s'), 0
-                                                ))
-                                    ELSE
-                                        0
-                                    END AS %s,""" % (
-                        ks_period_dict[ks_period].get('stop'), ks_as_on_date, ks_as_on_date, 'range_' + str(ks_period))
+                    ks_condition = """
+                                        COALESCE(l.date_maturity,l.date) >= %%(%s)s""" % ks_stop_key
                 else:
-                    SELECT += """ CASE
-                                    WHEN
-                                        COALESCE(l.date_maturity,l.date) <= '%s' 
-                                    THEN sum(l.balance) +
-                                        sum(COALESCE((SELECT SUM(amount)
+                    ks_condition = """
+                                        COALESCE(l.date_maturity,l.date) <= %%(%s)s""" % ks_start_key
+                ks_columns.append(""" CASE 
+                                    WHEN %s
+                                    THEN
+                                        sum(l.balance) +sum(COALESCE((SELECT SUM(amount)
                                                 FROM account_partial_reconcile
-                                                WHERE credit_move_id = l.id AND max_date <= '%s'), 0
+                                                WHERE credit_move_id = l.id AND max_date <= %%(ks_as_on_date)s), 0
                                                 )) -
                                         sum(COALESCE((SELECT SUM(amount) 
                                                 FROM account_partial_reconcile 
-                                                WHERE debit_move_id = l.id AND max_date <= '%s'), 0
+                                                WHERE debit_move_id = l.id AND max_date <= %%(ks_as_on_date)s), 0
                                                 ))
                                     ELSE
                                         0
-                                    END AS %s """ % (
-                        ks_period_dict[ks_period].get('start'), ks_as_on_date, ks_as_on_date, 'range_' + str(ks_period))
+                                    END AS %s""" % (ks_condition, 'range_' + str(ks_period)))
+            SELECT += ','.join(ks_columns)
 
             sql = """
                     FROM
@@ -3621,20 +3813,13 @@ class ks_dynamic_financial_base(models.Model):
                         account_journal AS j ON l.journal_id = j.id
                     LEFT JOIN 
                         res_currency AS cc ON l.company_currency_id = cc.id
-                    WHERE
-                        l.balance <> 0
-                        %s
-                        AND a.account_type = '%s'
-                        AND l.partner_id = %s
-                        AND l.date <= '%s'
-                        AND l.company_id in %s
+                    WHERE %s
                     GROUP BY
                         l.date, l.date_maturity, m.id, m.name, j.name, a.name, cc.id
-                    OFFSET %s ROWS
-                    FETCH FIRST %s ROWS ONLY
-                """ % (
-                WHERE, ks_type, ks_partner, ks_as_on_date, str(tuple(ks_company_ids) + tuple([0])), offset, fetch_range)
-            self.env.cr.execute(SELECT + sql)
+                    OFFSET %%(ks_offset)s ROWS
+                    FETCH FIRST %%(ks_fetch_range)s ROWS ONLY
+                """ % WHERE
+            self.env.cr.execute(SELECT + sql, ks_params)
             ks_final_list = self.env.cr.dictfetchall() or 0.0
             ks_move_lines = []
             if ks_final_list:
@@ -3927,10 +4112,52 @@ class ks_dynamic_financial_base(models.Model):
         ks_df_informations['ks_account_both_enable'] = self._context.get('ks_account_both_enable', False)
         ks_df_informations['print_detailed_view'] = print_detailed_view
 
-        ks_sublines, ks_month_lines, ks_initial_balance, ks_period_list, ks_partner_dict, ks_period_dict, ks_current_balance, ks_ending_balance, ks_retained, ks_subtotal, ks_report_lines, ks_partner_dict_list = 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
-        self.ks_df_report_account_report_ids = self
+        if self.ks_df_report_account_report_ids != self:
+            self.ks_df_report_account_report_ids = self
 
         ks_df_informations['ks_filter_context'] = self.ks_filter_context(ks_df_informations)
+        ks_values = self.env['ks.dynamic.financial.cache'].ks_get_or_compute(
+            self, ks_df_informations, lambda: self._ks_compute_dynamic_fin_info(ks_df_informations))
+        ks_df_informations.update(ks_values.pop('ks_df_informations'))
+
+        company_id = self.env.company
+
+        ks_searchview_dict = {'ks_df_informations': ks_df_informations, 'context': self.env.context,
+                              'ks_df_reports_ids': self.ks_df_report_account_report_ids}
+
+        info = {
+            'ks_df_reports_ids': self.ks_df_report_account_report_ids.ks_comparison_range,
+            'ks_enable_ledger_in_bal': self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal',
+                                                                                        False),
+            'ks_df_informations': ks_df_informations,
+            'context': self.env.context,
+            'ks_searchview_html': self.env['ir.ui.view']._render_template('ks_dynamic_financial_report'
+                                                                          '.ks_searchview_filters',
+                                                                          values=ks_searchview_dict),
+            'ks_buttons': self.env['ir.ui.view']._render_template('ks_dynamic_financial_report.ks_repport_buttons'),
+            'ks_currency': company_id.currency_id.id,
+            'new_ks_df_reports_ids': self.ks_df_report_account_report_ids.ks_name,
+            'ks_report_lines': ks_values['ks_report_lines'],
+            'ks_initial_balance': ks_values['ks_initial_balance'] or 0.0,
+            'ks_current_balance': ks_values['ks_current_balance'] or 0.0,
+            'ks_ending_balance': ks_values['ks_ending_balance'] or 0.0,
+            'ks_retained': ks_values['ks_retained'] or False,
+            'ks_subtotal': ks_values['ks_subtotal'] or False,
+            'ks_period_list': ks_values['ks_period_list'] or False,
+            'ks_partner_dict': ks_values['ks_partner_dict'] or False,
+            'ks_period_dict': ks_values['ks_period_dict'] or False,
+            'ks_month_lines': ks_values['ks_month_lines'],
+            'ks_sub_lines': ks_values['ks_sub_lines'],
+
+        }
+        return info
+
+    def _ks_compute_dynamic_fin_info(self, ks_df_informations):
+        '''
+        Compute the lines of the report, the part of ks_get_dynamic_fin_info served from the cache
+        :return: dict of the report values, with the filters as updated by the computation
+        '''
+        ks_sublines, ks_month_lines, ks_initial_balance, ks_period_list, ks_partner_dict, ks_period_dict, ks_current_balance, ks_ending_balance, ks_retained, ks_subtotal, ks_report_lines, ks_partner_dict_list = 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
         if self.id == self.env.ref('ks_dynamic_financial_report.ks_df_tb0').id:
             ks_report_lines, ks_retained, ks_subtotal = self.ks_process_trial_balance(ks_df_informations)
         elif self.id == self.env.ref('ks_dynamic_financial_report.ks_df_receivable0').id:
@@ -3951,37 +4178,20 @@ class ks_dynamic_financial_base(models.Model):
         else:
             ks_report_lines, ks_initial_balance, ks_current_balance, ks_ending_balance = self.ks_fetch_report_account_lines(
                 ks_df_informations)
-        company_id = self.env.company
-
-        ks_searchview_dict = {'ks_df_informations': ks_df_informations, 'context': self.env.context,
-                              'ks_df_reports_ids': self.ks_df_report_account_report_ids}
-
-        info = {
-            'ks_df_reports_ids': self.ks_df_report_account_report_ids.ks_comparison_range,
-            'ks_enable_ledger_in_bal': self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal',
-                                                                                        False),
-            'ks_df_informations': ks_df_informations,
-            'context': self.env.context,
-            'ks_searchview_html': self.env['ir.ui.view']._render_template('ks_dynamic_financial_report'
-                                                                          '.ks_searchview_filters',
-                                                                          values=ks_searchview_dict),
-            'ks_buttons': self.env['ir.ui.view']._render_template('ks_dynamic_financial_report.ks_repport_buttons'),
-            'ks_currency': company_id.currency_id.id,
-            'new_ks_df_reports_ids': self.ks_df_report_account_report_ids.ks_name,
+        return {
             'ks_report_lines': ks_report_lines,
-            'ks_initial_balance': ks_initial_balance or 0.0,
-            'ks_current_balance': ks_current_balance or 0.0,
-            'ks_ending_balance': ks_ending_balance or 0.0,
-            'ks_retained': ks_retained or False,
-            'ks_subtotal': ks_subtotal or False,
-            'ks_period_list': ks_period_list or False,
-            'ks_partner_dict': ks_partner_dict or False,
-            'ks_period_dict': ks_period_dict or False,
+            'ks_initial_balance': ks_initial_balance,
+            'ks_current_balance': ks_current_balance,
+            'ks_ending_balance': ks_ending_balance,
+            'ks_retained': ks_retained,
+            'ks_subtotal': ks_subtotal,
+            'ks_period_list': ks_period_list,
+            'ks_partner_dict': ks_partner_dict,
+            'ks_period_dict': ks_period_dict,
             'ks_month_lines': ks_month_lines,
             'ks_sub_lines': ks_sublines,
-
+            'ks_df_informations': {k: v for k, v in ks_df_informations.items() if k != 'ks_filter_context'},
         }
-        return info
 
     ####################################################################################
     # Journal options
@@ -4404,7 +4614,8 @@ class ks_dynamic_financial_base(models.Model):
             ks_df_informations, ks_eariler_informations)
 
         if ks_differentiate_filter == 'no_differentiation':
-            self.ks_dif_filter_bool = False
+            if self.ks_dif_filter_bool:
+                self.ks_dif_filter_bool = False
             return
 
         self.ks_construct_dif_informations(ks_df_informations, ks_differentiate_filter, ks_no_of_interval,
@@ -4820,6 +5031,17 @@ class ks_dynamic_financial_base(models.Model):
         #              'financial_id': self.env.context.get('id'),
         #              }
         # }
+        if self.env['ir.config_parameter'].sudo().get_param('ks_queue_xlsx_export'):
+            self.env['ks.dynamic.financial.export'].ks_enqueue_export(self, ks_df_informations)
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'type': 'info',
+                    'message': _('The export is being generated, you will be notified when it is ready.'),
+                    'sticky': False,
+                },
+            }
         return {
             'type': 'ir.actions.client',
             'tag': 'ks_executexlsxReportDownloadAction',
@@ -1,4 +1,5 @@
 import ast
+import io
 import json
 
 from odoo import models, fields, api, _
@@ -121,6 +122,7 @@ class KsDynamicFinancialReportBase(models.Model):
         res = super(KsDynamicFinancialReportBase, self).create(vals)
         if ks_report_menu_id:
             res._ks_create_menu_and_action(ks_report_menu_id)
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
         return res
 
     def write(self, vals):
@@ -130,6 +132,7 @@ class KsDynamicFinancialReportBase(models.Model):
         ks_name = vals.get('ks_name', False)
         ks_sequence = vals.get('ks_sequence', False)
         res = super(KsDynamicFinancialReportBase, self).write(vals)
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
 
         if not ks_update_menu:
             for ks_report in self:
@@ -148,6 +151,29 @@ class KsDynamicFinancialReportBase(models.Model):
                 ks_report._ks_create_menu_and_action(ks_menu_parent_id)
         return res
 
+    def ks_get_xlsx_file(self, ks_df_informations):
+        '''
+        Build the XLSX export of the report
+        :return: file object positioned at the start of the workbook
+        '''
+        self.ensure_one()
+        ks_dynamic_report_name = self.report_name if self.report_name else self.display_name
+        if ks_dynamic_report_name == 'General Ledger':
+            return self.ks_stream_xlsx_general_ledger(ks_df_informations)
+        if ks_dynamic_report_name == 'Partner Ledger':
+            return self.ks_stream_xlsx_partner_ledger(ks_df_informations)
+        if ks_dynamic_report_name == 'Trial Balance':
+            ks_content = self.ks_get_xlsx_trial_balance(ks_df_informations)
+        elif ks_dynamic_report_name in ('Age Receivable', 'Age Payable'):
+            ks_content = self.ks_get_xlsx_Aging(ks_df_informations)
+        elif ks_dynamic_report_name == 'Tax Report':
+            ks_content = self.ks_dynamic_tax_xlsx(ks_df_informations)
+        elif ks_dynamic_report_name == 'Consolidate Journal':
+            ks_content = self.ks_dynamic_consolidate_xlsx(ks_df_informations)
+        else:
+            ks_content = self.get_xlsx(ks_df_informations)
+        return io.BytesIO(ks_content)
+
     def unlink(self):
         for ks_report in self:
             ks_menu = ks_report.ks_report_menu_id
@@ -155,6 +181,7 @@ class KsDynamicFinancialReportBase(models.Model):
                 if ks_menu.action:
                     ks_menu.action.unlink()
                 ks_menu.unlink()
+        self.env['ks.dynamic.financial.cache'].ks_bump_ledger_version()
         return super(KsDynamicFinancialReportBase, self).unlink()
 
 
@@ -12,4 +12,5 @@ class ResConfigSettings(models.TransientModel):
                                         config_parameter='ks_disable_bs_sign')
     ks_enable_net_tax = fields.Boolean('Enable Net Tax',
                                              config_parameter='ks_enable_net_tax')
-
+    ks_queue_xlsx_export = fields.Boolean('Queue Excel Exports',
+                                          config_parameter='ks_queue_xlsx_export')
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import io
+import tempfile
 from odoo import models, api, _
 from odoo.tools.misc import xlsxwriter
 import datetime
@@ -13,8 +14,38 @@ class KsDynamicFinancialXlsxGL(models.Model):
     def ks_get_xlsx_general_ledger(self, ks_df_informations):
         output = io.BytesIO()
         workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-        currency_id = self.env.user.company_id.currency_id
         move_lines = self.ks_process_general_ledger(ks_df_informations)
+        self._ks_write_xlsx_general_ledger(
+            workbook, ks_df_informations, ((ks_line, ks_line['lines']) for ks_line in move_lines[0].values()))
+        workbook.close()
+        output.seek(0)
+        generated_file = output.read()
+        output.close()
+
+        return generated_file
+
+    @api.model
+    def ks_stream_xlsx_general_ledger(self, ks_df_informations):
+        '''
+        Streaming export of the General Ledger. The move lines are read from a server side cursor
+        and written row by row by xlsxwriter in constant_memory mode into a temporary file, so the
+        memory used does not depend on the number of lines.
+        :return: temporary file object holding the workbook, positioned at its start
+        '''
+        output = tempfile.TemporaryFile()
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+        self._ks_write_xlsx_general_ledger(workbook, ks_df_informations,
+                                           self.ks_iter_general_ledger(ks_df_informations))
+        workbook.close()
+        output.seek(0)
+        return output
+
+    def _ks_write_xlsx_general_ledger(self, workbook, ks_df_informations, ks_accounts):
+        '''
+        Write the General Ledger sheet. Rows are written in increasing order so the sheet can be
+        written by a workbook in constant_memory mode.
+        :param ks_accounts: iterable of (account values, detail lines)
+        '''
         ks_company_id = self.env['res.company'].sudo().browse(ks_df_informations.get('company_id'))
 
         sheet = workbook.add_worksheet('General Ledger')
@@ -131,37 +162,33 @@ class KsDynamicFinancialXlsxGL(models.Model):
         ks_new_end_date = (datetime.datetime.strptime(
             str(new_end_date), '%Y-%m-%d').date()).strftime(lang_id)
         if ks_df_informations:
-            # Date from
+            # Titles first, then values: the rows must be written in order
             sheet.write_string(row_pos_2, 0, _('Date From'), format_header)
-            sheet.write_string(row_pos_2 + 1, row_pos_2, ks_new_start_date,
-                               content_header_date)
-
-            sheet.write_string(row_pos_2, row_pos_2 + 1, _('Date To'), format_header)
+            sheet.write_string(row_pos_2, 1, _('Date To'), format_header)
+            sheet.write_string(row_pos_2, 3, _('Journals'), format_header)
+            if ks_df_informations.get('analytic_accounts'):
+                sheet.write_string(row_pos_2, 5, _('Analytic Accounts'), format_header)
+            if ks_df_informations.get('analytic_tags'):
+                sheet.write_string(row_pos_2, 6, _('Tags'), format_header)
+            sheet.write_string(row_pos_2, 7, _('Accounts'), format_header)
 
-            sheet.write_string(row_pos_2 + 1, row_pos_2 + 1, ks_new_end_date,
-                               content_header_date)
+            # Date from
+            sheet.write_string(row_pos_2 + 1, 0, ks_new_start_date, content_header_date)
+            sheet.write_string(row_pos_2 + 1, 1, ks_new_end_date, content_header_date)
 
             # Journals
-            row_pos_2 += 0
-            sheet.write_string(row_pos_2, 3, _('Journals'), format_header)
             j_list = ', '.join(
                 journal.get('code') or '' for journal in ks_df_informations['journals'] if journal.get('selected'))
             sheet.write_string(row_pos_2 + 1, 3, j_list, content_header)
-            #
-            # # Accounts
-            row_pos_2 += 0
+
+            # Accounts
             if ks_df_informations.get('analytic_accounts'):
-                sheet.write_string(row_pos_2, 5, _('Analytic Accounts'), format_header)
                 a_list = ', '.join(lt or '' for lt in ks_df_informations['selected_analytic_account_names'])
                 sheet.write_string(row_pos_2 + 1, 5, a_list, content_header)
-            row_pos_2 += 0
             if ks_df_informations.get('analytic_tags'):
-                sheet.write_string(row_pos_2, 6, _('Tags'), format_header)
                 a_list = ', '.join(lt or '' for lt in ks_df_informations['selected_analytic_tag_names'])
                 sheet.write_string(row_pos_2 + 1, 6, a_list, content_header)
 
-            row_pos_2 += 0
-            sheet.write_string(row_pos_2, 7, _('Accounts'), format_header)
             j_list = ', '.join(
                 account.get('name') or '' for account in ks_df_informations['account'] if account.get('selected'))
             sheet.write_string(row_pos_2 + 1, 7, j_list, content_header)
@@ -216,112 +243,95 @@ class KsDynamicFinancialXlsxGL(models.Model):
                 sheet.write_string(row_pos, 7, _('Balance'),
                                    format_header)
 
-        if move_lines:
-            for line in move_lines[0]:
-                # line = line[0]
-                row_pos += 1
-                sheet.merge_range(row_pos, 0, row_pos, 4,
-                                  '            ' + move_lines[0][line].get('code') + ' - ' + move_lines[0][line].get(
-                                      'name'),
-                                  line_header_left)
-                if self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal'):
-                    sheet.write_number(row_pos, 5, float(move_lines[0][line].get('initial_balance', 0)), line_header)
-                    sheet.write_number(row_pos, 6, float(move_lines[0][line].get('debit')), line_header)
-                    sheet.write_number(row_pos, 7, float(move_lines[0][line].get('credit')), line_header)
-                    sheet.write_number(row_pos, 8, float(move_lines[0][line].get('balance')), line_header)
-                else:
-                    sheet.write_number(row_pos, 5, float(move_lines[0][line].get('debit')), line_header)
-                    sheet.write_number(row_pos, 6, float(move_lines[0][line].get('credit')), line_header)
-                    sheet.write_number(row_pos, 7, float(move_lines[0][line].get('balance')), line_header)
-
-                if ks_df_informations.get('ks_report_with_lines', False):
-                    # offset = 0
-                    # account = line
+        ks_ledger_in_bal = self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal')
+        ks_lang_date_format = self.env['res.lang'].search([('code', '=', lang)])['date_format']
+        for ks_account, ks_lines in ks_accounts:
+            row_pos += 1
+            sheet.merge_range(row_pos, 0, row_pos, 4,
+                              '            ' + ks_account.get('code') + ' - ' + ks_account.get('name'),
+                              line_header_left)
+            if ks_ledger_in_bal:
+                sheet.write_number(row_pos, 5, float(ks_account.get('initial_balance', 0)), line_header)
+                sheet.write_number(row_pos, 6, float(ks_account.get('debit')), line_header)
+                sheet.write_number(row_pos, 7, float(ks_account.get('credit')), line_header)
+                sheet.write_number(row_pos, 8, float(ks_account.get('balance')), line_header)
+            else:
+                sheet.write_number(row_pos, 5, float(ks_account.get('debit')), line_header)
+                sheet.write_number(row_pos, 6, float(ks_account.get('credit')), line_header)
+                sheet.write_number(row_pos, 7, float(ks_account.get('balance')), line_header)
 
-                    # count, offset, sub_lines = self.with_context().build_detailed_move_lines(ks_df_informations,offset=0,account=line,
-                    #                                                           fetch_range=1000000)
-                    for sub_line in move_lines[0][line]['lines']:
-                        if sub_line['initial_bal']:
-                            row_pos += 1
-                            sheet.write_string(row_pos, 4, sub_line.get('move_name'),
+            if ks_df_informations.get('ks_report_with_lines', False):
+                for sub_line in ks_lines:
+                    if sub_line['initial_bal']:
+                        row_pos += 1
+                        sheet.write_string(row_pos, 4, sub_line.get('move_name'),
+                                           line_header_light_initial)
+                        if ks_ledger_in_bal:
+                            sheet.write_number(row_pos, 5, float(ks_account.get('initial_balance', 0)),
                                                line_header_light_initial)
-                            if self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal'):
-                                sheet.write_number(row_pos, 5, float(move_lines[0][line].get('initial_balance', 0)),
-                                                   line_header_light_initial)
-                                sheet.write_number(row_pos, 6, float(move_lines[0][line].get('debit')),
-                                                   line_header_light_initial)
-                                sheet.write_number(row_pos, 7, float(move_lines[0][line].get('credit')),
-                                                   line_header_light_initial)
-                                sheet.write_number(row_pos, 8, float(move_lines[0][line].get('balance')),
-                                                   line_header_light_initial)
-                            else:
-                                sheet.write_number(row_pos, 5, float(move_lines[0][line].get('debit')),
-                                                   line_header_light_initial)
-                                sheet.write_number(row_pos, 6, float(move_lines[0][line].get('credit')),
-                                                   line_header_light_initial)
-                                sheet.write_number(row_pos, 7, float(move_lines[0][line].get('balance')),
-                                                   line_header_light_initial)
-                        elif not sub_line['initial_bal'] and not sub_line['ending_bal']:
-                            row_pos += 1
-                            date_2 = sub_line.get('ldate')
-                            lang = self.env.user.lang
-                            lang_id = self.env['res.lang'].search([('code', '=', lang)])['date_format']
-                            new_date = date_2.strftime(lang_id)
-                            sheet.write(row_pos, 0, new_date,
-                                        line_header_light_date)
-                            sheet.write_string(row_pos, 1, sub_line.get('lcode'),
-                                               line_header_light)
-                            sheet.write_string(row_pos, 2, sub_line.get('partner_name') or '',
-                                               line_header_light)
-                            # sheet.write_string(row_pos, 3, sub_line.get('lref') or '',
-                            #                         line_header_light)
-                            sheet.write_string(row_pos, 3, sub_line.get('move_name'),
-                                               line_header_light)
-                            sheet.write_string(row_pos, 4, sub_line.get('lname') or '',
+                            sheet.write_number(row_pos, 6, float(ks_account.get('debit')),
+                                               line_header_light_initial)
+                            sheet.write_number(row_pos, 7, float(ks_account.get('credit')),
+                                               line_header_light_initial)
+                            sheet.write_number(row_pos, 8, float(ks_account.get('balance')),
+                                               line_header_light_initial)
+                        else:
+                            sheet.write_number(row_pos, 5, float(ks_account.get('debit')),
+                                               line_header_light_initial)
+                            sheet.write_number(row_pos, 6, float(ks_account.get('credit')),
+                                               line_header_light_initial)
+                            sheet.write_number(row_pos, 7, float(ks_account.get('balance')),
+                                               line_header_light_initial)
+                    elif not sub_line['initial_bal'] and not sub_line['ending_bal']:
+                        row_pos += 1
+                        new_date = sub_line.get('ldate').strftime(ks_lang_date_format)
+                        sheet.write(row_pos, 0, new_date,
+                                    line_header_light_date)
+                        sheet.write_string(row_pos, 1, sub_line.get('lcode'),
+                                           line_header_light)
+                        sheet.write_string(row_pos, 2, sub_line.get('partner_name') or '',
+                                           line_header_light)
+                        sheet.write_string(row_pos, 3, sub_line.get('move_name'),
+                                           line_header_light)
+                        sheet.write_string(row_pos, 4, sub_line.get('lname') or '',
+                                           line_header_light)
+                        if ks_ledger_in_bal:
+                            sheet.write_number(row_pos, 5,
+                                               float(sub_line.get('initial_balance', 0)), line_header_light)
+                            sheet.write_number(row_pos, 6,
+                                               float(sub_line.get('debit')), line_header_light)
+                            sheet.write_number(row_pos, 7,
+                                               float(sub_line.get('credit')), line_header_light)
+                            sheet.write_number(row_pos, 8,
+                                               float(sub_line.get('balance')) +
+                                               float(ks_account.get('initial_balance', 0)),
                                                line_header_light)
-                            if self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal'):
-                                sheet.write_number(row_pos, 5,
-                                                   float(sub_line.get('initial_balance', 0)), line_header_light)
-                                sheet.write_number(row_pos, 6,
-                                                   float(sub_line.get('debit')), line_header_light)
-                                sheet.write_number(row_pos, 7,
-                                                   float(sub_line.get('credit')), line_header_light)
-                                sheet.write_number(row_pos, 8,
-                                                   float(sub_line.get('balance')) +
-                                                   float(move_lines[0][line].get('initial_balance', 0)),
-                                                   line_header_light)
-                            else:
-                                sheet.write_number(row_pos, 5,
-                                                   float(sub_line.get('debit')), line_header_light)
-                                sheet.write_number(row_pos, 6,
-                                                   float(sub_line.get('credit')), line_header_light)
-                                sheet.write_number(row_pos, 7,
-                                                   float(sub_line.get('balance')), line_header_light)
-                        else:  # Ending Balance
-                            row_pos += 1
-
-                            sheet.write(row_pos, 4, sub_line.get('move_name'),
-                                        line_header_light_ending)
-                            if self.env['ir.config_parameter'].sudo().get_param('ks_enable_ledger_in_bal'):
-                                sheet.write_number(row_pos, 5, float(move_lines[0][line].get('initial_balance', 0)),
-                                                   line_header_light_ending)
-                                sheet.write_number(row_pos, 6, float(move_lines[0][line].get('debit')),
-                                                   line_header_light_ending)
-                                sheet.write_number(row_pos, 7, float(move_lines[0][line].get('credit')),
-                                                   line_header_light_ending)
-                                sheet.write_number(row_pos, 8, float(move_lines[0][line].get('balance')),
-                                                   line_header_light_ending)
+                        else:
+                            sheet.write_number(row_pos, 5,
+                                               float(sub_line.get('debit')), line_header_light)
+                            sheet.write_number(row_pos, 6,
+                                               float(sub_line.get('credit')), line_header_light)
+                            sheet.write_number(row_pos, 7,
+                                               float(sub_line.get('balance')), line_header_light)
+                    else:  # Ending Balance
+                        row_pos += 1
 
-                            else:
-                                sheet.write_number(row_pos, 5, float(move_lines[0][line].get('debit')),
-                                                   line_header_light_ending)
-                                sheet.write_number(row_pos, 6, float(move_lines[0][line].get('credit')),
-                                                   line_header_light_ending)
-                                sheet.write_number(row_pos, 7, float(move_lines[0][line].get('balance')),
-                                                   line_header_light_ending)
-        workbook.close()
-        output.seek(0)
-        generated_file = output.read()
-        output.close()
+                        sheet.write(row_pos, 4, sub_line.get('move_name'),
+                                    line_header_light_ending)
+                        if ks_ledger_in_bal:
+                            sheet.write_number(row_pos, 5, float(ks_account.get('initial_balance', 0)),
+                                               line_header_light_ending)
+                            sheet.write_number(row_pos, 6, float(ks_account.get('debit')),
+                                               line_header_light_ending)
+                            sheet.write_number(row_pos, 7, float(ks_account.get('credit')),
+                                               line_header_light_ending)
+                            sheet.write_number(row_pos, 8, float(ks_account.get('balance')),
+                                               line_header_light_ending)
 
-        return generated_file
+                        else:
+                            sheet.write_number(row_pos, 5, float(ks_account.get('debit')),
+                                               line_header_light_ending)
+                            sheet.write_number(row_pos, 6, float(ks_account.get('credit')),
+                                               line_header_light_ending)
+                            sheet.write_number(row_pos, 7, float(ks_account.get('balance')),
+                                               line_header_light_ending)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import io
+import tempfile
 from odoo import models, api, _, fields
 from odoo.tools.misc import xlsxwriter
 import datetime
@@ -14,6 +15,34 @@ class KsDynamicFinancialXlsxPL(models.Model):
         output = io.BytesIO()
         workbook = xlsxwriter.Workbook(output, {'in_memory': True})
         move_lines = self.ks_partner_process_data(ks_df_informations)
+        self._ks_write_xlsx_partner_ledger(
+            workbook, ks_df_informations, ((ks_line, ks_line['lines']) for ks_line in move_lines[0].values()))
+        workbook.close()
+        output.seek(0)
+        generated_file = output.read()
+        output.close()
+
+        return generated_file
+
+    @api.model
+    def ks_stream_xlsx_partner_ledger(self, ks_df_informations):
+        '''
+        Streaming export of the Partner Ledger, see ks_stream_xlsx_general_ledger
+        :return: temporary file object holding the workbook, positioned at its start
+        '''
+        output = tempfile.TemporaryFile()
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+        self._ks_write_xlsx_partner_ledger(workbook, ks_df_informations,
+                                           self.ks_iter_partner_ledger(ks_df_informations))
+        workbook.close()
+        output.seek(0)
+        return output
+
+    def _ks_write_xlsx_partner_ledger(self, workbook, ks_df_informations, ks_partners):
+        '''
+        Write the Partner Ledger sheet, rows in increasing order for constant_memory workbooks
+        :param ks_partners: iterable of (partner values, detail lines)
+        '''
         ks_company_id = self.env['res.company'].sudo().browse(ks_df_informations.get('company_id'))
         # lang = self.env.user.lang
         # language_id = self.env['res.lang'].search([('code','=',lang)])[0]
@@ -118,37 +147,28 @@ class KsDynamicFinancialXlsxPL(models.Model):
         ks_new_end_date = (datetime.datetime.strptime(
             str(for_e_date), '%Y-%m-%d').date()).strftime(lang_id)
         if ks_df_informations:
-            # Date from
+            # Titles first, then values: the rows must be written in order
             if ks_df_informations['date']['ks_process'] == 'range':
                 sheet.write_string(row_pos_2, 0, _('Date From'),
                                    format_header)
-                sheet.write_string(row_pos_2 + 1, row_pos_2, ks_new_start_date,
-                                   content_header_date)
-
-                sheet.write_string(row_pos_2, row_pos_2 + 1, _('Date To'),
+                sheet.write_string(row_pos_2, 1, _('Date To'),
                                    format_header)
-
-                sheet.write_string(row_pos_2 + 1, row_pos_2 + 1, ks_new_end_date,
-                                   content_header_date)
             else:
                 sheet.write_string(row_pos_2, 0, _('As of Date'),
                                    format_header)
+            sheet.write_string(row_pos_2, 3, _('Partners'),
+                               format_header)
 
-                sheet.write_string(row_pos_2 + 1, row_pos_2, ks_new_end_date,
+            # Date from
+            if ks_df_informations['date']['ks_process'] == 'range':
+                sheet.write_string(row_pos_2 + 1, 0, ks_new_start_date,
+                                   content_header_date)
+                sheet.write_string(row_pos_2 + 1, 1, ks_new_end_date,
+                                   content_header_date)
+            else:
+                sheet.write_string(row_pos_2 + 1, 0, ks_new_end_date,
                                    content_header_date)
 
-            # row_pos_2 += 0
-            # sheet.write_string(row_pos_2, 3, _('Journals'),
-            #                    format_header)
-            # j_list = ', '.join(
-            #     journal.get('code') or '' for journal in ks_df_informations['journals'] if journal.get('selected'))
-            # sheet.write_string(row_pos_2 + 1, 3, j_list,
-            #                    content_header)
-
-            row_pos_2 += 0
-
-            sheet.write_string(row_pos_2, 3, _('Partners'),
-                               format_header)
             p_list = ', '.join(lt or '' for lt in ks_df_informations['ks_selected_partner_name'])
             sheet.write_string(row_pos_2 + 1, 3, p_list,
                                content_header)
@@ -156,16 +176,14 @@ class KsDynamicFinancialXlsxPL(models.Model):
             row_pos_2 += 3
             sheet.write_string(row_pos_2, 0, _('Reconciled'),
                                format_header)
+            sheet.write_string(row_pos_2, 3, _('Accounts'),
+                               format_header)
             if ks_df_informations['ks_reconciled']:
                 sheet.write_string(row_pos_2 + 1, 0, 'Yes',
                                    content_header)
             else:
                 sheet.write_string(row_pos_2 + 1, 0, 'No',
                                    content_header)
-
-            row_pos_2 += 0
-            sheet.write_string(row_pos_2, 3, _('Accounts'),
-                               format_header)
             pt_list = ', '.join(lt.get('name') or '' for lt in ks_df_informations['account_type'] if lt.get('selected'))
             sheet.write_string(row_pos_2 + 1, 3, pt_list,
                                content_header)
@@ -199,66 +217,54 @@ class KsDynamicFinancialXlsxPL(models.Model):
                                format_header)
             sheet.write_string(row_pos, 7, _('Balance'),
                                format_header)
-        if move_lines:
-            for line in move_lines[0]:
-                row_pos += 1
-                sheet.merge_range(row_pos, 0, row_pos, 4, move_lines[0][line].get('name'), line_header)
-                sheet.write_number(row_pos, 5, float(move_lines[0][line].get('debit')), line_header)
-                sheet.write_number(row_pos, 6, float(move_lines[0][line].get('credit')), line_header)
-                sheet.write_number(row_pos, 7, float(move_lines[0][line].get('balance')), line_header)
-
-                if ks_df_informations.get('ks_report_with_lines', False):
+        ks_lang_date_format = self.env['res.lang'].search([('code', '=', lang)])['date_format']
+        for ks_partner, ks_lines in ks_partners:
+            row_pos += 1
+            sheet.merge_range(row_pos, 0, row_pos, 4, ks_partner.get('name'), line_header)
+            sheet.write_number(row_pos, 5, float(ks_partner.get('debit')), line_header)
+            sheet.write_number(row_pos, 6, float(ks_partner.get('credit')), line_header)
+            sheet.write_number(row_pos, 7, float(ks_partner.get('balance')), line_header)
 
-                    for sub_line in move_lines[0][line]['lines']:
-                        if sub_line['initial_bal']:
-                            row_pos += 1
-                            sheet.write_string(row_pos, 4, sub_line.get('move_name'),
-                                               line_header_light_initial)
-                            sheet.write_number(row_pos, 5, float(sub_line.get('debit', 0)),
-                                               line_header_light_initial)
-                            sheet.write_number(row_pos, 6, float(sub_line.get('credit')),
-                                               line_header_light_initial)
-                            sheet.write_number(row_pos, 7, float(sub_line.get('balance')),
-                                               line_header_light_initial)
-                        elif not sub_line['initial_bal'] and not sub_line['ending_bal']:
-                            row_pos += 1
-                            date_3 = sub_line.get('ldate')
-                            lang = self.env.user.lang
-                            lang_id = self.env['res.lang'].search([('code', '=', lang)])['date_format']
-                            new_date = date_3.strftime(lang_id)
-                            sheet.write(row_pos, 0, new_date,
-                                        line_header_light_date)
-                            sheet.write_string(row_pos, 1, sub_line.get('lcode'),
-                                               line_header_light)
-                            sheet.write_string(row_pos, 2, sub_line.get('account_name')[lang] if lang and isinstance(
-                                sub_line.get('account_name'), dict) else sub_line.get('account_name') or '',
-                                               line_header_light)
-                            # sheet.write_string(row_pos, 3, sub_line.get('lref') or '',
-                            #                         line_header_light)
-                            sheet.write_string(row_pos, 3, sub_line.get('move_name'),
-                                               line_header_light)
-                            sheet.write_string(row_pos, 4, sub_line.get('lname') or '',
-                                               line_header_light)
-                            sheet.write_number(row_pos, 5,
-                                               float(sub_line.get('debit')), line_header_light)
-                            sheet.write_number(row_pos, 6,
-                                               float(sub_line.get('credit')), line_header_light)
-                            sheet.write_number(row_pos, 7,
-                                               float(sub_line.get('balance')), line_header_light)
-                        else:  # Ending Balance
-                            row_pos += 1
-                            sheet.write(row_pos, 4, sub_line.get('move_name'),
-                                        line_header_light_ending)
-                            sheet.write_number(row_pos, 5, float(move_lines[0][line].get('debit')),
-                                               line_header_light_ending)
-                            sheet.write_number(row_pos, 6, float(move_lines[0][line].get('credit')),
-                                               line_header_light_ending)
-                            sheet.write_number(row_pos, 7, float(move_lines[0][line].get('balance')),
-                                               line_header_light_ending)
+            if ks_df_informations.get('ks_report_with_lines', False):
 
-        workbook.close()
-        output.seek(0)
-        generated_file = output.read()
-        output.close()
-
-        return generated_file
+                for sub_line in ks_lines:
+                    if sub_line['initial_bal']:
+                        row_pos += 1
+                        sheet.write_string(row_pos, 4, sub_line.get('move_name'),
+                                           line_header_light_initial)
+                        sheet.write_number(row_pos, 5, float(sub_line.get('debit', 0)),
+                                           line_header_light_initial)
+                        sheet.write_number(row_pos, 6, float(sub_line.get('credit')),
+                                           line_header_light_initial)
+                        sheet.write_number(row_pos, 7, float(sub_line.get('balance')),
+                                           line_header_light_initial)
+                    elif not sub_line['initial_bal'] and not sub_line['ending_bal']:
+                        row_pos += 1
+                        new_date = sub_line.get('ldate').strftime(ks_lang_date_format)
+                        sheet.write(row_pos, 0, new_date,
+                                    line_header_light_date)
+                        sheet.write_string(row_pos, 1, sub_line.get('lcode'),
+                                           line_header_light)
+                        sheet.write_string(row_pos, 2, sub_line.get('account_name')[lang] if lang and isinstance(
+                            sub_line.get('account_name'), dict) else sub_line.get('account_name') or '',
+                                           line_header_light)
+                        sheet.write_string(row_pos, 3, sub_line.get('move_name'),
+                                           line_header_light)
+                        sheet.write_string(row_pos, 4, sub_line.get('lname') or '',
+                                           line_header_light)
+                        sheet.write_number(row_pos, 5,
+                                           float(sub_line.get('debit')), line_header_light)
+                        sheet.write_number(row_pos, 6,
+                                           float(sub_line.get('credit')), line_header_light)
+                        sheet.write_number(row_pos, 7,
+                                           float(sub_line.get('balance')), line_header_light)
+                    else:  # Ending Balance
+                        row_pos += 1
+                        sheet.write(row_pos, 4, sub_line.get('move_name'),
+                                    line_header_light_ending)
+                        sheet.write_number(row_pos, 5, float(ks_partner.get('debit')),
+                                           line_header_light_ending)
+                        sheet.write_number(row_pos, 6, float(ks_partner.get('credit')),
+                                           line_header_light_ending)
+                        sheet.write_number(row_pos, 7, float(ks_partner.get('balance')),
+                                           line_header_light_ending)
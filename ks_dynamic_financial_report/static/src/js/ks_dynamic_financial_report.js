@@ -48,6 +48,7 @@ class ksDynamicReportsWidget extends Component {
         this.ks_currency = values.ks_currency;
         this.ks_report_lines = values.ks_report_lines;
         this.ks_enable_ledger_in_bal = values.ks_enable_ledger_in_bal;
+        this.ks_pager_cursors = {};
         this.ks_initial_balance = values.ks_initial_balance;
         this.ks_current_balance = values.ks_current_balance;
         this.ks_ending_balance = values.ks_ending_balance;
@@ -737,26 +738,34 @@ class ksDynamicReportsWidget extends Component {
 
 
 
+    ksGetPagerCursor(ks_pager_key, offset) {
+            // the cursor of the previous page lets the server read the next one by keyset
+            var ks_pager = this.ks_pager_cursors[ks_pager_key];
+            if (ks_pager && ks_pager.offset == offset - 1 && ks_pager.options == JSON.stringify(this.ks_df_report_opt)) {
+                return ks_pager.cursor;
+            }
+            return false;
+        }
+
+    ksSetPagerCursor(ks_pager_key, offset, ks_cursor) {
+            this.ks_pager_cursors[ks_pager_key] = {
+                offset: offset,
+                cursor: ks_cursor,
+                options: JSON.stringify(this.ks_df_report_opt),
+            };
+        }
+
     async ksGetGlLineByPage(offset, account_id) {
             var self = this;
-            var lines = await this.orm.call("ks.dynamic.financial.reports", 'ks_build_detailed_gen_move_lines', [this.props.action.context.id, offset, account_id, self.ks_df_report_opt])
+            var ks_pager_key = 'gl_' + account_id;
+            var lines = await this.orm.call("ks.dynamic.financial.reports", 'ks_build_detailed_gen_move_lines', [this.props.action.context.id, offset, account_id, self.ks_df_report_opt], {ks_cursor: self.ksGetPagerCursor(ks_pager_key, offset)})
+            self.ksSetPagerCursor(ks_pager_key, offset, lines[3]);
             return Promise.resolve(lines);
         }
 
-
-        async ksGetMoveLines(event) {
-
-            var ev = event.currentTarget
-            event.preventDefault();
-
-            $('.o_filter_menu').removeClass('ks_d_block')
+    ksRenderGlLines($ks_row, offset, account_id) {
             var self = this;
-            var account_id = $(ev).data('bsAccountId');
-            var offset = 0;
-            var td = $(ev).next('tr').find('td');
-
-            if (td.length == 1) {
-                self.ksGetGlLineByPage(offset, account_id).then(function (datas) {
+            return self.ksGetGlLineByPage(offset, account_id).then(function (datas) {
                     Object.entries(datas[2]).forEach(([v, k]) => {
                         var ksFormatConfigurations = {
                             currency_id: k.company_currency_id,
@@ -768,7 +777,7 @@ class ksDynamicReportsWidget extends Component {
                         k.initial_balance = self.ksFormatCurrencySign(k.initial_balance, ksFormatConfigurations, k.initial_balance < 0 ? '-' : '');
                         k.ldate = DateTime.fromISO(k.ldate, { zone: 'utc' });
                     });
-                    $(ev).next('tr').find('td .ks_py-mline-table-div').remove();
+                    $ks_row.find('td .ks_py-mline-table-div').remove();
                     const content = renderToElement('ks_df_gl_subsection', {
                             count: datas[0],
                             self: self,
@@ -776,37 +785,63 @@ class ksDynamicReportsWidget extends Component {
                             account_data: datas[2],
                             ks_enable_ledger_in_bal: self.ks_enable_ledger_in_bal,
                         })
-                    $(ev).next('tr').find('td ul').after(content)
-                    $(ev).next('tr').find('td ul li:first a').css({
-                        'background-color': '#00ede8',
-                        'font-weight': 'bold',
-                    });
+                    $ks_row.find('td ul').after(content)
+                    self.ksHighlightPage($ks_row, offset);
                 })
+        }
+
+    ksHighlightPage($ks_row, offset) {
+            $ks_row.find('td ul li a').css({
+                'background-color': '',
+                'font-weight': '',
+            });
+            $ks_row.find('td ul li').eq(offset).find('a').css({
+                'background-color': '#00ede8',
+                'font-weight': 'bold',
+            });
+        }
+
+
+        async ksGetMoveLines(event) {
+
+            var ev = event.currentTarget
+            event.preventDefault();
+
+            $('.o_filter_menu').removeClass('ks_d_block')
+            var self = this;
+            var account_id = $(ev).data('bsAccountId');
+            var offset = 0;
+            var td = $(ev).next('tr').find('td');
+
+            if (td.length == 1) {
+                self.ksRenderGlLines($(ev).next('tr'), offset, account_id);
             }
         }
 
+        async ksGetMoveLinesPage(event) {
+            event.preventDefault();
+            event.stopPropagation();
+            var ev = event.currentTarget
+            var account_id = $(ev).data('bsAccountId');
+            var offset = $(ev).data('bsPageNumber') - 1;
+            this.ksRenderGlLines($(ev).closest('tr'), offset, account_id);
+        }
+
 
 
 
     async ksGetPlLinesByPage(offset, account_id) {
             var self = this;
-            var lines = await this.orm.call("ks.dynamic.financial.reports", 'ks_build_detailed_move_lines', [this.props.action.context.id, offset, account_id, self.ks_df_report_opt, self.$ks_searchview_buttons.find('.ks_search_account_filter').length])
+            var ks_pager_key = 'pl_' + account_id;
+            var lines = await this.orm.call("ks.dynamic.financial.reports", 'ks_build_detailed_move_lines', [this.props.action.context.id, offset, account_id, self.ks_df_report_opt, self.$ks_searchview_buttons.find('.ks_search_account_filter').length], {ks_cursor: self.ksGetPagerCursor(ks_pager_key, offset)})
+            self.ksSetPagerCursor(ks_pager_key, offset, lines[3]);
             return Promise.resolve(lines);
 
         }
 
-    async ksGetPlMoveLines(event) {
-
-            var ev = event.currentTarget
-             $('.o_filter_menu').removeClass('ks_d_block')
-
-            event.preventDefault();
+    ksRenderPlLines($ks_row, offset, account_id) {
             var self = this;
-            var account_id = $(ev).data('bsAccountId');
-            var offset = 0;
-            var td = $(ev).next('tr').find('td');
-            if (td.length == 1) {
-                self.ksGetPlLinesByPage(offset, account_id).then(function (datas) {
+            return self.ksGetPlLinesByPage(offset, account_id).then(function (datas) {
                      Object.entries(datas[2]).forEach(([v, k]) => {
                         var ksFormatConfigurations = {
                             currency_id: k.company_currency_id,
@@ -818,7 +853,7 @@ class ksDynamicReportsWidget extends Component {
                         k.initial_balance = self.ksFormatCurrencySign(k.initial_balance, ksFormatConfigurations, k.initial_balance < 0 ? '-' : '');
                         k.ldate = DateTime.fromISO(k.ldate, { zone: 'utc' });
                     });
-                    $(event.currentTarget).next('tr').find('td .ks_py-mline-table-div').remove();
+                    $ks_row.find('td .ks_py-mline-table-div').remove();
                     const content = renderToElement('ks_df_sub_pl0', {
                             count: datas[0],
                             self: self,
@@ -827,15 +862,35 @@ class ksDynamicReportsWidget extends Component {
                             ks_enable_ledger_in_bal: self.ks_enable_ledger_in_bal,
                             lang: self.ks_df_context.lang
                         })
-                    $(ev).next('tr').find('td ul').after(content)
-                    $(ev).next('tr').find('td ul li:first a').css({
-                        'background-color': '#00ede8',
-                        'font-weight': 'bold',
-                    });
+                    $ks_row.find('td ul').after(content)
+                    self.ksHighlightPage($ks_row, offset);
                 })
+        }
+
+    async ksGetPlMoveLines(event) {
+
+            var ev = event.currentTarget
+             $('.o_filter_menu').removeClass('ks_d_block')
+
+            event.preventDefault();
+            var self = this;
+            var account_id = $(ev).data('bsAccountId');
+            var offset = 0;
+            var td = $(ev).next('tr').find('td');
+            if (td.length == 1) {
+                self.ksRenderPlLines($(ev).next('tr'), offset, account_id);
             }
         }
 
+        async ksGetPlMoveLinesPage(event) {
+            event.preventDefault();
+            event.stopPropagation();
+            var ev = event.currentTarget
+            var account_id = $(ev).data('bsAccountId');
+            var offset = $(ev).data('bsPageNumber') - 1;
+            this.ksRenderPlLines($(ev).closest('tr'), offset, account_id);
+        }
+
         async OnClickDate(bsFilter) {
 
                 var self=this
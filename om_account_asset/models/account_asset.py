@@ -2,14 +2,20 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
 import calendar
+import logging
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
-from odoo.tools import float_compare, float_is_zero
+from odoo.tools import float_compare, float_is_zero, split_every
 from markupsafe import Markup
 
+_logger = logging.getLogger(__name__)
+
+# number of depreciation entries created, posted and committed together by the cron
+ASSET_MOVE_BATCH_SIZE = 500
+
 
 class AccountAssetCategory(models.Model):
     _name = 'account.asset.category'
@@ -195,7 +201,9 @@ class AccountAssetAsset(models.Model):
 
     @api.model
     def _cron_generate_entries(self):
-        self.compute_generated_entries(datetime.today())
+        # The entries are created and posted by batches, each batch being committed: an
+        # interrupted run resumes with the depreciation lines not linked to an entry yet.
+        self.with_context(asset_bulk_posting=True).compute_generated_entries(datetime.today())
 
     @api.model
     def compute_generated_entries(self, date, asset_type=None):
@@ -261,14 +269,22 @@ class AccountAssetAsset(models.Model):
         return undone_dotation_number
 
     def compute_depreciation_board(self):
+        # The boards of all the assets are computed first, then the unposted lines of the
+        # whole recordset are replaced by a single unlink and a single batch create.
+        vals_list = []
+        for asset in self:
+            vals_list += asset._get_depreciation_board_values()
+        self.depreciation_line_ids.filtered(lambda x: not x.move_check).unlink()
+        self.env['account.asset.depreciation.line'].create(vals_list)
+        return True
+
+    def _get_depreciation_board_values(self):
+        """ Return the values of the unposted depreciation lines of the asset """
         self.ensure_one()
 
         posted_depreciation_line_ids = self.depreciation_line_ids.filtered(lambda x: x.move_check).sorted(key=lambda l: l.depreciation_date)
-        unposted_depreciation_line_ids = self.depreciation_line_ids.filtered(lambda x: not x.move_check)
-
-        # Remove old unposted depreciation lines. We cannot use unlink() with One2many field
-        commands = [(2, line_id.id, False) for line_id in unposted_depreciation_line_ids]
 
+        vals_list = []
         if self.value_residual != 0.0:
             amount_to_depr = residual_amount = self.value_residual
 
@@ -313,7 +329,7 @@ class AccountAssetAsset(models.Model):
                     'depreciated_value': self.value - (self.salvage_value + residual_amount),
                     'depreciation_date': depreciation_date,
                 }
-                commands.append((0, False, vals))
+                vals_list.append(vals)
 
                 depreciation_date = depreciation_date + relativedelta(months=+self.method_period)
 
@@ -326,9 +342,7 @@ class AccountAssetAsset(models.Model):
                     max_day_in_month = calendar.monthrange(depreciation_date.year, depreciation_date.month)[1]
                     depreciation_date = depreciation_date.replace(day=max_day_in_month)
 
-        self.write({'depreciation_line_ids': commands})
-
-        return True
+        return vals_list
 
     def validate(self):
         self.write({'state': 'open'})
@@ -493,15 +507,13 @@ class AccountAssetAsset(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         assets = super(AccountAssetAsset, self.with_context(mail_create_nolog=True)).create(vals_list)
-        for asset in assets:
-            asset.sudo().compute_depreciation_board()
+        assets.sudo().compute_depreciation_board()
         return assets
 
     def write(self, vals):
         res = super(AccountAssetAsset, self).write(vals)
         if 'depreciation_line_ids' not in vals and 'state' not in vals:
-            for rec in self:
-                rec.compute_depreciation_board()
+            self.compute_depreciation_board()
         return res
 
     def open_entries(self):
@@ -558,19 +570,62 @@ class AccountAssetDepreciationLine(models.Model):
             line.move_posted_check = True if line.move_id and line.move_id.state == 'posted' else False
 
     def create_move(self, post_move=True):
+        if any(line.move_id for line in self):
+            raise UserError(_('This depreciation is already linked to a journal entry. Please post or delete it.'))
+
         created_moves = self.env['account.move']
-        for line in self:
-            if line.move_id:
-                raise UserError(_('This depreciation is already linked to a journal entry. Please post or delete it.'))
-            move_vals = self._prepare_move(line)
-            move = self.env['account.move'].create(move_vals)
-            line.write({'move_id': move.id, 'move_check': True})
-            created_moves |= move
+        if not self.env.context.get('asset_bulk_posting'):
+            created_moves = self._create_moves(post_move)
+            return [x.id for x in created_moves]
 
-        if post_move and created_moves:
-            created_moves.filtered(lambda m: any(m.asset_depreciation_ids.mapped('asset_id.category_id.open_asset'))).action_post()
+        for lines in split_every(ASSET_MOVE_BATCH_SIZE, self.ids, self.browse):
+            created_moves |= lines._create_moves(post_move)
+            self.env.cr.commit()
         return [x.id for x in created_moves]
 
+    def _create_moves(self, post_move):
+        """ Create the entries of the depreciation lines with a single create and post those
+        of the assets whose category is confirmed automatically.
+        In bulk posting mode, an entry failing to post is left in draft and logged instead of
+        blocking the other ones.
+        """
+        if not self:
+            return self.env['account.move']
+        moves = self.env['account.move'].create([self._prepare_move(line) for line in self])
+        # link the entries to their lines with a single query
+        self.flush_recordset(['move_id'])
+        self.env.cr.execute("""
+            UPDATE account_asset_depreciation_line AS line
+            SET move_id = v.move_id, write_uid = %s, write_date = (now() at time zone 'UTC')
+            FROM (VALUES """ + ', '.join(['(%s, %s)'] * len(self)) + """) AS v(id, move_id)
+            WHERE line.id = v.id
+        """, [self.env.uid] + [value for line, move in zip(self, moves) for value in (line.id, move.id)])
+        self.invalidate_recordset(['move_id', 'write_uid', 'write_date'])
+        moves.invalidate_recordset(['asset_depreciation_ids'])
+        self.modified(['move_id'])
+        to_post = self.env['account.move']
+        for line, move in zip(self, moves):
+            if line.asset_id.category_id.open_asset:
+                to_post |= move
+        if not post_move or not to_post:
+            return moves
+
+        if not self.env.context.get('asset_bulk_posting'):
+            to_post.action_post()
+            return moves
+        try:
+            with self.env.cr.savepoint():
+                to_post.action_post()
+        except Exception:
+            # post the entries one by one so only the failing ones stay in draft
+            for move in to_post:
+                try:
+                    with self.env.cr.savepoint():
+                        move.action_post()
+                except Exception:
+                    _logger.exception("Depreciation entry %s could not be posted", move.id)
+        return moves
+
     def _prepare_move(self, line):
         category_id = line.asset_id.category_id
         analytic_distribution = line.asset_id.analytic_distribution
@@ -57,8 +57,8 @@ class AssetModify(models.TransientModel):
         if asset_vals['method_number'] <= asset.entry_count:
             raise UserError(_('The number of depreciations must be greater than the number of posted or draft entries '
                               'to allow for complete depreciation of the asset.'))
+        # the depreciation board is recomputed by the write
         asset.write(asset_vals)
-        asset.compute_depreciation_board()
         tracked_fields = self.env['account.asset.asset'].fields_get(['method_number', 'method_period', 'method_end'])
         changes, tracking_value_ids = asset._mail_track(tracked_fields, old_values)
         if changes:
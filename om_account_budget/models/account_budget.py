@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
+from collections import defaultdict
+
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
 
@@ -162,38 +164,76 @@ class CrossoveredBudgetLines(models.Model):
             line.name = computed_name
 
     def _compute_practical_amount(self):
+        # The lines are grouped by set of accounts of their budgetary position, each group is
+        # resolved by a single query joining the move or analytic lines against the ranges of
+        # the budget lines given as a VALUES list.
+        analytic_groups = defaultdict(list)
+        general_groups = defaultdict(list)
         for line in self:
-            acc_ids = line.general_budget_id.account_ids.ids
-            date_to = line.date_to
-            date_from = line.date_from
+            line.practical_amount = 0.0
+            acc_ids = tuple(sorted(line.general_budget_id.account_ids.ids))
             if line.analytic_account_id.id:
-                analytic_line_obj = self.env['account.analytic.line']
-                domain = [('account_id', '=', line.analytic_account_id.id),
-                          ('date', '>=', date_from),
-                          ('date', '<=', date_to),
-                          ]
-                if acc_ids:
-                    domain += [('general_account_id', 'in', acc_ids)]
-
-                where_query = analytic_line_obj._where_calc(domain)
-                analytic_line_obj._apply_ir_rules(where_query, 'read')
-                from_clause, where_clause, where_clause_params = where_query.get_sql()
-                select = "SELECT SUM(amount) from " + from_clause + " where " + where_clause
-
-            else:
-                aml_obj = self.env['account.move.line']
-                domain = [('account_id', 'in',
-                           line.general_budget_id.account_ids.ids),
-                          ('date', '>=', date_from),
-                          ('date', '<=', date_to)
-                          ]
-                where_query = aml_obj._where_calc(domain)
-                aml_obj._apply_ir_rules(where_query, 'read')
-                from_clause, where_clause, where_clause_params = where_query.get_sql()
-                select = "SELECT sum(credit)-sum(debit) from " + from_clause + " where " + where_clause
-
-            self.env.cr.execute(select, where_clause_params)
-            line.practical_amount = self.env.cr.fetchone()[0] or 0.0
+                analytic_groups[acc_ids].append(line)
+            elif acc_ids:
+                general_groups[acc_ids].append(line)
+
+        if analytic_groups:
+            self.env['account.analytic.line'].flush_model(['account_id', 'general_account_id', 'date', 'amount'])
+        for acc_ids, lines in analytic_groups.items():
+            domain = [('account_id', 'in', list({line.analytic_account_id.id for line in lines})),
+                      ('date', '>=', min(line.date_from for line in lines)),
+                      ('date', '<=', max(line.date_to for line in lines)),
+                      ]
+            if acc_ids:
+                domain += [('general_account_id', 'in', list(acc_ids))]
+            self._fetch_practical_amounts(
+                lines, 'account.analytic.line', domain, 'SUM("account_analytic_line".amount)',
+                lambda line: line.analytic_account_id.id)
+
+        if general_groups:
+            self.env['account.move.line'].flush_model(['account_id', 'date', 'debit', 'credit'])
+        for acc_ids, lines in general_groups.items():
+            domain = [('account_id', 'in', list(acc_ids)),
+                      ('date', '>=', min(line.date_from for line in lines)),
+                      ('date', '<=', max(line.date_to for line in lines)),
+                      ]
+            self._fetch_practical_amounts(
+                lines, 'account.move.line', domain,
+                'SUM("account_move_line".credit) - SUM("account_move_line".debit)')
+
+    def _fetch_practical_amounts(self, lines, model_name, domain, aggregate, get_analytic_account=None):
+        """ Set the practical amount of the given budget lines with a single query.
+        :param lines: list of budget lines
+        :param model_name: the model of the lines to sum up, account.move.line or account.analytic.line
+        :param domain: the domain matching the lines of all the budget lines
+        :param aggregate: the SQL expression of the practical amount
+        :param get_analytic_account: function returning the analytic account a budget line is restricted
+            to, when the lines to sum up are analytic lines
+        """
+        model = self.env[model_name]
+        table = model._table
+        where_query = model._where_calc(domain)
+        model._apply_ir_rules(where_query, 'read')
+        from_clause, where_clause, where_clause_params = where_query.get_sql()
+
+        values = []
+        params = []
+        for index, line in enumerate(lines):
+            values.append('(%s, %s::int, %s::date, %s::date)')
+            params += [index, get_analytic_account and get_analytic_account(line), line.date_from, line.date_to]
+        range_clause = '"{0}".date >= budget_line.date_from AND "{0}".date <= budget_line.date_to'.format(table)
+        if get_analytic_account:
+            range_clause += ' AND "{0}".account_id = budget_line.analytic_account_id'.format(table)
+        select = """
+            SELECT budget_line.seq, """ + aggregate + """
+            FROM (VALUES """ + ', '.join(values) + """) AS budget_line(seq, analytic_account_id, date_from, date_to),
+                """ + from_clause + """
+            WHERE """ + where_clause + """ AND """ + range_clause + """
+            GROUP BY budget_line.seq"""
+        self.env.cr.execute(select, params + where_clause_params)
+        amounts = dict(self.env.cr.fetchall())
+        for index, line in enumerate(lines):
+            line.practical_amount = amounts.get(index) or 0.0
 
     def _compute_theoritical_amount(self):
         # beware: 'today' variable is mocked in the python tests and thus, its implementation matter
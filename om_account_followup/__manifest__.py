@@ -22,6 +22,7 @@
         'views/report_followup.xml',
         'views/reports.xml',
         'views/followup_partner_view.xml',
+        'views/followup_dispatch_view.xml',
         'report/followup_report.xml',
     ],
     'demo': ['demo/demo.xml'],
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import api, fields, models, _
+
+_logger = logging.getLogger(__name__)
+
+# number of partners whose follow-up emails are rendered and committed together
+FOLLOWUP_DISPATCH_BATCH_SIZE = 200
+
+
+class FollowupDispatch(models.Model):
+    _name = 'followup.dispatch'
+    _description = 'Follow-up Email Dispatch'
+    _order = 'id desc'
+
+    partner_id = fields.Many2one('res.partner', 'Partner', required=True,
+                                 readonly=True, index=True, ondelete='cascade')
+    company_id = fields.Many2one('res.company', 'Company', required=True,
+                                 readonly=True)
+    followup_line_id = fields.Many2one('followup.line', 'Follow-up Level',
+                                       readonly=True)
+    date = fields.Date('Follow-up Sending Date', readonly=True)
+    state = fields.Selection([('pending', 'Pending'),
+                              ('done', 'Sent'),
+                              ('failed', 'Failed')], 'Status',
+                             default='pending', required=True, readonly=True,
+                             index=True)
+    error = fields.Text('Error', readonly=True)
+
+    @api.model
+    def queue_partners(self, partners, date):
+        """ Queue the follow-up emails of the partners and wake up the
+        dispatch cron. Returns the created dispatch records. """
+        dispatches = self.create([{
+            'partner_id': partner.id,
+            'company_id': self.env.company.id,
+            'followup_line_id':
+                partner.latest_followup_level_id_without_lit.id,
+            'date': date,
+        } for partner in partners])
+        self.env.ref(
+            'om_account_followup.ir_cron_followup_dispatch')._trigger()
+        return dispatches
+
+    def action_retry(self):
+        self.filtered(lambda d: d.state == 'failed').write(
+            {'state': 'pending', 'error': False})
+        self.env.ref(
+            'om_account_followup.ir_cron_followup_dispatch')._trigger()
+
+    @api.model
+    def _cron_process_dispatch(self):
+        # The pending dispatches are processed by batches, each batch being
+        # committed: an interrupted run resumes with the ones still pending.
+        while True:
+            self._cr.execute('''
+                SELECT id FROM followup_dispatch
+                WHERE state = 'pending'
+                ORDER BY company_id, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED''', (FOLLOWUP_DISPATCH_BATCH_SIZE,))
+            dispatch_ids = [row[0] for row in self._cr.fetchall()]
+            if not dispatch_ids:
+                break
+            dispatches = self.browse(dispatch_ids)
+            for company in dispatches.company_id:
+                dispatches.filtered(
+                    lambda d: d.company_id == company).with_company(
+                    company)._process_dispatch()
+            self._cr.commit()
+
+    def _process_dispatch(self):
+        try:
+            with self._cr.savepoint():
+                self._send_followup_mails()
+        except Exception:
+            # send the emails partner by partner so only the failing ones
+            # are marked as failed
+            for dispatch in self:
+                try:
+                    with self._cr.savepoint():
+                        dispatch._send_followup_mails()
+                except Exception as e:
+                    _logger.exception(
+                        "Follow-up email of partner %s could not be sent",
+                        dispatch.partner_id.id)
+                    dispatch.write({'state': 'failed', 'error': str(e)})
+
+    def _send_followup_mails(self):
+        self.partner_id.do_partner_mail_batch()
+        self.write({'state': 'done', 'error': False})
@@ -99,28 +99,55 @@ class ResPartner(models.Model):
             'om_account_followup.action_report_followup').report_action(
             self, data=datas)
 
+    def _get_followup_mail_recipients(self):
+        self.ensure_one()
+        partners_to_email = [child for child in self.child_ids if
+                             child.type == 'invoice' and child.email]
+        if not partners_to_email and self.email:
+            partners_to_email = [self]
+        return partners_to_email
+
+    def _get_followup_mail_template(self):
+        self.ensure_one()
+        level = self.latest_followup_level_id_without_lit
+        if level and level.send_email and level.email_template_id and \
+                level.email_template_id.id:
+            return level.email_template_id
+        return self.env.ref(
+            'om_account_followup.email_template_om_account_followup_default')
+
+    def _followup_mail_unknown(self):
+        ctx = self.env.context.copy()
+        ctx['followup'] = True
+        action_text = _("Email not sent because of email address "
+                        "of partner not filled in")
+        for partner in self:
+            if partner.payment_next_action_date:
+                payment_action_date = min(
+                    fields.Date.today(),
+                    partner.payment_next_action_date)
+            else:
+                payment_action_date = fields.Date.today()
+            if partner.payment_next_action:
+                payment_next_action = \
+                    partner.payment_next_action + " \n " + action_text
+            else:
+                payment_next_action = action_text
+            partner.with_context(ctx).write(
+                {'payment_next_action_date': payment_action_date,
+                 'payment_next_action': payment_next_action})
+
     def do_partner_mail(self):
         ctx = self.env.context.copy()
         ctx['followup'] = True
-        template = 'om_account_followup.email_template_om_account_followup_default'
         unknown_mails = 0
         for partner in self:
-            partners_to_email = [child for child in partner.child_ids if
-                                 child.type == 'invoice' and child.email]
-            if not partners_to_email and partner.email:
-                partners_to_email = [partner]
+            partners_to_email = partner._get_followup_mail_recipients()
             if partners_to_email:
-                level = partner.latest_followup_level_id_without_lit
+                template = partner._get_followup_mail_template()
                 for partner_to_email in partners_to_email:
-                    if level and level.send_email and \
-                            level.email_template_id and \
-                            level.email_template_id.id:
-                        level.email_template_id.with_context(ctx).send_mail(
-                            partner_to_email.id)
-                    else:
-                        mail_template_id = self.env.ref(template)
-                        mail_template_id.with_context(ctx).send_mail(
-                            partner_to_email.id)
+                    template.with_context(ctx).send_mail(
+                        partner_to_email.id)
                 if partner not in partners_to_email:
                     partner.message_post(body=_(
                         'Overdue email sent to %s' % ', '.join(
@@ -128,24 +155,40 @@ class ResPartner(models.Model):
                              partner in partners_to_email])))
             else:
                 unknown_mails = unknown_mails + 1
-                action_text = _("Email not sent because of email address "
-                                "of partner not filled in")
-                if partner.payment_next_action_date:
-                    payment_action_date = min(
-                        fields.Date.today(),
-                        partner.payment_next_action_date)
-                else:
-                    payment_action_date = fields.Date.today()
-                if partner.payment_next_action:
-                    payment_next_action = \
-                        partner.payment_next_action + " \n " + action_text
-                else:
-                    payment_next_action = action_text
-                partner.with_context(ctx).write(
-                    {'payment_next_action_date': payment_action_date,
-                     'payment_next_action': payment_next_action})
+                partner._followup_mail_unknown()
         return unknown_mails
 
+    def do_partner_mail_batch(self):
+        """ Batch version of do_partner_mail used by the queued dispatch:
+        the emails of all the recipients of a template are rendered at once
+        and left in the mail queue, and the chatter messages are logged in
+        bulk. Returns the number of partners without email address. """
+        ctx = self.env.context.copy()
+        ctx['followup'] = True
+        recipients_by_template = {}
+        bodies = {}
+        unknown = self.browse()
+        for partner in self:
+            partners_to_email = partner._get_followup_mail_recipients()
+            if not partners_to_email:
+                unknown |= partner
+                continue
+            template = partner._get_followup_mail_template()
+            recipients_by_template.setdefault(template, []).extend(
+                partner_to_email.id for partner_to_email in partners_to_email)
+            if partner not in partners_to_email:
+                # escaped as message_post does with plain text
+                bodies[partner.id] = Markup('%s') % _(
+                    'Overdue email sent to %s', ', '.join(
+                        ['%s <%s>' % (p.name, p.email) for
+                         p in partners_to_email]))
+        for template, res_ids in recipients_by_template.items():
+            template.with_context(ctx).send_mail_batch(res_ids)
+        if bodies:
+            self.browse(list(bodies))._message_log_batch(bodies=bodies)
+        unknown._followup_mail_unknown()
+        return len(unknown)
+
     def get_followup_table_html(self):
         self.ensure_one()
         partner = self.commercial_partner_id
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
-import datetime
 import time
+from markupsafe import Markup
+
 from odoo import api, fields, models, _
 
 
@@ -42,6 +43,11 @@ class FollowupPrint(models.TransientModel):
     test_print = fields.Boolean(
         'Test Print', help='Check if you want to print follow-ups without '
                            'changing follow-up level.')
+    queued_dispatch = fields.Boolean(
+        'Send Emails in Background',
+        help='Queue the follow-up emails, they are rendered and sent by a '
+             'scheduled action whose progress can be followed in the '
+             'follow-up dispatches.')
 
     def process_partners(self, partner_ids, data):
         partner_obj = self.env['res.partner']
@@ -52,6 +58,8 @@ class FollowupPrint(models.TransientModel):
         nbunknownmails = 0
         nbprints = 0
         resulttext = " "
+        partners_to_queue = partner_obj
+        letter_bodies = {}
         for partner in self.env['followup.stat.by.partner'].browse(
                 partner_ids):
             if partner.max_followup_id.manual_action:
@@ -64,18 +72,33 @@ class FollowupPrint(models.TransientModel):
                 else:
                     manuals[key] = manuals[key] + 1
             if partner.max_followup_id.send_email:
-                nbunknownmails += partner.partner_id.do_partner_mail()
+                if self.queued_dispatch:
+                    partners_to_queue |= partner.partner_id
+                else:
+                    nbunknownmails += partner.partner_id.do_partner_mail()
                 nbmails += 1
             if partner.max_followup_id.send_letter:
                 partner_ids_to_print.append(partner.id)
                 nbprints += 1
                 followup_without_lit = \
                     partner.partner_id.latest_followup_level_id_without_lit
-                message = "%s<I> %s </I>%s" % (_("Follow-up letter of "),
-                                               followup_without_lit.name,
-                                               _(" will be sent"))
-                partner.partner_id.message_post(body=message)
-        if nbunknownmails == 0:
+                message = Markup("%s<i> %s </i>%s") % (
+                    _("Follow-up letter of "), followup_without_lit.name,
+                    _(" will be sent"))
+                if self.queued_dispatch:
+                    letter_bodies[partner.partner_id.id] = message
+                else:
+                    partner.partner_id.message_post(body=message)
+        if self.queued_dispatch:
+            # the chatter messages are logged in bulk and the emails queued
+            if letter_bodies:
+                partner_obj.browse(list(letter_bodies))._message_log_batch(
+                    bodies=letter_bodies)
+            if partners_to_queue:
+                self.env['followup.dispatch'].queue_partners(
+                    partners_to_queue, self.date)
+            resulttext += str(nbmails) + _(" email(s) queued")
+        elif nbunknownmails == 0:
             resulttext += str(nbmails) + _(" email(s) sent")
         else:
             resulttext += str(nbmails) + _(
@@ -101,10 +124,14 @@ class FollowupPrint(models.TransientModel):
         return result
 
     def do_update_followup_level(self, to_update, partner_list, date):
-        for id in to_update.keys():
-            if to_update[id]['partner_id'] in partner_list:
-                self.env['account.move.line'].browse([int(id)]).write(
-                    {'followup_line_id': to_update[id]['level'],
+        # one write, hence one UPDATE, per follow-up level
+        partner_list = set(partner_list)
+        for level_id, lines_by_partner in to_update.items():
+            line_ids = [line_id for partner_id, line_ids in lines_by_partner.items()
+                        if partner_id in partner_list for line_id in line_ids]
+            if line_ids:
+                self.env['account.move.line'].browse(line_ids).write(
+                    {'followup_line_id': level_id,
                      'followup_date': date})
 
     def clear_manual_actions(self, partner_list):
@@ -162,66 +189,47 @@ class FollowupPrint(models.TransientModel):
         return self.env.company.follow_up_msg
 
     def _get_partners_followp(self):
+        """ Find the receivable lines reaching the next level of the follow-up at the
+        sending date. The next level of each line and its threshold (sending date minus the
+        delay of the level) are computed by the database from followup_line.
+        :return: {'partner_ids': ids of the followup.stat.by.partner to process,
+                  'to_update': {level_id: {stat_partner_id: [move line ids]}}}
+        """
         data = self
         company_id = data.company_id.id
         context = self.env.context
+        fup_id = 'followup_id' in context and context[
+            'followup_id'] or data.followup_id.id
+        date = 'date' in context and context['date'] or data.date
+        self.env['account.move.line'].flush_model()
         self._cr.execute(
-            '''SELECT
-                    l.partner_id,
-                    l.followup_line_id,
-                    l.date_maturity,
-                    l.date, l.id
+            '''WITH levels AS (
+                    SELECT id, delay,
+                        LAG(id) OVER (ORDER BY delay, id) AS previous_id
+                    FROM followup_line
+                    WHERE followup_id = %(followup_id)s
+                )
+                SELECT levels.id, l.partner_id, array_agg(l.id)
                 FROM account_move_line AS l
                 LEFT JOIN account_account AS a
                 ON (l.account_id=a.id)
+                JOIN levels
+                ON (levels.previous_id IS NOT DISTINCT FROM l.followup_line_id)
                 WHERE (l.full_reconcile_id IS NULL)
                 AND a.account_type = 'asset_receivable'
                 AND (l.partner_id is NOT NULL)
                 AND (l.debit > 0)
-                AND (l.company_id = %s)
+                AND (l.company_id = %(company_id)s)
                 AND (l.blocked = False)
-                ORDER BY l.date''' % (company_id))
-        move_lines = self._cr.fetchall()
-        old = None
-        fups = {}
-        fup_id = 'followup_id' in context and context[
-            'followup_id'] or data.followup_id.id
-        date = 'date' in context and context['date'] or data.date
-        date = fields.Date.to_string(date)
-        current_date = datetime.date(*time.strptime(date, '%Y-%m-%d')[:3])
-        self._cr.execute(
-            '''SELECT *
-            FROM followup_line
-            WHERE followup_id=%s
-            ORDER BY delay''' % (fup_id,))
-
-        for result in self._cr.dictfetchall():
-            delay = datetime.timedelta(days=result['delay'])
-            fups[old] = (current_date - delay, result['id'])
-            old = result['id']
+                AND COALESCE(l.date_maturity, l.date) <= %(date)s::date - levels.delay
+                GROUP BY levels.id, l.partner_id
+                ORDER BY MIN(l.date)''',
+            {'followup_id': fup_id, 'company_id': company_id, 'date': date})
 
-        partner_list = []
+        partner_list = {}
         to_update = {}
-
-        for partner_id, followup_line_id, date_maturity, date, id in \
-                move_lines:
-            if not partner_id:
-                continue
-            if followup_line_id not in fups:
-                continue
+        for level_id, partner_id, line_ids in self._cr.fetchall():
             stat_line_id = partner_id * 10000 + company_id
-            if date_maturity:
-                date_maturity = fields.Date.to_string(date_maturity)
-                if date_maturity <= fups[followup_line_id][0].strftime(
-                        '%Y-%m-%d'):
-                    if stat_line_id not in partner_list:
-                        partner_list.append(stat_line_id)
-                    to_update[str(id)] = {'level': fups[followup_line_id][1],
-                                          'partner_id': stat_line_id}
-            elif date and date <= fups[followup_line_id][0].strftime(
-                    '%Y-%m-%d'):
-                if stat_line_id not in partner_list:
-                    partner_list.append(stat_line_id)
-                to_update[str(id)] = {'level': fups[followup_line_id][1],
-                                      'partner_id': stat_line_id}
-        return {'partner_ids': partner_list, 'to_update': to_update}
+            partner_list[stat_line_id] = True
+            to_update.setdefault(level_id, {})[stat_line_id] = line_ids
+        return {'partner_ids': list(partner_list), 'to_update': to_update}
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 
+from collections import defaultdict
 from datetime import date
 from dateutil.relativedelta import relativedelta
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools import split_every
+
+# number of due lines whose payments are generated and committed together by the cron
+RECURRING_PAYMENT_BATCH_SIZE = 500
 
 
 class RecurringPayment(models.Model):
@@ -50,9 +55,8 @@ class RecurringPayment(models.Model):
             date += relativedelta(years=interval)
         return date
 
-    def action_create_lines(self, date):
-        ids = self.env['recurring.payment.line']
-        vals = {
+    def _prepare_line_vals(self, date):
+        return {
             'partner_id': self.partner_id.id,
             'amount': self.amount,
             'date': date,
@@ -61,15 +65,21 @@ class RecurringPayment(models.Model):
             'currency_id': self.currency_id.id,
             'state': 'draft'
         }
-        ids.create(vals)
+
+    def action_create_lines(self, date):
+        ids = self.env['recurring.payment.line']
+        ids.create(self._prepare_line_vals(date))
 
     def action_done(self):
-        date_begin = self.date_begin
-        while date_begin < self.date_end:
-            date = date_begin
-            self.action_create_lines(date)
-            date_begin = self.compute_next_date(date)
-        self.state = 'done'
+        # the lines of all the periods of all the records are created at once
+        vals_list = []
+        for rec in self:
+            date_begin = rec.date_begin
+            while date_begin < rec.date_end:
+                vals_list.append(rec._prepare_line_vals(date_begin))
+                date_begin = rec.compute_next_date(date_begin)
+        self.env['recurring.payment.line'].create(vals_list)
+        self.write({'state': 'done'})
 
     def action_draft(self):
         if self.line_ids.filtered(lambda t: t.state == 'done'):
@@ -79,11 +89,21 @@ class RecurringPayment(models.Model):
                 line.unlink()
             self.state = 'draft'
 
+    def _get_due_lines(self):
+        return self.env['recurring.payment.line'].search([('date', '<=', date.today()),
+                                                          ('state', '!=', 'done')])
+
     def action_generate_payment(self):
-        line_ids = self.env['recurring.payment.line'].search([('date', '<=', date.today()),
-                                                                       ('state', '!=', 'done')])
-        for line in line_ids:
-            line.action_create_payment()
+        self._get_due_lines()._create_payments()
+
+    @api.model
+    def _cron_generate_payment(self):
+        # The due lines are processed by chunks, each chunk being committed: a run stopped
+        # halfway keeps the payments already generated and the next one continues from there.
+        for lines in split_every(RECURRING_PAYMENT_BATCH_SIZE, self._get_due_lines().ids,
+                                 self.env['recurring.payment.line'].browse):
+            lines._create_payments()
+            self.env.cr.commit()
 
     @api.model_create_multi
     def create(self, vals_list):
@@ -122,8 +142,8 @@ class RecurringPaymentLine(models.Model):
     state = fields.Selection(selection=[('draft', 'Draft'),
                                         ('done', 'Done')], default='draft', string='Status')
 
-    def action_create_payment(self):
-        vals = {
+    def _prepare_payment_vals(self):
+        return {
             'payment_type': self.recurring_payment_id.payment_type,
             'amount': self.amount,
             'currency_id': self.currency_id.id,
@@ -133,9 +153,24 @@ class RecurringPaymentLine(models.Model):
             'ref': self.recurring_payment_id.name,
             'partner_id': self.partner_id.id,
         }
-        payment = self.env['account.payment'].create(vals)
-        if payment:
-            if self.recurring_payment_id.journal_state == 'posted':
-                payment.action_post()
-            self.write({'state': 'done', 'payment_id': payment.id})
+
+    def action_create_payment(self):
+        self._create_payments()
+
+    def _create_payments(self):
+        # one create and one post of the payments per journal and company
+        lines_by_journal = defaultdict(list)
+        for line in self:
+            lines_by_journal[(line.journal_id, line.company_id)].append(line.id)
+        for (journal, company), line_ids in lines_by_journal.items():
+            lines = self.browse(line_ids)
+            payments = self.env['account.payment'].with_company(company).create(
+                [line._prepare_payment_vals() for line in lines])
+            to_post = self.env['account.payment']
+            for line, payment in zip(lines, payments):
+                line.payment_id = payment
+                if line.recurring_payment_id.journal_state == 'posted':
+                    to_post |= payment
+            to_post.action_post()
+            lines.write({'state': 'done'})
 
@@ -13,3 +13,27 @@ class ProductProduct(models.Model):
         if self.env.context.get("force_run_fifo_vacuum") or config["test_enable"]:
             return super()._run_fifo_vacuum(company=company)
         return
+
+    def _recompute_avco_cost_price(self):
+        """Maintenance method replaying the AVCO sync over the whole valuation history
+        of the products in self, for each of their companies. It can be run on the
+        full catalogue from a shell or a server action:
+
+            env["product.product"].search([])._recompute_avco_cost_price()
+        """
+        if not self:
+            return
+        self.env["stock.valuation.layer"].flush_model()
+        # First SVL of each (product, company), the sync goes forward from there
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT ON (product_id, company_id) id
+            FROM stock_valuation_layer
+            WHERE product_id IN %s AND stock_valuation_layer_id IS NULL
+            ORDER BY product_id, company_id, create_date, id
+            """,
+            (tuple(self.ids),),
+        )
+        svl_ids = [row[0] for row in self.env.cr.fetchall()]
+        for svl in self.env["stock.valuation.layer"].sudo().browse(svl_ids):
+            svl.with_company(svl.company_id)._cost_price_avco_sync({})
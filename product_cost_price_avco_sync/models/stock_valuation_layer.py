@@ -3,11 +3,14 @@
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
 import re
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict, defaultdict, deque
 
 from odoo import _, api, exceptions, models
 from odoo.exceptions import ValidationError
-from odoo.tools import float_compare, float_is_zero, float_round, groupby
+from odoo.tools import float_compare, float_is_zero, float_round, groupby, split_every
+
+# number of SVLs updated by one query of the sync
+AVCO_SYNC_UPDATE_SIZE = 1000
 
 
 class StockValuationLayer(models.Model):
@@ -56,6 +59,35 @@ class StockValuationLayer(models.Model):
             .search(domain, order="create_date, id", limit=1)
         )
 
+    def _get_avco_sync_svls(self):
+        """Return all the SVLs of the product and company of self, in the order
+        they are synced, loaded with a single query.
+        """
+        self.ensure_one()
+        return (
+            self.env["stock.valuation.layer"]
+            .sudo()
+            .search(
+                [
+                    ("company_id", "=", self.company_id.id),
+                    ("product_id", "=", self.product_id.id),
+                ],
+                order="create_date, id",
+            )
+        )
+
+    def _pop_next_svl_to_sync_avco(self, svl_dic):
+        """Return the SVL to sync after self, taken from the SVLs preloaded in the
+        sync structure of its product and company.
+        """
+        self.ensure_one()
+        next_svls = svl_dic.get("next_svls")
+        if next_svls is None:
+            return self._get_next_svl_to_sync_avco()
+        if not next_svls:
+            return self.env["stock.valuation.layer"].sudo()
+        return next_svls.popleft()
+
     def _is_avco_sync_processable(self, svls_dic):
         """Method to be overrided in extension modules for blocking the sync in
         specific cases (like manufactured or component products) where we don't still
@@ -151,7 +183,10 @@ class StockValuationLayer(models.Model):
 
     @api.model
     def _flush_all_avco_sync(self, svls_dic, skip_avco_sync=True):
-        """Check if there's something to write and write it in the DB."""
+        """Check if there's something to write and write it in the DB. The SVLs
+        with the same modified fields are updated together by one query.
+        """
+        svls_by_fnames = defaultdict(list)
         for svl, svl_dic in svls_dic.items():
             vals = {}
             for field_name, new_value in svl_dic.items():
@@ -173,24 +208,73 @@ class StockValuationLayer(models.Model):
                         svl[field_name], new_value, precision_digits=prec_digits
                     ):
                         vals[field_name] = new_value
-            # Write modified fields
             if vals:
-                svl.with_context(skip_avco_sync=skip_avco_sync).write(vals)
+                svls_by_fnames[tuple(sorted(vals))].append((svl, vals))
+        # Write modified fields
+        for fnames, svls_vals in svls_by_fnames.items():
+            if skip_avco_sync and all(self._fields[f].column_type for f in fnames):
+                self._update_avco_sync_svls(fnames, svls_vals)
+                continue
+            svls_by_vals = defaultdict(list)
+            for svl, vals in svls_vals:
+                svls_by_vals[tuple(sorted(vals.items()))].append(svl.id)
+            for vals, svl_ids in svls_by_vals.items():
+                svls_vals[0][0].browse(svl_ids).with_context(
+                    skip_avco_sync=skip_avco_sync
+                ).write(dict(vals))
 
-    def _get_previous_svl_info(self):
-        self.ensure_one()
-        previous_svls = self.env["stock.valuation.layer"].search(
-            [
-                ("product_id", "=", self.product_id.id),
-                ("company_id", "=", self.company_id.id),
-                "|",
-                "&",
-                ("create_date", "=", self.create_date),
-                ("id", "<", self.id),
-                ("create_date", "<", self.create_date),
-            ],
-            order="create_date, id",
+    @api.model
+    def _update_avco_sync_svls(self, fnames, svls_vals):
+        """Write the stored fields ``fnames`` of the SVLs with one UPDATE joined to
+        their new values, instead of one write per SVL.
+
+        :param svls_vals: list of (svl, vals) tuples, vals having ``fnames`` as keys
+        """
+        fnames = list(fnames)
+        svls = self.browse([svl.id for svl, _vals in svls_vals])
+        svls.flush_recordset(fnames)
+        row = "(%s, {})".format(
+            ", ".join(f"%s::{self._fields[f].column_type[1]}" for f in fnames)
         )
+        for chunk in split_every(AVCO_SYNC_UPDATE_SIZE, svls_vals):
+            params = [self.env.uid]
+            for svl, vals in chunk:
+                params.append(svl.id)
+                params.extend(
+                    self._fields[f].convert_to_column(vals[f], svl) for f in fnames
+                )
+            # pylint: disable=sql-injection
+            self.env.cr.execute(
+                """
+                UPDATE stock_valuation_layer AS svl
+                SET {sets}, write_uid = %s, write_date = (now() at time zone 'UTC')
+                FROM (VALUES {rows}) AS v(id, {columns})
+                WHERE svl.id = v.id
+                """.format(
+                    sets=", ".join(f'"{f}" = v."{f}"' for f in fnames),
+                    rows=", ".join([row] * len(chunk)),
+                    columns=", ".join(f'"{f}"' for f in fnames),
+                ),
+                params,
+            )
+        svls.invalidate_recordset(fnames + ["write_uid", "write_date"])
+        svls.modified(fnames)
+
+    def _get_previous_svl_info(self, previous_svls=None):
+        self.ensure_one()
+        if previous_svls is None:
+            previous_svls = self.env["stock.valuation.layer"].search(
+                [
+                    ("product_id", "=", self.product_id.id),
+                    ("company_id", "=", self.company_id.id),
+                    "|",
+                    "&",
+                    ("create_date", "=", self.create_date),
+                    ("id", "<", self.id),
+                    ("create_date", "<", self.create_date),
+                ],
+                order="create_date, id",
+            )
         key = (self.product_id, self.company_id)
         svls_dic = OrderedDict()
         svls_dic[key] = {
@@ -215,9 +299,19 @@ class StockValuationLayer(models.Model):
         that is used for AVCO sync main loop.
         """
         self.ensure_one()
-        prev_vals = self._get_previous_svl_info()
+        # The history of the product is loaded once: the SVLs before self give the
+        # starting point and the ones after are the queue to sync.
+        all_svls = self._get_avco_sync_svls()
+        next_svls = None
+        previous_svls = None
+        if self.id in all_svls.ids:
+            index = all_svls.ids.index(self.id)
+            previous_svls = all_svls[:index].with_env(self.env)
+            next_svls = deque(all_svls[index + 1 :])
+        prev_vals = self._get_previous_svl_info(previous_svls=previous_svls)
         return {
             "to_sync": self,
+            "next_svls": next_svls,
             "svls": OrderedDict(),
             "previous_unit_cost": prev_vals[0],
             "previous_qty": prev_vals[1],
@@ -272,7 +366,7 @@ class StockValuationLayer(models.Model):
                     reloop = True
                     break
                 svl._process_avco_sync_one(svls_dic)
-                svl_dic["to_sync"] = svl._get_next_svl_to_sync_avco()
+                svl_dic["to_sync"] = svl._pop_next_svl_to_sync_avco(svl_dic)
                 any_processed = True
             index += 1
             if index >= len(svls_dic) and reloop:
@@ -491,6 +491,21 @@ class TestProductCostPriceAvcoSync(BaseCommon):
             )
         )
 
+    def test_recompute_avco_cost_price(self):
+        """Replay the sync over a history written without it"""
+        picking_in_01, move_in_01 = self.create_picking("IN", 10)
+        picking_in_02, move_in_02 = self.create_picking("IN", 10)
+        picking_out_01, move_out_01 = self.create_picking("OUT", qty=5.0)
+        move_in_01.stock_valuation_layer_ids.with_context(skip_avco_sync=True).write(
+            {"unit_cost": 2.0, "value": 20.0}
+        )
+        self.assertAlmostEqual(move_out_01.stock_valuation_layer_ids.value, -5.0, 2)
+        self.product._recompute_avco_cost_price()
+        self.assertAlmostEqual(move_in_01.stock_valuation_layer_ids.value, 20, 2)
+        self.assertAlmostEqual(move_in_02.stock_valuation_layer_ids.value, 10, 2)
+        self.assertAlmostEqual(move_out_01.stock_valuation_layer_ids.value, -7.5, 2)
+        self.assertAlmostEqual(self.product.standard_price, 1.5, 2)
+
     def print_svl(self, char_info=""):
         msg_list = [f"{char_info}"]
         total_qty = total_value = 0.0
@@ -18,6 +18,7 @@
         "security/ir.model.access.csv",
         "views/sale_order_views.xml",
         "views/sale_workflow_process_views.xml",
+        "views/automatic_workflow_job_unit_views.xml",
         "data/automatic_workflow_data.xml",
     ],
     "installable": True,
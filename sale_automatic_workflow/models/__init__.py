@@ -1,4 +1,5 @@
 from . import account_move
 from . import automatic_workflow_job
+from . import automatic_workflow_job_unit
 from . import sale_order
 from . import sale_workflow_process
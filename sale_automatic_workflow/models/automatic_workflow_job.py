@@ -7,6 +7,7 @@ import logging
 from contextlib import contextmanager
 
 from odoo import api, fields, models
+from odoo.tools import split_every
 from odoo.tools.safe_eval import safe_eval
 
 _logger = logging.getLogger(__name__)
@@ -35,6 +36,41 @@ class AutomaticWorkflowJob(models.Model):
         " invoices, pickings..."
     )
 
+    def _run_in_batches(self, records, batch_method, domain_filter):
+        """Run batch_method on chunks of records of the same company, the size of
+        the chunks being the batch size of the workflow. When a chunk fails, it is
+        rolled back and run again record by record, each one in its own savepoint.
+
+        :return: the records which failed on their own
+        """
+        batch_size = self.env.context.get("auto_workflow_batch_size")
+        failed_records = records.browse()
+        for chunk in split_every(batch_size, records.ids, records.browse):
+            for company in chunk.company_id:
+                company_chunk = chunk.filtered(
+                    lambda r, company=company: r.company_id == company
+                ).with_company(company)
+                try:
+                    with self.env.cr.savepoint():
+                        batch_method(company_chunk, domain_filter)
+                except Exception:
+                    _logger.warning(
+                        "Error during an automatic workflow action on %s, "
+                        "retrying record by record.",
+                        company_chunk,
+                        exc_info=True,
+                    )
+                    for record in company_chunk:
+                        try:
+                            with self.env.cr.savepoint():
+                                batch_method(record, domain_filter)
+                        except Exception:
+                            _logger.exception(
+                                "Error during an automatic workflow action."
+                            )
+                            failed_records |= record
+        return failed_records
+
     def _do_validate_sale_order(self, sale, domain_filter):
         """Validate a sales order, filter ensure no duplication"""
         if not self.env["sale.order"].search_count(
@@ -56,11 +92,27 @@ class AutomaticWorkflowJob(models.Model):
         sale._send_order_confirmation_mail()
         return f"{sale.display_name} {sale} send order confirmation mail successfully"
 
+    def _do_validate_sale_orders(self, sales, domain_filter):
+        """Validate sales orders at once, filter ensure no duplication"""
+        sales = sales.search([("id", "in", sales.ids)] + domain_filter)
+        sales.action_confirm()
+        if self.env.context.get("send_order_confirmation_mail"):
+            sales = sales.filtered(lambda s: s.state == "sale")
+            for user in sales.user_id:
+                sales.filtered(lambda s, user=user: s.user_id == user).with_user(
+                    user
+                )._send_order_confirmation_mail()
+            sales.filtered(lambda s: not s.user_id)._send_order_confirmation_mail()
+        return f"{sales} confirmed successfully"
+
     @api.model
     def _validate_sale_orders(self, order_filter):
         sale_obj = self.env["sale.order"]
         sales = sale_obj.search(order_filter)
         _logger.debug("Sale Orders to validate: %s", sales.ids)
+        if self.env.context.get("auto_workflow_batch_size"):
+            self._run_in_batches(sales, self._do_validate_sale_orders, order_filter)
+            return
         for sale in sales:
             with savepoint(self.env.cr):
                 self._do_validate_sale_order(
@@ -81,11 +133,26 @@ class AutomaticWorkflowJob(models.Model):
         payment.with_context(active_model="sale.order").create_invoices()
         return f"{sale.display_name} {sale} create invoice successfully"
 
+    def _do_create_invoices(self, sales, domain_filter):
+        """Create one invoice per sales order for all of them at once, filter
+        ensure no duplication"""
+        sales = sales.search([("id", "in", sales.ids)] + domain_filter)
+        if not sales:
+            return f"{sales} job bypassed"
+        payment = self.env["sale.advance.payment.inv"].create(
+            {"sale_order_ids": sales.ids, "consolidated_billing": False}
+        )
+        payment.with_context(active_model="sale.order").create_invoices()
+        return f"{sales} create invoice successfully"
+
     @api.model
     def _create_invoices(self, create_filter):
         sale_obj = self.env["sale.order"]
         sales = sale_obj.search(create_filter)
         _logger.debug("Sale Orders to create Invoice: %s", sales.ids)
+        if self.env.context.get("auto_workflow_batch_size"):
+            self._run_in_batches(sales, self._do_create_invoices, create_filter)
+            return
         for sale in sales:
             with savepoint(self.env.cr):
                 self._do_create_invoice(
@@ -101,11 +168,22 @@ class AutomaticWorkflowJob(models.Model):
         invoice.with_company(invoice.company_id).action_post()
         return f"{invoice.display_name} {invoice} validate invoice successfully"
 
+    def _do_validate_invoices(self, invoices, domain_filter):
+        """Validate invoices at once, filter ensure no duplication"""
+        invoices = invoices.search([("id", "in", invoices.ids)] + domain_filter)
+        invoices.action_post()
+        return f"{invoices} validate invoice successfully"
+
     @api.model
     def _validate_invoices(self, validate_invoice_filter):
         move_obj = self.env["account.move"]
         invoices = move_obj.search(validate_invoice_filter)
         _logger.debug("Invoices to validate: %s", invoices.ids)
+        if self.env.context.get("auto_workflow_batch_size"):
+            self._run_in_batches(
+                invoices, self._do_validate_invoices, validate_invoice_filter
+            )
+            return
         for invoice in invoices:
             with savepoint(self.env.cr):
                 self._do_validate_invoice(
@@ -121,10 +199,19 @@ class AutomaticWorkflowJob(models.Model):
         sale.action_lock()
         return f"{sale.display_name} {sale} locked successfully"
 
+    def _do_sales_done(self, sales, domain_filter):
+        """Lock sales orders at once, filter ensure no duplication"""
+        sales = sales.search([("id", "in", sales.ids)] + domain_filter)
+        sales.action_lock()
+        return f"{sales} locked successfully"
+
     @api.model
     def _sale_done(self, sale_done_filter):
         sales = self.env["sale.order"].search(sale_done_filter)
         _logger.debug("Sale Orders to done: %s", sales.ids)
+        if self.env.context.get("auto_workflow_batch_size"):
+            self._run_in_batches(sales, self._do_sales_done, sale_done_filter)
+            return
         for sale in sales:
             with savepoint(self.env.cr):
                 self._do_sale_done(sale.with_company(sale.company_id), sale_done_filter)
@@ -155,17 +242,35 @@ class AutomaticWorkflowJob(models.Model):
         invoice_obj = self.env["account.move"]
         invoices = invoice_obj.search(payment_filter)
         _logger.debug("Invoices to Register Payment: %s", invoices.ids)
+        if self.env.context.get("auto_workflow_batch_size"):
+            self._run_in_batches(
+                invoices, self._register_payment_invoices, payment_filter
+            )
+            return
         for invoice in invoices:
             with savepoint(self.env.cr):
                 self._register_payment_invoice(invoice)
         return
 
+    def _register_payment_invoices(self, invoices, domain_filter=None):
+        """Create, post and reconcile the payments of the invoices at once"""
+        payments = self.env["account.payment"].create(
+            [self._prepare_dict_account_payment(invoice) for invoice in invoices]
+        )
+        payments.action_post()
+        for payment, invoice in zip(payments, invoices, strict=True):
+            self._reconcile_payment_invoice(payment, invoice)
+        return payments
+
     def _register_payment_invoice(self, invoice):
         payment = self.env["account.payment"].create(
             self._prepare_dict_account_payment(invoice)
         )
         payment.action_post()
+        self._reconcile_payment_invoice(payment, invoice)
+        return payment
 
+    def _reconcile_payment_invoice(self, payment, invoice):
         domain = [
             ("account_type", "in", ("asset_receivable", "liability_payable")),
             ("reconciled", "=", False),
@@ -176,12 +281,73 @@ class AutomaticWorkflowJob(models.Model):
             (payment_lines + lines).filtered_domain(
                 [("account_id", "=", account.id), ("reconciled", "=", False)]
             ).reconcile()
-        return payment
 
     @api.model
     def _handle_pickings(self, sale_workflow):
         pass
 
+    @api.model
+    def _get_workflow_steps(self, sale_workflow):
+        """Enabled steps of the workflow run through job units, in their order.
+
+        :return: list of (step, model name, domain of the records to process)
+        """
+        workflow_domain = [("workflow_process_id", "=", sale_workflow.id)]
+        steps = []
+        if sale_workflow.validate_order:
+            steps.append(
+                (
+                    "validate_order",
+                    "sale.order",
+                    safe_eval(sale_workflow.order_filter_id.domain) + workflow_domain,
+                )
+            )
+        if sale_workflow.create_invoice:
+            steps.append(
+                (
+                    "create_invoice",
+                    "sale.order",
+                    safe_eval(sale_workflow.create_invoice_filter_id.domain)
+                    + workflow_domain,
+                )
+            )
+        if sale_workflow.validate_invoice:
+            steps.append(
+                (
+                    "validate_invoice",
+                    "account.move",
+                    safe_eval(sale_workflow.validate_invoice_filter_id.domain)
+                    + workflow_domain,
+                )
+            )
+        if sale_workflow.sale_done:
+            steps.append(
+                (
+                    "sale_done",
+                    "sale.order",
+                    safe_eval(sale_workflow.sale_done_filter_id.domain)
+                    + workflow_domain,
+                )
+            )
+        if sale_workflow.register_payment:
+            steps.append(
+                (
+                    "register_payment",
+                    "account.move",
+                    safe_eval(sale_workflow.payment_filter_id.domain) + workflow_domain,
+                )
+            )
+        return steps
+
+    def _get_step_batch_method(self, step):
+        return {
+            "validate_order": self._do_validate_sale_orders,
+            "create_invoice": self._do_create_invoices,
+            "validate_invoice": self._do_validate_invoices,
+            "sale_done": self._do_sales_done,
+            "register_payment": self._register_payment_invoices,
+        }[step]
+
     @api.model
     def run_with_workflow(self, sale_workflow):
         workflow_domain = [("workflow_process_id", "=", sale_workflow.id)]
@@ -217,5 +383,11 @@ class AutomaticWorkflowJob(models.Model):
         """Must be called from ir.cron"""
         sale_workflow_process = self.env["sale.workflow.process"]
         for sale_workflow in sale_workflow_process.search([]):
-            self.run_with_workflow(sale_workflow)
+            job = self.with_context(auto_workflow_batch_size=sale_workflow.batch_size)
+            if sale_workflow.split_jobs:
+                # the pickings are handled by the modules extending the job
+                job._handle_pickings(sale_workflow)
+                self.env["automatic.workflow.job.unit"].enqueue_workflow(sale_workflow)
+            else:
+                job.run_with_workflow(sale_workflow)
         return True
@@ -0,0 +1,167 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+from collections import defaultdict
+
+from odoo import api, fields, models
+from odoo.tools import SQL, split_every
+
+_logger = logging.getLogger(__name__)
+
+# number of records of a unit when the workflow has no batch size
+AUTOMATIC_WORKFLOW_UNIT_SIZE = 100
+
+
+class AutomaticWorkflowJobUnit(models.Model):
+    """A step of an automatic workflow on a chunk of records, queued to be
+    processed and committed on its own by the workers of the units cron."""
+
+    _name = "automatic.workflow.job.unit"
+    _description = "Automatic Workflow Job Unit"
+    _order = "id"
+
+    workflow_process_id = fields.Many2one(
+        comodel_name="sale.workflow.process",
+        string="Automatic Workflow",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    step = fields.Selection(
+        selection=[
+            ("validate_order", "Validate Order"),
+            ("create_invoice", "Create Invoice"),
+            ("validate_invoice", "Validate Invoice"),
+            ("sale_done", "Sale Done"),
+            ("register_payment", "Register Payment"),
+        ],
+        required=True,
+        readonly=True,
+    )
+    res_ids = fields.Json(string="Record IDs", readonly=True)
+    state = fields.Selection(
+        selection=[("pending", "Pending"), ("done", "Done"), ("failed", "Failed")],
+        default="pending",
+        required=True,
+        readonly=True,
+        index=True,
+    )
+    error = fields.Text(readonly=True)
+
+    @api.model
+    def enqueue_workflow(self, sale_workflow):
+        """Queue one unit per step and chunk of records to process, leaving
+        out the records already waiting in a unit of the same step or held by a
+        failed one, which are processed again through its retry."""
+        job = self.env["automatic.workflow.job"]
+        unit_size = sale_workflow.batch_size or AUTOMATIC_WORKFLOW_UNIT_SIZE
+        queued_ids = defaultdict(set)
+        for unit in self.search(
+            [
+                ("workflow_process_id", "=", sale_workflow.id),
+                ("state", "in", ("pending", "failed")),
+            ]
+        ):
+            queued_ids[unit.step].update(unit.res_ids)
+        vals_list = []
+        for step, model, domain in job._get_workflow_steps(sale_workflow):
+            res_ids = [
+                res_id
+                for res_id in self.env[model].search(domain).ids
+                if res_id not in queued_ids[step]
+            ]
+            for chunk in split_every(unit_size, res_ids):
+                vals_list.append(
+                    {
+                        "workflow_process_id": sale_workflow.id,
+                        "step": step,
+                        "res_ids": list(chunk),
+                    }
+                )
+        units = self.create(vals_list)
+        if units:
+            self.env.ref(
+                "sale_automatic_workflow.ir_cron_automatic_workflow_job_unit"
+            )._trigger()
+        return units
+
+    @api.model
+    def _cron_process_units(self):
+        """Process the pending units one by one, each in its own transaction.
+        The rows are locked with SKIP LOCKED so several workers can drain the
+        queue at the same time without processing a unit twice."""
+        while True:
+            self.env.cr.execute(
+                """
+                SELECT id FROM automatic_workflow_job_unit
+                WHERE state = 'pending'
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+                """
+            )
+            row = self.env.cr.fetchone()
+            if not row:
+                break
+            self.browse(row[0])._process_unit()
+            self.env.cr.commit()
+
+    def _process_unit(self):
+        self.ensure_one()
+        sale_workflow = self.workflow_process_id
+        job = self.env["automatic.workflow.job"].with_context(
+            auto_workflow_batch_size=len(self.res_ids),
+            send_order_confirmation_mail=sale_workflow.send_order_confirmation_mail,
+        )
+        steps = {
+            step: (model, domain)
+            for step, model, domain in job._get_workflow_steps(sale_workflow)
+        }
+        # the step may have been disabled on the workflow since it was queued
+        if self.step in steps:
+            model, domain = steps[self.step]
+            # lock the records so a unit holding the same ones in another worker
+            # skips them, those locked already are left to that worker
+            self.env.cr.execute(
+                SQL(
+                    "SELECT id FROM %s WHERE id = ANY(%s) FOR UPDATE SKIP LOCKED",
+                    SQL.identifier(self.env[model]._table),
+                    self.res_ids,
+                )
+            )
+            locked_ids = [row[0] for row in self.env.cr.fetchall()]
+            # the records processed since they were queued, by another unit or
+            # by hand, do not match the domain of the step anymore
+            records = self.env[model].search([("id", "in", locked_ids)] + domain)
+            try:
+                with self.env.cr.savepoint():
+                    failed_records = job._run_in_batches(
+                        records, job._get_step_batch_method(self.step), domain
+                    )
+            except Exception as e:
+                _logger.exception("Automatic workflow job unit %s failed", self.id)
+                self.write({"state": "failed", "error": str(e)})
+                return
+            if failed_records:
+                self.write(
+                    {
+                        "state": "failed",
+                        "error": "Failed on %s"
+                        % ", ".join(failed_records.mapped("display_name")),
+                    }
+                )
+                return
+        self.write({"state": "done", "error": False})
+
+    def action_retry(self):
+        self.filtered(lambda u: u.state == "failed").write(
+            {"state": "pending", "error": False}
+        )
+        self.env.ref(
+            "sale_automatic_workflow.ir_cron_automatic_workflow_job_unit"
+        )._trigger()
+
+    @api.autovacuum
+    def _gc_done_units(self):
+        limit_date = fields.Datetime.subtract(fields.Datetime.now(), days=7)
+        self.search([("state", "=", "done"), ("write_date", "<", limit_date)]).unlink()
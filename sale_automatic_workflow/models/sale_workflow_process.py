@@ -114,6 +114,18 @@ class SaleWorkflowProcess(models.Model):
         ),
     )
     register_payment = fields.Boolean()
+    batch_size = fields.Integer(
+        help="Number of records processed together by each automatic action. "
+        "When a batch fails, its records are processed again one by one. "
+        "Leave empty to process the records one by one.",
+    )
+    split_jobs = fields.Boolean(
+        string="Split Into Job Units",
+        help="Queue each step of the workflow on chunks of records instead of "
+        "running it in the scheduled action. Each chunk is then processed and "
+        "committed on its own by the job units scheduled action, which can run "
+        "in several workers at the same time.",
+    )
     payment_filter_domain = fields.Text(
         related="payment_filter_id.domain",
     )
@@ -5,6 +5,7 @@ from datetime import timedelta
 from unittest import mock
 
 from odoo import fields
+from odoo.exceptions import UserError
 from odoo.tests import tagged
 
 from .common import TestAutomaticWorkflowMixin, TestCommon
@@ -225,3 +226,112 @@ class TestAutomaticWorkflow(TestCommon, TestAutomaticWorkflowMixin):
         self.run_job()
         payment = self.env["account.payment"].search([], limit=1, order="id desc")
         self.assertEqual(payment.journal_id, payment_journal)
+
+    def test_batch_full_automatic(self):
+        workflow = self.create_full_automatic(
+            override={"batch_size": 2, "register_payment": True}
+        )
+        sale = self.create_sale_order(workflow)
+        sales = sale
+        for _i in range(2):
+            sales |= self.create_sale_order(
+                workflow, override={"partner_id": sale.partner_id.id}
+            )
+        self.run_job()
+        for sale in sales:
+            self.assertEqual(sale.state, "sale")
+            # one invoice per order, even for the same customer
+            self.assertEqual(len(sale.invoice_ids), 1)
+            self.assertEqual(sale.invoice_ids.state, "posted")
+            self.assertIn(sale.invoice_ids.payment_state, ("paid", "in_payment"))
+
+    def test_batch_fallback(self):
+        workflow = self.create_full_automatic(override={"batch_size": 10})
+        sale = self.create_sale_order(workflow)
+        failing_sale = self.create_sale_order(workflow)
+        sale_class = type(self.env["sale.order"])
+        action_confirm = sale_class._action_confirm
+
+        def _action_confirm(orders):
+            if failing_sale in orders:
+                raise UserError("Confirmation failed")
+            return action_confirm(orders)
+
+        with mock.patch.object(sale_class, "_action_confirm", _action_confirm):
+            self.run_job()
+        self.assertEqual(sale.state, "sale")
+        self.assertEqual(sale.invoice_ids.state, "posted")
+        self.assertEqual(failing_sale.state, "draft")
+        self.assertFalse(failing_sale.invoice_ids)
+
+    def test_split_jobs(self):
+        workflow = self.create_full_automatic(
+            override={"split_jobs": True, "batch_size": 1}
+        )
+        sales = self.create_sale_order(workflow) | self.create_sale_order(workflow)
+        unit_model = self.env["automatic.workflow.job.unit"]
+        self.run_job()
+        units = unit_model.search([("workflow_process_id", "=", workflow.id)])
+        self.assertEqual(len(units), 2)
+        self.assertEqual(set(units.mapped("step")), {"validate_order"})
+        self.assertEqual(sorted(sum(units.mapped("res_ids"), [])), sorted(sales.ids))
+        self.assertEqual(set(sales.mapped("state")), {"draft"})
+        # the orders waiting in a unit are not queued again
+        self.run_job()
+        self.assertEqual(
+            unit_model.search_count([("workflow_process_id", "=", workflow.id)]), 2
+        )
+        for unit in units:
+            unit._process_unit()
+        self.assertEqual(set(units.mapped("state")), {"done"})
+        self.assertEqual(set(sales.mapped("state")), {"sale"})
+        # the next steps are queued once the orders are confirmed
+        self.run_job()
+        units = unit_model.search(
+            [("workflow_process_id", "=", workflow.id), ("state", "=", "pending")]
+        )
+        self.assertEqual(set(units.mapped("step")), {"create_invoice"})
+        for unit in units:
+            unit._process_unit()
+        self.assertEqual(len(sales.invoice_ids), 2)
+
+    def test_split_jobs_failure(self):
+        workflow = self.create_full_automatic(
+            override={"split_jobs": True, "batch_size": 10}
+        )
+        sale = self.create_sale_order(workflow)
+        failing_sale = self.create_sale_order(workflow)
+        sale_class = type(self.env["sale.order"])
+        action_confirm = sale_class._action_confirm
+
+        def _action_confirm(orders):
+            if failing_sale in orders:
+                raise UserError("Confirmation failed")
+            return action_confirm(orders)
+
+        self.run_job()
+        unit = self.env["automatic.workflow.job.unit"].search(
+            [("workflow_process_id", "=", workflow.id)]
+        )
+        with mock.patch.object(sale_class, "_action_confirm", _action_confirm):
+            unit._process_unit()
+        self.assertEqual(unit.state, "failed")
+        self.assertIn(failing_sale.display_name, unit.error)
+        self.assertEqual(sale.state, "sale")
+        self.assertEqual(failing_sale.state, "draft")
+        # the order held by the failed unit is not queued again
+        self.run_job()
+        self.assertEqual(
+            self.env["automatic.workflow.job.unit"].search_count(
+                [
+                    ("workflow_process_id", "=", workflow.id),
+                    ("step", "=", "validate_order"),
+                ]
+            ),
+            1,
+        )
+        # on retry, the order already confirmed is left out
+        unit.action_retry()
+        unit._process_unit()
+        self.assertEqual(unit.state, "done")
+        self.assertEqual(failing_sale.state, "sale")
@@ -23,7 +23,14 @@ def post_load_hook():
         new_standard_price = 0
         tmp_value = 0  # to accumulate the value taken on the candidates
         taken_data = {}
+        # Remaining totals of the candidates, kept up to date while consuming
+        quantity_svl = value_svl = 0
         for candidate in candidates:
+            quantity_svl += candidate.remaining_qty
+            value_svl += candidate.remaining_value
+        # Candidate updates, written by groups of identical values at the end
+        candidate_updates = []
+        for index, candidate in enumerate(candidates):
             qty_taken_on_candidate = self._get_qty_taken_on_candidate(
                 qty_to_take_on_candidates, candidate
             )
@@ -52,7 +59,18 @@ def post_load_hook():
                 candidate_vals,
             )
             # End Hook Prepare Candidate
-            candidate.write(candidate_vals)
+            if candidate_updates and candidate_updates[-1][0] == candidate_vals:
+                candidate_updates[-1][1].append(candidate.id)
+            else:
+                candidate_updates.append((candidate_vals, [candidate.id]))
+            candidate_remaining_qty = candidate_vals.get(
+                "remaining_qty", candidate.remaining_qty
+            )
+            quantity_svl += candidate_remaining_qty - candidate.remaining_qty
+            value_svl += (
+                candidate_vals.get("remaining_value", candidate.remaining_value)
+                - candidate.remaining_value
+            )
 
             qty_to_take_on_candidates -= qty_taken_on_candidate
             tmp_value += value_taken_on_candidate
@@ -60,9 +78,10 @@ def post_load_hook():
                 qty_to_take_on_candidates, precision_rounding=self.uom_id.rounding
             ):
                 if float_is_zero(
-                    candidate.remaining_qty, precision_rounding=self.uom_id.rounding
+                    candidate_remaining_qty, precision_rounding=self.uom_id.rounding
                 ):
-                    next_candidates = candidates.filtered(
+                    # the candidates before this one are all consumed
+                    next_candidates = candidates[index + 1 :].filtered(
                         lambda svl: svl.remaining_qty > 0
                     )
                     new_standard_price = (
@@ -71,6 +90,8 @@ def post_load_hook():
                         or new_standard_price
                     )
                 break
+        for candidate_vals, candidate_ids in candidate_updates:
+            candidates.browse(candidate_ids).write(candidate_vals)
 
         # Fifo out will change the AVCO value of the product. So in case of out,
         # we recompute it base on the remaining value and quantities.
@@ -80,8 +101,6 @@ def post_load_hook():
             and self._price_updateable(new_standard_price)
         ):
             # END HOOK update standard price
-            quantity_svl = sum(candidates.mapped("remaining_qty"))
-            value_svl = sum(candidates.mapped("remaining_value"))
             product = (
                 self.sudo().with_company(company.id).with_context(disable_auto_svl=True)
             )
@@ -2,6 +2,8 @@
 # @author Jordi Ballester <jordi.ballester@forgeflow.com>
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
+from collections import defaultdict
+
 from odoo import api, fields, models
 from odoo.tools import float_is_zero
 
@@ -62,78 +64,126 @@ class StockValuationLayer(models.Model):
             rec.usage_quantity = sum(rec.usage_ids.mapped("quantity"))
             rec.usage_value = sum(rec.usage_ids.mapped("value"))
 
+    def _prepare_usage_vals(self, taken_data, rec):
+        return [
+            {
+                "stock_valuation_layer_id": origin_layer_id,
+                "dest_stock_valuation_layer_id": rec.id,
+                "stock_move_id": rec.stock_move_id.id,
+                "quantity": origin_data.get("quantity", 0.0),
+                "value": origin_data.get("value", 0.0),
+                "company_id": rec.company_id.id,
+            }
+            for origin_layer_id, origin_data in taken_data.items()
+        ]
+
     def _process_taken_data(self, taken_data, rec):
-        usage_model = self.env["stock.valuation.layer.usage"]
-        for origin_layer_id in taken_data.keys():
-            usage_model.create(
+        self.env["stock.valuation.layer.usage"].create(
+            self._prepare_usage_vals(taken_data, rec)
+        )
+        return True
+
+    def _get_return_output_layers(self):
+        """Output layers of the moves the moves of the layers in self come from,
+        directly or not, resolved for all the layers at once.
+
+        :return: dict {layer id: output layers ordered by creation}
+        """
+        if not self:
+            return {}
+        self.flush_model(["stock_move_id", "quantity", "create_date"])
+        self.env["stock.move"].flush_model(["move_orig_ids"])
+        self.env.cr.execute(
+            """
+            WITH RECURSIVE parent_move(layer_id, move_id) AS (
+                SELECT svl.id, rel.move_orig_id
+                FROM stock_valuation_layer svl
+                JOIN stock_move_move_rel rel ON rel.move_dest_id = svl.stock_move_id
+                WHERE svl.id IN %s
+                UNION
+                SELECT parent_move.layer_id, rel.move_orig_id
+                FROM parent_move
+                JOIN stock_move_move_rel rel
+                    ON rel.move_dest_id = parent_move.move_id
+            )
+            SELECT parent_move.layer_id, svl.id
+            FROM parent_move
+            JOIN stock_valuation_layer svl ON svl.stock_move_id = parent_move.move_id
+            WHERE svl.quantity < 0
+            ORDER BY parent_move.layer_id, svl.create_date, svl.id
+            """,
+            (tuple(self.ids),),
+        )
+        rows = self.env.cr.fetchall()
+        prefetch_ids = {row[1] for row in rows}
+        output_layer_ids = defaultdict(list)
+        for layer_id, output_layer_id in rows:
+            output_layer_ids[layer_id].append(output_layer_id)
+        return {
+            layer.id: self.browse(output_layer_ids[layer.id]).with_prefetch(
+                prefetch_ids
+            )
+            for layer in self
+        }
+
+    def _get_return_taken_data(self, output_layers):
+        """Take the quantity of the layer on the given output layers"""
+        self.ensure_one()
+        taken_data = {}
+        qty_to_take_on_candidates = self.quantity
+        for candidate in output_layers:
+            qty_taken_on_candidate = min(
+                qty_to_take_on_candidates, abs(candidate.quantity)
+            )
+            taken_data[candidate.id] = {"quantity": qty_taken_on_candidate}
+            candidate_unit_cost = abs(candidate.value) / abs(candidate.quantity)
+            value_taken_on_candidate = qty_taken_on_candidate * candidate_unit_cost
+            value_taken_on_candidate = candidate.currency_id.round(
+                value_taken_on_candidate
+            )
+            taken_data[candidate.id].update(
                 {
-                    "stock_valuation_layer_id": origin_layer_id,
-                    "dest_stock_valuation_layer_id": rec.id,
-                    "stock_move_id": rec.stock_move_id.id,
-                    "quantity": taken_data.get(origin_layer_id).get("quantity", 0.0),
-                    "value": taken_data.get(origin_layer_id).get("value", 0.0),
-                    "company_id": rec.company_id.id,
+                    "value": value_taken_on_candidate,
                 }
             )
-        return True
+            qty_to_take_on_candidates -= qty_taken_on_candidate
+            if float_is_zero(
+                qty_to_take_on_candidates,
+                precision_rounding=self.uom_id.rounding,
+            ):
+                break
+        return taken_data
 
     @api.model_create_multi
     def create(self, values):
-        recs = self.browse()
-        for val in values:
-            rec = super().create([val])
-            taken_data = rec.env.context.get("taken_data", [{}])[0]
-            # There are cases in which the transformation
-            # comes from a return process,
-            # such as sales returns or production unbuilds.
-            # To maintain traceability,
-            # the initial output layers are added as origin.
-            if not taken_data and rec.quantity > 0:
-                all_parents = self.env["stock.move"]
-                next_parents = rec.stock_move_id.move_orig_ids.filtered(
-                    lambda m, all_parents=all_parents: m not in all_parents
-                )
-                while next_parents:
-                    all_parents |= next_parents
-                    next_parents = next_parents.mapped("move_orig_ids").filtered(
-                        lambda m, all_parents=all_parents: m not in all_parents
-                    )
-                if all_parents:
-                    output_layers = self.search(
-                        [
-                            ("stock_move_id", "in", all_parents.ids),
-                            ("quantity", "<", 0),
-                        ],
-                        order="create_date",
-                    )
-                    qty_to_take_on_candidates = rec.quantity
-                    for candidate in output_layers:
-                        qty_taken_on_candidate = min(
-                            qty_to_take_on_candidates, abs(candidate.quantity)
-                        )
-                        taken_data[candidate.id] = {"quantity": qty_taken_on_candidate}
-                        candidate_unit_cost = abs(candidate.value) / abs(
-                            candidate.quantity
-                        )
-                        value_taken_on_candidate = (
-                            qty_taken_on_candidate * candidate_unit_cost
-                        )
-                        value_taken_on_candidate = candidate.currency_id.round(
-                            value_taken_on_candidate
-                        )
-                        taken_data[candidate.id].update(
-                            {
-                                "value": value_taken_on_candidate,
-                            }
-                        )
-                        qty_to_take_on_candidates -= qty_taken_on_candidate
-                        if float_is_zero(
-                            qty_to_take_on_candidates,
-                            precision_rounding=rec.uom_id.rounding,
-                        ):
-                            break
-            self._process_taken_data(taken_data, rec)
-            recs |= rec
+        recs = super().create(values)
+        # one taken data per created layer, passed by the create of
+        # stock_account_product_run_fifo_hook in the context of the records
+        taken_data_list = recs.env.context.get("taken_data") or []
+        taken_data_by_rec = {}
+        for index, rec in enumerate(recs):
+            taken_data_by_rec[rec] = (
+                taken_data_list[index] if index < len(taken_data_list) else {}
+            )
+        # There are cases in which the transformation
+        # comes from a return process,
+        # such as sales returns or production unbuilds.
+        # To maintain traceability,
+        # the initial output layers are added as origin.
+        returned_recs = recs.filtered(
+            lambda rec: not taken_data_by_rec[rec]
+            and rec.quantity > 0
+            and rec.stock_move_id.move_orig_ids
+        )
+        output_layers_by_rec = returned_recs._get_return_output_layers()
+        for rec in returned_recs:
+            taken_data_by_rec[rec] = rec._get_return_taken_data(
+                output_layers_by_rec[rec.id]
+            )
+        usage_vals_list = []
+        for rec in recs:
+            usage_vals_list += self._prepare_usage_vals(taken_data_by_rec[rec], rec)
+        self.env["stock.valuation.layer.usage"].create(usage_vals_list)
         return recs
 
     def write(self, values):
@@ -354,3 +354,84 @@ class TestStockValuationLayerUsage(TransactionCase):
         self.assertEqual(
             out_layer.incoming_usage_ids.stock_valuation_layer_id, in_layer
         )
+
+    def test_04_return_traceability(self):
+        """Returned quantities are traced back to the delivered layers"""
+        in_picking = self._create_receipt(self.product, 5.0)
+        self._do_picking(in_picking, fields.Datetime.now(), 5.0)
+        out_picking = self._create_delivery(self.product, 3.0)
+        self._do_picking(out_picking, fields.Datetime.now(), 3.0)
+        out_move = out_picking.move_ids
+        out_layer = out_move.stock_valuation_layer_ids
+        # Return in two steps, the second one chained after the first one
+        return_moves = self.env["stock.move"]
+        for location, dest_location in (
+            (self.stock_location_customer_id, self.stock_location_supplier_id),
+            (self.stock_location_supplier_id, self.stock_location_id),
+        ):
+            return_moves |= self.env["stock.move"].create(
+                {
+                    "name": self.product.name,
+                    "product_id": self.product.id,
+                    "product_uom": self.product.uom_id.id,
+                    "product_uom_qty": 2.0,
+                    "location_id": location.id,
+                    "location_dest_id": dest_location.id,
+                    "move_orig_ids": [(4, (return_moves or out_move)[-1:].id)],
+                }
+            )
+        for return_move in return_moves:
+            return_move._action_confirm()
+            return_move.quantity = 2.0
+            return_move.picked = True
+            return_move._action_done()
+        in_layer = return_moves[1].stock_valuation_layer_ids
+        self.assertEqual(len(in_layer), 1)
+        layer_usage = in_layer.incoming_usage_ids
+        self.assertEqual(len(layer_usage), 1)
+        self.assertEqual(layer_usage.stock_valuation_layer_id, out_layer)
+        self.assertEqual(layer_usage.quantity, 2.0)
+        self.assertEqual(layer_usage.value, 20.0)
+
+    def test_05_delivery_of_several_moves(self):
+        """Layers created together each trace their own FIFO candidates"""
+        in_layers = self.layer_model
+        for _i in range(2):
+            in_picking = self._create_receipt(self.product, 1.0)
+            self._do_picking(in_picking, fields.Datetime.now(), 1.0)
+            in_layers |= in_picking.move_ids.stock_valuation_layer_ids
+        out_picking = self._create_delivery(self.product, 1.0)
+        out_picking.write(
+            {
+                "move_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": self.product.name,
+                            "product_id": self.product.id,
+                            "product_uom": self.product.uom_id.id,
+                            "product_uom_qty": 1.0,
+                            "location_id": self.stock_location_id.id,
+                            "location_dest_id": self.stock_location_customer_id.id,
+                        },
+                    )
+                ]
+            }
+        )
+        out_picking.action_confirm()
+        out_picking.action_assign()
+        out_picking.move_ids.quantity = 1.0
+        out_picking.button_validate()
+        out_moves = out_picking.move_ids.sorted("id")
+        self.assertEqual(len(out_moves), 2)
+        for out_move, in_layer in zip(out_moves, in_layers.sorted("id"), strict=True):
+            layer_usage = out_move.layer_usage_ids
+            self.assertEqual(len(layer_usage), 1)
+            self.assertEqual(layer_usage.stock_valuation_layer_id, in_layer)
+            self.assertEqual(
+                layer_usage.dest_stock_valuation_layer_id,
+                out_move.stock_valuation_layer_ids,
+            )
+            self.assertEqual(layer_usage.quantity, 1.0)
+            self.assertEqual(layer_usage.value, 10.0)